@@ -0,0 +1,155 @@
+# app/core/analyte_catalog.py
+"""
+Catálogo de analitos: nombre canónico, sinónimos (incluidas erratas típicas
+del OCR), código, grupo y unidad habitual.
+
+Se carga una vez desde app/data/analyte_catalog.json (más un archivo extra
+opcional, OCR_ANALYTE_CATALOG_EXTRA) y se indexa por una clave normalizada
+(mayúsculas, sin tildes, solo letras/dígitos/#/%), así que "G. Rojos",
+"Globulos  rojos" o "EOSINOF ILOS" se resuelven con un acceso a dict. Lo que
+no está en el índice pasa por RapidFuzz contra todas las claves; el resultado
+se cachea por nombre normalizado (los mismos nombres se repiten en cada reporte).
+
+La coincidencia aproximada solo corrige erratas: si el nombre leído tiene
+palabras que el candidato no tiene, o al revés ("HEMOGLOBINA A1C" frente a
+"HEMOGLOBINA", "PROTEINAS" frente a "PROTEINAS TOTALES"), no se acepta.
+"""
+import hashlib
+import json
+import re
+import unicodedata
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from rapidfuzz import fuzz, process
+
+from app.core.config import settings
+
+DEFAULT_CATALOG_FILE = Path(__file__).resolve().parent.parent / "data" / "analyte_catalog.json"
+
+# Claves más cortas se resuelven solo por coincidencia exacta (VCM/HCM difieren en una letra)
+MIN_FUZZY_KEY_LEN = 5
+# El mejor candidato debe ganarle al segundo (de otro analito) por este margen
+FUZZY_MARGIN = 4.0
+# Puntuación mínima para que dos palabras cuenten como la misma con erratas
+TOKEN_MATCH_MIN = 80.0
+# Palabras más cortas solo cuentan si aparecen tal cual ("T" de "PROTEINAS T")
+MIN_SUBSTRING_TOKEN_LEN = 3
+
+_KEY_DROP_RE = re.compile(r"[^A-Z0-9#%]")
+
+
+def analyte_key(name: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", name.upper())
+    no_accents = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return _KEY_DROP_RE.sub("", no_accents)
+
+
+def analyte_tokens(name: str) -> Tuple[str, ...]:
+    """Palabras del nombre normalizadas como `analyte_key`; unidas dan la clave."""
+    return tuple(t for t in (analyte_key(w) for w in re.split(r"[\s\-/.,:()]+", name)) if t)
+
+
+def _extra_tokens(tokens: Tuple[str, ...], other_tokens: Tuple[str, ...], other_key: str) -> bool:
+    """¿Alguna palabra de `tokens` falta en el otro nombre (ni igual, ni con erratas, ni pegada)?"""
+    for tok in tokens:
+        if tok in other_tokens:
+            continue
+        # OCR que parte o pega palabras: "EOSINOF ILOS"
+        if len(tok) >= MIN_SUBSTRING_TOKEN_LEN and tok in other_key:
+            continue
+        if any(fuzz.ratio(tok, o) >= TOKEN_MATCH_MIN for o in other_tokens):
+            continue
+        return True
+    return False
+
+
+@dataclass(frozen=True)
+class Analyte:
+    code: str
+    name: str
+    group: Optional[str] = None
+    unit: Optional[str] = None
+
+
+class AnalyteCatalog:
+    def __init__(self, entries: List[dict], fuzzy_cutoff: float, cache_size: int = 4096):
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self._by_key: Dict[str, Analyte] = {}
+        self._tokens: Dict[str, Tuple[str, ...]] = {}
+        for entry in entries:
+            analyte = Analyte(
+                code=entry["code"],
+                name=entry["name"],
+                group=entry.get("group"),
+                unit=entry.get("unit"),
+            )
+            for alias in [analyte.name, analyte.code, *entry.get("synonyms", [])]:
+                key = analyte_key(alias)
+                self._tokens.setdefault(key, analyte_tokens(alias))
+                other = self._by_key.setdefault(key, analyte)
+                if other is not analyte and other.code != analyte.code:
+                    print(f"[Catálogo] '{alias}' ya apunta a {other.code}; se ignora para {analyte.code}")
+        self._keys = list(self._by_key)
+        self._resolve_tokens = lru_cache(maxsize=cache_size)(self._resolve_tokens_uncached)
+        self._top_k = lru_cache(maxsize=cache_size)(self._top_k_uncached)
+
+    def __len__(self) -> int:
+        return len(self._by_key)
+
+    def _top_k_uncached(self, key: str, k: int) -> Tuple[Tuple[Analyte, float, str], ...]:
+        # Se piden más claves que k: varias pueden ser sinónimos del mismo analito
+        matches = process.extract(key, self._keys, scorer=fuzz.ratio, limit=k * 4)
+        out: List[Tuple[Analyte, float, str]] = []
+        for choice, score, _ in matches:
+            analyte = self._by_key[choice]
+            if all(a is not analyte for a, _, _ in out):
+                out.append((analyte, score, choice))
+            if len(out) == k:
+                break
+        return tuple(out)
+
+    def top_k(self, name: str, k: int = 3) -> List[Tuple[Analyte, float]]:
+        """Los k analitos más parecidos (distintos) con su puntuación 0-100."""
+        key = analyte_key(name)
+        return [(analyte, score) for analyte, score, _ in self._top_k(key, k)] if key else []
+
+    def _resolve_tokens_uncached(self, tokens: Tuple[str, ...]) -> Optional[Analyte]:
+        key = "".join(tokens)
+        analyte = self._by_key.get(key)
+        if analyte is not None or len(key) < MIN_FUZZY_KEY_LEN:
+            return analyte
+        candidates = self._top_k(key, 2)
+        if not candidates or candidates[0][1] < self.fuzzy_cutoff:
+            return None
+        # Ambiguo (p. ej. "COLESTEROL HOL": HDL o LDL): mejor no adivinar
+        if len(candidates) > 1 and candidates[0][1] - candidates[1][1] < FUZZY_MARGIN:
+            return None
+        best, _, best_key = candidates[0]
+        # Otro analito con nombre parecido ("COLESTEROL NO HDL" no es HDL): sin palabras de más ni de menos
+        best_tokens = self._tokens[best_key]
+        if _extra_tokens(tokens, best_tokens, best_key) or _extra_tokens(best_tokens, tokens, key):
+            return None
+        return best
+
+    def resolve(self, name: str) -> Optional[Analyte]:
+        """Analito del catálogo para un nombre leído del reporte, o None."""
+        tokens = analyte_tokens(name)
+        return self._resolve_tokens(tokens) if tokens else None
+
+
+def load_catalog(extra_file: Optional[str] = None) -> tuple[AnalyteCatalog, str]:
+    """Catálogo indexado + huella de los archivos (entra en la versión de la caché de OCR)."""
+    entries: List[dict] = []
+    digest = hashlib.sha256()
+    # El archivo extra va primero: sus sinónimos tienen prioridad sobre los por defecto
+    for path in filter(None, [extra_file, DEFAULT_CATALOG_FILE]):
+        raw = Path(path).read_bytes()
+        digest.update(raw)
+        entries.extend(json.loads(raw.decode("utf-8"))["analytes"])
+    return AnalyteCatalog(entries, fuzzy_cutoff=settings.OCR_ANALYTE_FUZZY_CUTOFF), digest.hexdigest()[:12]
+
+
+analyte_catalog, CATALOG_VERSION = load_catalog(settings.OCR_ANALYTE_CATALOG_EXTRA)
@@ -25,6 +25,89 @@ class Settings(BaseSettings):
     OCR_LANG: str = "spa+eng"
     POPPLER_PATH: str | None = None
 
+    # Motores de OCR (ver app.core.ocr_engines); se puede elegir por petición
+    OCR_DEFAULT_ENGINE: str = "doctr"  # "doctr" | "tesseract" | "openocr" | "auto"
+    OCR_TESSERACT_CONCURRENCY: int = 2  # procesos de tesseract simultáneos
+    OCR_TESSERACT_TIMEOUT_S: int = 60
+    OPENOCR_URL: str | None = None
+    OPENOCR_MAX_CONNECTIONS: int = 8
+    OCR_AUTO_MIN_CONFIDENCE: float = 0.6  # "auto": por debajo, la página se repite con docTR
+    OCR_AUTO_EXPLORE_EVERY: int = 20      # "auto": 1 de cada N fotos va a Tesseract aunque vaya más lento (0 = nunca)
+
+    # Pool de procesos para docTR (0 = inferencia en un hilo del proceso API)
+    OCR_WORKERS: int = 1
+    OCR_MAX_QUEUE: int = 8             # trabajos en espera antes de responder 503
+    OCR_POOL_START_METHOD: str = "spawn"  # "fork" + OCR_POOL_PRELOAD comparte el modelo entre workers
+    OCR_POOL_PRELOAD: bool = True      # solo con "fork": cargar el modelo en el padre antes de crear workers
+    OCR_WORKER_THREADS: int = 0        # hilos intra-op por worker; 0 = núcleos disponibles / OCR_WORKERS
+    OCR_PROFILE: str = "accurate"      # "fast" | "balanced" | "accurate" (ver app.core.ocr_pool)
+    OCR_DOCTR_BACKEND: str = "torch"   # cómo corre docTR: "torch" | "onnx" (ONNX Runtime, requirements-onnx.txt)
+    OCR_ONNX_DIR: str = ".cache/onnx"
+    OCR_ONNX_INT8: bool = False
+    OCR_ONNX_THREADS: int = 0          # 0 = lo que decida onnxruntime
+    OCR_WARMUP: bool = True            # calentar el modelo al arrancar; /ready da 503 hasta entonces
+    OCR_WARMUP_RETRY_BASE_S: float = 5   # si el warmup falla se reintenta con backoff exponencial...
+    OCR_WARMUP_RETRY_MAX_S: float = 300  # ...hasta este intervalo entre intentos
+    OCR_MAX_PAGES: int = 5
+    OCR_PAGE_SELECTION: str = "first"  # "first" | "tables"
+    OCR_TEXT_LAYER: bool = True        # usar la capa de texto de PDFs digitales y saltar docTR
+    OCR_BATCH_MAX_SIZE: int = 8        # páginas por lote enviado al predictor
+    OCR_BATCH_MAX_WAIT_MS: int = 25    # ventana para juntar páginas de peticiones concurrentes
+    OCR_TABLE_LAYOUT: bool = False     # reconstruir la tabla de resultados con las cajas de las palabras (experimental)
+    OCR_VOCABULARY_EXTRA: str | None = None  # JSON con tokens propios del laboratorio (ver app.core.report_vocabulary)
+    OCR_ANALYTE_CATALOG_EXTRA: str | None = None  # JSON con analitos/sinónimos extra (ver app.core.analyte_catalog)
+    OCR_ANALYTE_FUZZY_CUTOFF: float = 88.0  # puntuación mínima (0-100) para aceptar un nombre aproximado
+
+    # Preprocesado de fotos (OpenCV) antes de docTR
+    OCR_IMAGE_PREPROCESS: bool = True
+    OCR_IMAGE_MAX_SIDE: int = 2000     # px del lado largo tras reducir
+    OCR_IMAGE_NORMALIZE: bool = True   # gris + CLAHE
+    OCR_IMAGE_DESKEW: bool = False
+
+    # Caché de resultados de OCR (clave: SHA-256 del archivo + versión de modelo/parser)
+    OCR_CACHE_ENABLED: bool = True
+    OCR_CACHE_DIR: str = ".cache/ocr"
+    OCR_CACHE_MAX_ENTRIES: int = 500
+    OCR_CACHE_MAX_MB: int = 200
+
+    # Límites de subida: se aplican mientras se lee; lo grande se vuelca a disco
+    OCR_MAX_FILE_MB: int = 20
+    OCR_MAX_REQUEST_MB: int = 40
+    OCR_SPOOL_THRESHOLD_KB: int = 1024
+
+    # Responder sin esperar a que termine la subida a Supabase Storage
+    OCR_DEFER_STORAGE_UPLOAD: bool = False
+
+    # Trabajos de OCR asíncronos (POST /ocr-local/jobs)
+    OCR_JOB_CONCURRENCY: int = 2
+    OCR_JOB_MAX_JOBS: int = 200
+    OCR_JOB_TTL_SECONDS: int = 900
+    OCR_JOB_BUSY_RETRY_SECONDS: float = 2.0    # con el pool lleno el trabajo espera y reintenta (ya respondió 202)
+    OCR_JOB_BUSY_MAX_WAIT_SECONDS: float = 300  # pasado esto, el trabajo termina con 503
+
+    # Interpretación con Gemini (POST /ocr-local/parse-llm)
+    LLM_MODEL: str = "gemini-2.5-flash"
+    LLM_MAX_CONCURRENCY: int = 4       # llamadas simultáneas a Gemini en todo el proceso
+    LLM_RATE_LIMIT_RPM: int = 0        # llamadas por minuto (0 = sin límite); según la cuota del proyecto
+    LLM_TIMEOUT_S: float = 90
+    LLM_MAX_RETRIES: int = 4           # reintentos ante cuota agotada (429) o errores transitorios
+    LLM_BACKOFF_BASE_S: float = 1.0    # backoff exponencial con jitter: hasta base * 2^intento
+    LLM_BACKOFF_MAX_S: float = 30.0
+    # Caché de respuestas de Gemini (memoria + disco); se invalida sola al cambiar modelo o prompt
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_DIR: str = ".cache/llm"
+    LLM_CACHE_MEMORY_ENTRIES: int = 256
+    LLM_CACHE_MAX_ENTRIES: int = 2000
+    LLM_CACHE_MAX_MB: int = 100
+    LLM_CACHE_TTL_HOURS: int = 168     # 0 = sin caducidad
+    LLM_SKIP_EXTRACTION_MIN_COVERAGE: float = 0.85  # cobertura del parser local a partir de la cual no se llama a la extracción
+    LLM_SKIP_EXTRACTION_MIN_RESULTS: int = 3        # y solo si el parser sacó al menos estos resultados
+    LLM_INPUT_MODE: str = "rows"                    # "rows" (filas candidatas compactas, incluye resultados de texto) | "text" (texto OCR)
+    LLM_MAX_OUTPUT_TOKENS: int = 8192
+    LLM_CHUNK_MAX_INPUT_TOKENS: int = 6000          # tokens estimados de texto por llamada de extracción
+    LLM_RESULT_OUTPUT_TOKENS: int = 90              # salida estimada por resultado extraído (sin la línea copiada)
+    LLM_CHUNK_OVERLAP_LINES: int = 5                # solo al partir una sección de texto OCR que no cabe entera
+
     # Lee automáticamente variables del archivo .env en el directorio del backend
     model_config = {
         "env_file": ".env",
@@ -0,0 +1,108 @@
+# app/core/llm_cache.py
+"""
+Caché de respuestas de Gemini en dos niveles: LRU en memoria y, detrás, el
+mismo almacén en disco que la caché de OCR (app.core.ocr_cache), con TTL.
+
+Se guarda la respuesta ya parseada (el JSON del modelo), nunca un error:
+- extracción: clave = modelo + prompt de sistema + contenido del trozo
+  (texto y perfil del paciente);
+- análisis: clave = modelo + prompt de sistema + `analysis_input` canónico
+  (JSON con claves ordenadas).
+Como el prompt entra entero en la clave, cambiarlo invalida lo anterior.
+Reanalizar el mismo documento (o un reintento de la app) no gasta tokens.
+"""
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from app.core.config import settings
+from app.core.ocr_cache import OCRCache
+
+
+def canonical_json(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+class LLMCache:
+    def __init__(self, store: OCRCache, memory_entries: int, ttl_s: float, enabled: bool = True):
+        self.store = store
+        self.memory_entries = memory_entries
+        self.ttl_s = ttl_s
+        self.enabled = enabled
+        # clave -> (creado, JSON); se guarda el texto para que nadie mute la entrada
+        self._memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(kind: str, *parts: str) -> str:
+        h = hashlib.sha256(kind.encode("utf-8"))
+        for part in parts:
+            h.update(b"\x1f" + part.encode("utf-8"))
+        return h.hexdigest()
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl_s > 0 and time.time() - created > self.ttl_s
+
+    def _remember(self, key: str, created: float, raw: str) -> None:
+        self._memory[key] = (created, raw)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[dict]:
+        if not self.enabled:
+            return None
+        entry = self._memory.get(key)
+        if entry is not None:
+            if not self._expired(entry[0]):
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return json.loads(entry[1])
+            del self._memory[key]
+
+        stored = await asyncio.to_thread(self.store.get, key)
+        if stored is not None:
+            if not self._expired(stored.get("created", 0)):
+                self._remember(key, stored["created"], json.dumps(stored["value"], ensure_ascii=False))
+                self.disk_hits += 1
+                return stored["value"]
+            await asyncio.to_thread(self.store.delete, key)
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, value: dict) -> None:
+        if not self.enabled:
+            return
+        created = time.time()
+        self._remember(key, created, json.dumps(value, ensure_ascii=False))
+        await asyncio.to_thread(self.store.put, key, {"created": created, "value": value})
+
+    def stats(self) -> dict:
+        total = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "memory_entries": len(self._memory),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.memory_hits + self.disk_hits) / total, 3) if total else None,
+            "disk": self.store.stats(),
+        }
+
+
+llm_cache = LLMCache(
+    store=OCRCache(
+        directory=settings.LLM_CACHE_DIR,
+        max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+        max_bytes=settings.LLM_CACHE_MAX_MB * 1024 * 1024,
+        enabled=settings.LLM_CACHE_ENABLED,
+    ),
+    memory_entries=settings.LLM_CACHE_MEMORY_ENTRIES,
+    ttl_s=settings.LLM_CACHE_TTL_HOURS * 3600,
+    enabled=settings.LLM_CACHE_ENABLED,
+)
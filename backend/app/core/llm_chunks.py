@@ -0,0 +1,109 @@
+# app/core/llm_chunks.py
+"""
+Troceado de la entrada del paso de extracción con Gemini.
+
+Cada trozo es una llamada al modelo, así que se busca el menor número de
+trozos que respeta dos presupuestos (en tokens estimados):
+- entrada: LLM_CHUNK_MAX_INPUT_TOKENS;
+- salida: cada línea con números puede acabar como un resultado JSON que el
+  modelo escribe entero, con la línea copiada; si el trozo no cabe en
+  max_output_tokens el JSON sale truncado y se pierde el trozo completo.
+
+Los cortes se hacen en límites de sección (títulos del reporte); solo una
+sección que por sí sola no cabe se parte por líneas, con solapamiento para
+no perder filas partidas en el corte y repitiendo el título de la sección al
+principio de cada continuación. La cabecera mínima (paciente, laboratorio)
+va en todos los trozos.
+"""
+from typing import Callable, List, Sequence, Tuple
+
+# Salida fija de cada trozo: patient_profile + lab_metadata + envoltorio del JSON
+OUTPUT_BASE_TOKENS = 250
+# La estimación de ~4 caracteres por token es gruesa: se deja margen en la salida
+OUTPUT_SAFETY = 0.75
+
+
+def estimate_tokens(text: str) -> int:
+    """Tokens aproximados (~4 caracteres por token), sin llamar a la API."""
+    return (len(text) + 3) // 4
+
+
+def line_cost(line: str, result_tokens: int) -> Tuple[int, int]:
+    """(tokens de entrada, tokens de salida) que aporta una línea al trozo."""
+    cost_in = estimate_tokens(line) + 1
+    has_number = any(ch.isdigit() for ch in line)
+    return cost_in, (result_tokens + cost_in) if has_number else 0
+
+
+def split_sections(lines: List[str], is_boundary: Callable[[str], bool]) -> List[List[str]]:
+    """Agrupa las líneas en secciones: cada título abre una nueva."""
+    sections: List[List[str]] = [[]]
+    for ln in lines:
+        if is_boundary(ln) and sections[-1]:
+            sections.append([])
+        if ln:
+            sections[-1].append(ln)
+    return [sec for sec in sections if sec]
+
+
+def chunk_lines(
+    lines: List[str],
+    is_boundary: Callable[[str], bool],
+    max_input_tokens: int,
+    max_output_tokens: int,
+    result_tokens: int,
+    overlap: int = 0,
+    header: Sequence[str] = (),
+) -> List[str]:
+    """
+    Trozos de texto para el paso de extracción. Empaqueta secciones enteras
+    mientras quepan (en orden, así que el voraz da el mínimo de trozos para
+    esos cortes) y parte por líneas solo las secciones que no caben solas.
+    `header` se antepone a cada trozo (cuenta solo como entrada).
+    """
+    header = [ln for ln in header if ln]
+    in_budget = max_input_tokens - sum(line_cost(ln, result_tokens)[0] for ln in header)
+    out_budget = int(max_output_tokens * OUTPUT_SAFETY) - OUTPUT_BASE_TOKENS
+    chunks: List[str] = []
+    cur: List[str] = []
+    cur_in = cur_out = 0
+
+    def flush(carry: List[str]) -> None:
+        nonlocal cur, cur_in, cur_out
+        if cur:
+            chunks.append("\n".join(header + cur))
+        cur = list(carry)
+        cur_in = cur_out = 0
+        for ln in cur:
+            c_in, c_out = line_cost(ln, result_tokens)
+            cur_in += c_in
+            cur_out += c_out
+
+    for section in split_sections(lines, is_boundary):
+        costs = [line_cost(ln, result_tokens) for ln in section]
+        sec_in = sum(c for c, _ in costs)
+        sec_out = sum(c for _, c in costs)
+
+        if cur and (cur_in + sec_in > in_budget or cur_out + sec_out > out_budget):
+            flush([])
+        if cur_in + sec_in <= in_budget and cur_out + sec_out <= out_budget:
+            cur.extend(section)
+            cur_in += sec_in
+            cur_out += sec_out
+            continue
+
+        # Sección más grande que un trozo: por líneas, repitiendo las últimas en el siguiente
+        # y con el título de la sección delante, para que el modelo sepa a qué grupo pertenecen
+        title = section[0] if is_boundary(section[0]) else None
+        for ln, (c_in, c_out) in zip(section, costs):
+            if cur and (cur_in + c_in > in_budget or cur_out + c_out > out_budget):
+                carry = cur[-overlap:] if 0 < overlap < len(cur) else []
+                if title is not None and title not in carry:
+                    carry = [title] + carry
+                flush(carry)
+            cur.append(ln)
+            cur_in += c_in
+            cur_out += c_out
+
+    flush([])
+    return chunks
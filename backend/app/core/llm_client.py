@@ -0,0 +1,206 @@
+# app/core/llm_client.py
+"""
+Cliente async compartido para Gemini.
+
+Todas las llamadas del proceso (extracción por trozos y análisis de
+/ocr-local/parse-llm) pasan por aquí:
+- un semáforo global (LLM_MAX_CONCURRENCY) y, opcionalmente, un límite de
+  llamadas por minuto (LLM_RATE_LIMIT_RPM, token bucket), así una petición
+  con muchos trozos no se come la cuota de las demás;
+- timeout por llamada (LLM_TIMEOUT_S);
+- reintentos con backoff exponencial con jitter ante errores de cuota o
+  transitorios (429, 500, 503, timeout); los demás errores suben tal cual;
+- un `GenerativeModel` por (modelo, prompt de sistema), reutilizado;
+- métricas: llamadas en curso, en cola, reintentos, latencia.
+"""
+import asyncio
+import random
+import time
+from typing import Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.core.ocr_batcher import Histogram
+
+LATENCY_BOUNDS_MS = (500, 1000, 2000, 5000, 10000, 20000, 40000, 80000)
+QUEUE_BOUNDS_MS = (10, 100, 500, 1000, 5000, 10000, 30000)
+
+
+class LLMError(Exception):
+    """Gemini no respondió tras los reintentos (cuota agotada, timeout, servicio caído)."""
+
+
+def _is_transient(exc: BaseException) -> bool:
+    if isinstance(exc, asyncio.TimeoutError):
+        return True
+    try:
+        from google.api_core import exceptions as gexc
+    except ImportError:
+        return False
+    return isinstance(
+        exc,
+        (
+            gexc.ResourceExhausted,
+            gexc.TooManyRequests,
+            gexc.ServiceUnavailable,
+            gexc.InternalServerError,
+            gexc.DeadlineExceeded,
+        ),
+    )
+
+
+class TokenBucket:
+    """`rpm` llamadas por minuto con ráfagas de hasta `burst`."""
+
+    def __init__(self, rpm: int, burst: int):
+        self.rate = rpm / 60.0
+        self.capacity = float(max(1, burst))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class LLMClient:
+    def __init__(
+        self,
+        max_concurrency: int,
+        timeout_s: float,
+        max_retries: int,
+        backoff_base_s: float,
+        backoff_max_s: float,
+        rate_limit_rpm: int = 0,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout_s = timeout_s
+        self.max_retries = max_retries
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._bucket = TokenBucket(rate_limit_rpm, self.max_concurrency) if rate_limit_rpm > 0 else None
+        self._models: Dict[Tuple[str, str], object] = {}
+
+        self.in_flight = 0
+        self.queued = 0
+        self.calls = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.failed = 0
+        self.latency_ms = Histogram(LATENCY_BOUNDS_MS)
+        self.queue_ms = Histogram(QUEUE_BOUNDS_MS)
+
+    def model(self, model_name: str, system_instruction: str):
+        """`GenerativeModel` reutilizado por (modelo, prompt de sistema)."""
+        key = (model_name, system_instruction)
+        model = self._models.get(key)
+        if model is None:
+            import google.generativeai as genai
+
+            model = genai.GenerativeModel(model_name=model_name, system_instruction=system_instruction)
+            self._models[key] = model
+        return model
+
+    def _backoff(self, attempt: int) -> float:
+        # "Full jitter": uniforme entre 0 y el tope exponencial
+        return random.uniform(0, min(self.backoff_max_s, self.backoff_base_s * (2 ** attempt)))
+
+    async def _call_once(self, model, contents: str, generation_config):
+        queued_at = time.perf_counter()
+        self.queued += 1
+        waiting = True
+        try:
+            async with self._semaphore:
+                if self._bucket is not None:
+                    await self._bucket.acquire()
+                self.queued -= 1
+                waiting = False
+                self.queue_ms.observe((time.perf_counter() - queued_at) * 1000)
+                self.in_flight += 1
+                started = time.perf_counter()
+                try:
+                    response = await asyncio.wait_for(
+                        model.generate_content_async(contents, generation_config=generation_config),
+                        timeout=self.timeout_s,
+                    )
+                finally:
+                    self.in_flight -= 1
+                self.latency_ms.observe((time.perf_counter() - started) * 1000)
+                return response
+        finally:
+            # Cancelado mientras esperaba turno
+            if waiting:
+                self.queued -= 1
+
+    async def generate(
+        self,
+        system_instruction: str,
+        contents: str,
+        *,
+        temperature: float,
+        max_output_tokens: int,
+        model_name: Optional[str] = None,
+        response_mime_type: str = "application/json",
+    ):
+        """
+        Respuesta de `generate_content_async`. Los errores de cuota/transitorios
+        se reintentan con backoff; si se agotan los reintentos, LLMError.
+        """
+        import google.generativeai as genai
+
+        model = self.model(model_name or settings.LLM_MODEL, system_instruction)
+        generation_config = genai.GenerationConfig(
+            response_mime_type=response_mime_type,
+            temperature=temperature,
+            max_output_tokens=max_output_tokens,
+        )
+        self.calls += 1
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await self._call_once(model, contents, generation_config)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    self.timeouts += 1
+                if not _is_transient(e):
+                    self.failed += 1
+                    raise
+                if attempt == self.max_retries:
+                    self.failed += 1
+                    raise LLMError(f"Gemini no respondió tras {attempt + 1} intentos: {e}") from e
+                delay = self._backoff(attempt)
+                self.retries += 1
+                print(f"[LLM] Error transitorio ({type(e).__name__}), reintento {attempt + 1} en {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "calls": self.calls,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "failed": self.failed,
+            "latency_ms": self.latency_ms.snapshot(),
+            "queue_ms": self.queue_ms.snapshot(),
+        }
+
+
+llm_client = LLMClient(
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    timeout_s=settings.LLM_TIMEOUT_S,
+    max_retries=settings.LLM_MAX_RETRIES,
+    backoff_base_s=settings.LLM_BACKOFF_BASE_S,
+    backoff_max_s=settings.LLM_BACKOFF_MAX_S,
+    rate_limit_rpm=settings.LLM_RATE_LIMIT_RPM,
+)
@@ -0,0 +1,158 @@
+# app/core/ocr_batcher.py
+"""
+Batching dinámico de páginas entre peticiones concurrentes.
+
+Las páginas de varias peticiones a /ocr-local/pdf se juntan durante una
+ventana corta (OCR_BATCH_MAX_WAIT_MS, hasta OCR_BATCH_MAX_SIZE páginas) y se
+envían al pool como un único lote; luego cada resultado vuelve a su petición.
+Solo se mezclan páginas del mismo perfil de OCR (una cola por perfil).
+"""
+import asyncio
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Set
+
+from app.core.config import settings
+from app.core.ocr_pool import OCRPool, PageSource, ocr_pool, run_ocr_pages
+
+
+class Histogram:
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self) -> dict:
+        buckets = {f"le_{b:g}": c for b, c in zip(self.bounds, self.counts)}
+        buckets["inf"] = self.counts[-1]
+        return {
+            "count": self.count,
+            "avg": round(self.sum / self.count, 2) if self.count else None,
+            "buckets": buckets,
+        }
+
+
+class OCRBatcher:
+    def __init__(self, pool: OCRPool, max_batch: int, max_wait_ms: int):
+        self.pool = pool
+        self.max_batch = max(max_batch, 1)
+        self.max_wait = max_wait_ms / 1000
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._dispatches: Set[asyncio.Task] = set()
+        self.batch_size = Histogram([1, 2, 4, 8, 16, 32])
+        self.wait_ms = Histogram([1, 5, 10, 25, 50, 100, 250])
+
+    def _queue_for(self, profile: str) -> asyncio.Queue:
+        task = self._tasks.get(profile)
+        if task is None or task.done():
+            self._queues[profile] = asyncio.Queue()
+            self._tasks[profile] = asyncio.get_running_loop().create_task(self._collect(profile))
+        return self._queues[profile]
+
+    def submit_each(
+        self,
+        sources: List[PageSource],
+        profile: str,
+        on_done: Optional[Callable[[float, bool], None]] = None,
+    ) -> List[asyncio.Future]:
+        """
+        Encola las páginas y devuelve un future por página (para consumirlas
+        según terminan). `on_done(ms, ok)` recibe, por página, el tiempo desde
+        que su lote se envió al pool (sin la espera en cola).
+        """
+        queue = self._queue_for(profile)
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        futures = []
+        for src in sources:
+            fut = loop.create_future()
+            queue.put_nowait((src, fut, now, on_done))
+            futures.append(fut)
+        return futures
+
+    async def submit(self, sources: List[PageSource], profile: str) -> List[dict]:
+        """Encola las páginas y espera el export de cada una (mismo orden)."""
+        if not sources:
+            return []
+        return list(await asyncio.gather(*self.submit_each(sources, profile)))
+
+    async def _collect(self, profile: str) -> None:
+        loop = asyncio.get_running_loop()
+        queue = self._queues[profile]
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            task = loop.create_task(self._dispatch(batch, profile))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, batch: list, profile: str) -> None:
+        # Peticiones canceladas (cliente desconectado) no gastan inferencia
+        batch = [entry for entry in batch if not entry[1].done()]
+        if not batch:
+            return
+
+        loop = asyncio.get_running_loop()
+        dispatched_at = loop.time()
+        for _, _, enqueued_at, _ in batch:
+            self.wait_ms.observe((dispatched_at - enqueued_at) * 1000)
+        self.batch_size.observe(len(batch))
+
+        try:
+            pages = await self.pool.run(run_ocr_pages, [src for src, _, _, _ in batch], profile)
+        except Exception as e:
+            for _, fut, _, on_done in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+                    if on_done is not None:
+                        on_done(0.0, False)
+            return
+
+        elapsed_ms = (loop.time() - dispatched_at) * 1000
+        for (_, fut, _, on_done), page in zip(batch, pages):
+            if fut.done():
+                continue
+            # Una fuente ilegible solo hace fallar la página de su petición
+            ok = not isinstance(page, Exception)
+            if ok:
+                fut.set_result(page)
+            else:
+                fut.set_exception(page)
+            if on_done is not None:
+                on_done(elapsed_ms, ok)
+
+    def stats(self) -> dict:
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+            "pending_pages": {profile: q.qsize() for profile, q in self._queues.items()},
+            "batch_size": self.batch_size.snapshot(),
+            "wait_ms": self.wait_ms.snapshot(),
+        }
+
+    def shutdown(self) -> None:
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks = {}
+
+
+ocr_batcher = OCRBatcher(
+    ocr_pool,
+    max_batch=settings.OCR_BATCH_MAX_SIZE,
+    max_wait_ms=settings.OCR_BATCH_MAX_WAIT_MS,
+)
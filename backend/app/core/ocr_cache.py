@@ -0,0 +1,142 @@
+# app/core/ocr_cache.py
+"""
+Caché en disco de resultados de OCR, direccionada por contenido.
+
+La clave es el SHA-256 de los bytes subidos + la versión del modelo/parser,
+así que volver a subir el mismo PDF (reintento de red, fallo del paso LLM)
+devuelve el resultado sin volver a hacer OCR. Se acota por número de
+entradas y por tamaño total, expulsando lo menos usado recientemente (LRU).
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterable, Optional
+
+from app.core.config import settings
+
+
+class OCRCache:
+    def __init__(self, directory: str, max_entries: int, max_bytes: int, enabled: bool = True):
+        self.directory = Path(directory)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._index: "OrderedDict[str, int]" = OrderedDict()  # clave -> bytes, de más antiguo a más reciente
+        self._total_bytes = 0
+        self._loaded = False
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(digests: Iterable[str], version: str) -> str:
+        """Clave a partir del SHA-256 de cada archivo (calculado al leer la subida)."""
+        h = hashlib.sha256()
+        h.update(version.encode("utf-8"))
+        for digest in digests:
+            h.update(b"|" + digest.encode("ascii"))
+        return h.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def _load_index(self) -> None:
+        """Reconstruye el orden LRU desde el disco (mtime) la primera vez que se usa."""
+        if self._loaded:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        entries = []
+        for p in self.directory.glob("*.json"):
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, p.stem, st.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._total_bytes += size
+        self._loaded = True
+
+    def get(self, key: str) -> Optional[dict]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            self._load_index()
+            if key not in self._index:
+                self.misses += 1
+                return None
+            path = self._path(key)
+            try:
+                data = json.loads(path.read_text(encoding="utf-8"))
+                os.utime(path)
+            except (OSError, ValueError):
+                self._drop(key)
+                self.misses += 1
+                return None
+            self._index.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key: str, payload: dict) -> None:
+        if not self.enabled:
+            return
+        raw = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        if len(raw) > self.max_bytes:
+            return
+        with self._lock:
+            self._load_index()
+            path = self._path(key)
+            tmp = path.with_suffix(".tmp")
+            try:
+                tmp.write_bytes(raw)
+                os.replace(tmp, path)
+            except OSError as e:
+                print(f"[OCR cache] No se pudo escribir {key[:12]}: {e}")
+                return
+            if key in self._index:
+                self._total_bytes -= self._index.pop(key)
+            self._index[key] = len(raw)
+            self._total_bytes += len(raw)
+            self._evict()
+
+    def delete(self, key: str) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._load_index()
+            self._drop(key)
+
+    def _drop(self, key: str) -> None:
+        self._total_bytes -= self._index.pop(key, 0)
+        try:
+            self._path(key).unlink()
+        except OSError:
+            pass
+
+    def _evict(self) -> None:
+        while self._index and (len(self._index) > self.max_entries or self._total_bytes > self.max_bytes):
+            oldest = next(iter(self._index))
+            self._drop(oldest)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._index),
+                "bytes": self._total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 3) if total else None,
+            }
+
+
+ocr_cache = OCRCache(
+    directory=settings.OCR_CACHE_DIR,
+    max_entries=settings.OCR_CACHE_MAX_ENTRIES,
+    max_bytes=settings.OCR_CACHE_MAX_MB * 1024 * 1024,
+    enabled=settings.OCR_CACHE_ENABLED,
+)
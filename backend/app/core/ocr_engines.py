@@ -0,0 +1,439 @@
+# app/core/ocr_engines.py
+"""
+Motores de OCR intercambiables detrás de una misma interfaz.
+
+Todos reciben páginas como `PageSource` (ver app.core.ocr_pool) y devuelven
+un export con la forma de `result.export()["pages"][i]` de docTR, así que el
+parser no sabe qué motor leyó la página:
+
+- "doctr": docTR en el pool de procesos, con batching entre peticiones.
+- "tesseract": el binario de Tesseract (TESSERACT_CMD) como subproceso, con
+  un número acotado de procesos simultáneos.
+- "openocr": un servidor OpenOCR (OPENOCR_URL) con un cliente HTTP async y
+  conexiones reutilizadas.
+- "auto": fotos a Tesseract (barato) y escaneos de PDF a docTR; si Tesseract
+  lee una página con poca confianza, o va más lento que docTR según la
+  latencia observada, la página se manda a docTR (salvo 1 de cada
+  OCR_AUTO_EXPLORE_EVERY fotos, que siguen midiendo a Tesseract).
+
+El motor se elige por petición (campo `engine`) o con OCR_DEFAULT_ENGINE.
+"""
+import abc
+import asyncio
+import os
+import shutil
+import time
+from typing import BinaryIO, Dict, List, Optional, Union
+
+from app.core.config import settings
+from app.core.ocr_batcher import ocr_batcher
+from app.core.ocr_pool import PageSource
+
+# Peso de la última observación en la media móvil de latencia
+LATENCY_EWMA_ALPHA = 0.2
+
+
+class OCREngineError(Exception):
+    """El motor no pudo reconocer la página (binario ausente, servidor caído...)."""
+
+
+def page_confidence(page: dict) -> float:
+    """Confianza media de las palabras de un export (0 si no hay palabras)."""
+    confs = [
+        w["confidence"]
+        for block in page.get("blocks", [])
+        for line in block.get("lines", [])
+        for w in line.get("words", [])
+    ]
+    return sum(confs) / len(confs) if confs else 0.0
+
+
+def _page_image(source: PageSource) -> Union[bytes, str]:
+    """Imagen de la página tal cual (bytes o ruta) o, si es de un PDF, rasterizada a PNG."""
+    import cv2
+    from app.core.pdf_pages import render_pages
+
+    kind, blob, idx = source
+    if kind != "pdf":
+        return blob
+    rgb = render_pages(blob, [idx])[0]
+    ok, encoded = cv2.imencode(".png", cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR))
+    if not ok:
+        raise OCREngineError(f"No se pudo rasterizar la página {idx}")
+    return encoded.tobytes()
+
+
+class OCREngine(abc.ABC):
+    name = ""
+
+    def __init__(self):
+        self.latency_ms: Optional[float] = None
+        self.pages = 0
+        self.failed = 0
+
+    def available(self) -> bool:
+        return True
+
+    def version(self, profile: str) -> str:
+        """Identifica modelo + configuración; forma parte de la clave de la caché de OCR."""
+        return self.name
+
+    def _observe(self, started: float, ok: bool) -> None:
+        self._observe_ms((time.perf_counter() - started) * 1000, ok)
+
+    def _observe_ms(self, ms: float, ok: bool) -> None:
+        if not ok:
+            self.failed += 1
+            return
+        self.pages += 1
+        if self.latency_ms is None:
+            self.latency_ms = ms
+        else:
+            self.latency_ms += LATENCY_EWMA_ALPHA * (ms - self.latency_ms)
+
+    @abc.abstractmethod
+    async def recognize(self, source: PageSource, profile: str) -> dict:
+        """Export tipo docTR de una página."""
+
+    async def _timed(self, source: PageSource, profile: str) -> dict:
+        started = time.perf_counter()
+        try:
+            page = await self.recognize(source, profile)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self._observe(started, ok=False)
+            raise
+        self._observe(started, ok=True)
+        return page
+
+    def submit_each(self, sources: List[PageSource], profile: str) -> List[asyncio.Future]:
+        """Un future por página, para consumirlas según terminan (cancelables)."""
+        return [asyncio.ensure_future(self._timed(src, profile)) for src in sources]
+
+    def stats(self) -> dict:
+        return {
+            "available": self.available(),
+            "pages": self.pages,
+            "failed": self.failed,
+            "latency_ms": round(self.latency_ms, 1) if self.latency_ms is not None else None,
+        }
+
+    async def aclose(self) -> None:
+        pass
+
+
+class DoctrEngine(OCREngine):
+    name = "doctr"
+
+    def version(self, profile: str) -> str:
+        backend = "onnx-int8" if settings.OCR_DOCTR_BACKEND == "onnx" and settings.OCR_ONNX_INT8 else settings.OCR_DOCTR_BACKEND
+        return f"{backend}:{profile}"
+
+    async def recognize(self, source: PageSource, profile: str) -> dict:
+        return (await ocr_batcher.submit([source], profile))[0]
+
+    def submit_each(self, sources: List[PageSource], profile: str) -> List[asyncio.Future]:
+        # Directo al batcher: las páginas se juntan con las de otras peticiones.
+        # La latencia se mide por página desde que su lote sale al pool, no desde
+        # que se encoló (las últimas páginas acumularían la inferencia de las primeras).
+        return ocr_batcher.submit_each(sources, profile, on_done=self._observe_ms)
+
+
+def tesseract_tsv_to_export(tsv: str, page_idx: int = 0, source: str = "tesseract") -> dict:
+    """Convierte la salida TSV de Tesseract a un export de página tipo docTR."""
+    width = height = 1
+    blocks: Dict[int, Dict[tuple, list]] = {}
+    for row in tsv.splitlines()[1:]:
+        cols = row.split("\t")
+        if len(cols) < 11:
+            continue
+        level = int(cols[0])
+        left, top, w, h = (int(c) for c in cols[6:10])
+        if level == 1:
+            width, height = max(w, 1), max(h, 1)
+            continue
+        text = cols[11].strip() if len(cols) > 11 else ""
+        conf = float(cols[10])
+        if level != 5 or not text or conf < 0:
+            continue
+        line_key = (int(cols[3]), int(cols[4]))  # (párrafo, línea) dentro del bloque
+        blocks.setdefault(int(cols[2]), {}).setdefault(line_key, []).append(
+            (left, top, left + w, top + h, text, conf / 100)
+        )
+
+    def rel(x0, y0, x1, y1):
+        return ((x0 / width, y0 / height), (x1 / width, y1 / height))
+
+    out_blocks = []
+    for lines in blocks.values():
+        out_lines = []
+        for words in lines.values():
+            out_lines.append({
+                "geometry": rel(
+                    min(w[0] for w in words), min(w[1] for w in words),
+                    max(w[2] for w in words), max(w[3] for w in words),
+                ),
+                "words": [
+                    {"value": text, "confidence": conf, "geometry": rel(x0, y0, x1, y1)}
+                    for x0, y0, x1, y1, text, conf in words
+                ],
+            })
+        out_blocks.append({
+            "geometry": (
+                (min(ln["geometry"][0][0] for ln in out_lines), min(ln["geometry"][0][1] for ln in out_lines)),
+                (max(ln["geometry"][1][0] for ln in out_lines), max(ln["geometry"][1][1] for ln in out_lines)),
+            ),
+            "lines": out_lines,
+        })
+
+    return {
+        "page_idx": page_idx,
+        "dimensions": (height, width),
+        "source": source,
+        "blocks": out_blocks,
+    }
+
+
+class TesseractEngine(OCREngine):
+    name = "tesseract"
+
+    def __init__(self, cmd: Optional[str], lang: str, concurrency: int, timeout_s: float):
+        super().__init__()
+        self.cmd = cmd or "tesseract"
+        self.lang = lang
+        self.timeout_s = timeout_s
+        self._concurrency = max(concurrency, 1)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._binary: Optional[str] = None
+
+    def available(self) -> bool:
+        if self._binary is None:
+            self._binary = shutil.which(self.cmd) or ""
+        return bool(self._binary)
+
+    def version(self, profile: str) -> str:
+        return f"tesseract:{self.lang}"
+
+    async def recognize(self, source: PageSource, profile: str) -> dict:
+        if not self.available():
+            raise OCREngineError(f"Tesseract no encontrado ({self.cmd})")
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._concurrency)
+
+        image = await asyncio.to_thread(_page_image, source)
+        target, stdin = (image, None) if isinstance(image, str) else ("stdin", image)
+        async with self._semaphore:
+            proc = await asyncio.create_subprocess_exec(
+                self._binary, target, "stdout", "-l", self.lang, "tsv",
+                stdin=asyncio.subprocess.PIPE if stdin is not None else None,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                # Un hilo por proceso: la concurrencia la da el número de procesos
+                env={**os.environ, "OMP_THREAD_LIMIT": "1"},
+            )
+            try:
+                out, err = await asyncio.wait_for(proc.communicate(stdin), self.timeout_s)
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                proc.kill()
+                await proc.wait()
+                if isinstance(e, asyncio.TimeoutError):
+                    raise OCREngineError(f"Tesseract superó {self.timeout_s:g}s")
+                raise
+        if proc.returncode != 0:
+            raise OCREngineError(f"Tesseract falló: {err.decode(errors='replace').strip()[:200]}")
+        return tesseract_tsv_to_export(out.decode("utf-8", errors="replace"), page_idx=source[2])
+
+
+def text_to_export(text: str, page_idx: int = 0, source: str = "openocr") -> dict:
+    """
+    Export tipo docTR a partir de texto plano (una línea por renglón). No hay
+    cajas reales: cada línea ocupa una franja horizontal y las palabras se
+    reparten a lo ancho, suficiente para conservar el orden de lectura.
+    """
+    rows = [ln.split() for ln in text.splitlines() if ln.strip()]
+    n = max(len(rows), 1)
+    lines = []
+    for i, words in enumerate(rows):
+        y0, y1 = i / n, (i + 1) / n
+        step = 1 / len(words)
+        lines.append({
+            "geometry": ((0.0, y0), (1.0, y1)),
+            "words": [
+                {"value": w, "confidence": 1.0, "geometry": ((j * step, y0), ((j + 1) * step, y1))}
+                for j, w in enumerate(words)
+            ],
+        })
+    return {
+        "page_idx": page_idx,
+        "dimensions": (0, 0),
+        "source": source,
+        "blocks": [{"geometry": ((0.0, 0.0), (1.0, 1.0)), "lines": lines}],
+    }
+
+
+class OpenOCREngine(OCREngine):
+    name = "openocr"
+
+    def __init__(self, url: Optional[str], lang: str, max_connections: int):
+        super().__init__()
+        self.url = url.rstrip("/") if url else None
+        self.lang = lang
+        self.max_connections = max_connections
+        self._client = None
+
+    def available(self) -> bool:
+        return bool(self.url)
+
+    def version(self, profile: str) -> str:
+        return f"openocr:{self.lang}"
+
+    def _http(self):
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(
+                base_url=self.url,
+                timeout=httpx.Timeout(60.0, connect=5.0),
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+            )
+        return self._client
+
+    async def post(self, path: str, **kwargs):
+        """POST al servidor OpenOCR con el cliente compartido; errores de red -> OCREngineError."""
+        import httpx
+
+        if not self.available():
+            raise OCREngineError("OPENOCR_URL no configurada")
+        try:
+            return await self._http().post(path, **kwargs)
+        except httpx.RequestError as e:
+            raise OCREngineError(f"OpenOCR no accesible: {e}")
+
+    def upload_fields(self, filename: str, content: Union[bytes, BinaryIO], content_type: str, lang: Optional[str] = None) -> dict:
+        return {
+            # campo 'file' con (filename, contenido, mimetype)
+            "file": (filename, content, content_type),
+            # campo 'config' en JSON mínimo; OpenOCR parsea este multipart
+            "config": (None, '{"engine":"tesseract","tesseract_lang":"%s"}' % (lang or self.lang), "application/json"),
+        }
+
+    async def recognize(self, source: PageSource, profile: str) -> dict:
+        image = await asyncio.to_thread(_page_image, source)
+        if isinstance(image, str):
+            image = await asyncio.to_thread(_read_file, image)
+        r = await self.post("/ocr-file-upload", files=self.upload_fields("page.png", image, "image/png"))
+        if r.status_code != 200:
+            raise OCREngineError(f"OpenOCR error {r.status_code}: {r.text[:200]}")
+        # OpenOCR responde texto plano con el OCR
+        return text_to_export(r.text, page_idx=source[2])
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as fh:
+        return fh.read()
+
+
+class AutoEngine(OCREngine):
+    name = "auto"
+
+    def __init__(self, cheap: OCREngine, strong: OCREngine, min_confidence: float, explore_every: int = 0):
+        super().__init__()
+        self.cheap = cheap
+        self.strong = strong
+        self.min_confidence = min_confidence
+        self.explore_every = explore_every
+        self._photos = 0
+        self.routed = {"cheap": 0, "strong": 0, "escalated": 0, "explored": 0}
+
+    def version(self, profile: str) -> str:
+        return f"auto:{self.min_confidence}:{self.cheap.version(profile)}:{self.strong.version(profile)}"
+
+    def _prefer_cheap(self, source: PageSource) -> bool:
+        if source[0] == "pdf" or not self.cheap.available():
+            return False
+        self._photos += 1
+        # Si el motor barato va más lento que el fuerte (p. ej. CPU saturada), no compensa
+        if self.cheap.latency_ms is not None and self.strong.latency_ms is not None:
+            if self.cheap.latency_ms <= self.strong.latency_ms:
+                return True
+            # Aun así, 1 de cada N fotos va al barato: si no, su latencia no se vuelve a medir
+            # y el enrutado se queda en el fuerte hasta reiniciar el proceso
+            if self.explore_every > 0 and self._photos % self.explore_every == 0:
+                self.routed["explored"] += 1
+                return True
+            return False
+        return True
+
+    async def recognize(self, source: PageSource, profile: str) -> dict:
+        if self._prefer_cheap(source):
+            try:
+                page = await self.cheap._timed(source, profile)
+            except OCREngineError as e:
+                print(f"[OCR auto] {self.cheap.name} falló, usando {self.strong.name}: {e}")
+            else:
+                if page_confidence(page) >= self.min_confidence:
+                    self.routed["cheap"] += 1
+                    return page
+            self.routed["escalated"] += 1
+        else:
+            self.routed["strong"] += 1
+        return await self.strong.submit_each([source], profile)[0]
+
+    def stats(self) -> dict:
+        return {**super().stats(), "routed": dict(self.routed)}
+
+
+ENGINES: Dict[str, OCREngine] = {}
+
+
+def register_engine(engine: OCREngine) -> OCREngine:
+    ENGINES[engine.name] = engine
+    return engine
+
+
+def resolve_engine(name: Optional[str]) -> str:
+    name = name or settings.OCR_DEFAULT_ENGINE
+    engine = ENGINES.get(name)
+    if engine is None:
+        raise ValueError(f"Motor de OCR desconocido: {name}. Opciones: {', '.join(ENGINES)}")
+    if not engine.available():
+        raise ValueError(f"El motor de OCR {name} no está disponible en este servidor")
+    return name
+
+
+def get_engine(name: Optional[str] = None) -> OCREngine:
+    return ENGINES[resolve_engine(name)]
+
+
+def engines_stats() -> dict:
+    return {name: engine.stats() for name, engine in ENGINES.items()}
+
+
+async def close_engines() -> None:
+    for engine in ENGINES.values():
+        await engine.aclose()
+
+
+doctr_engine = register_engine(DoctrEngine())
+tesseract_engine = register_engine(TesseractEngine(
+    cmd=settings.TESSERACT_CMD,
+    lang=settings.OCR_LANG,
+    concurrency=settings.OCR_TESSERACT_CONCURRENCY,
+    timeout_s=settings.OCR_TESSERACT_TIMEOUT_S,
+))
+openocr_engine = register_engine(OpenOCREngine(
+    url=settings.OPENOCR_URL,
+    lang=settings.OCR_LANG,
+    max_connections=settings.OPENOCR_MAX_CONNECTIONS,
+))
+register_engine(AutoEngine(
+    tesseract_engine,
+    doctr_engine,
+    min_confidence=settings.OCR_AUTO_MIN_CONFIDENCE,
+    explore_every=settings.OCR_AUTO_EXPLORE_EVERY,
+))
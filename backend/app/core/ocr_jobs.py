@@ -0,0 +1,135 @@
+# app/core/ocr_jobs.py
+"""
+Trabajos de OCR asíncronos (submit -> poll -> resultado).
+
+El endpoint de submit encola el trabajo y responde 202 enseguida; una cola
+en segundo plano con OCR_JOB_CONCURRENCY consumidores lo ejecuta. Los
+trabajos terminados se conservan OCR_JOB_TTL_SECONDS y como máximo
+OCR_JOB_MAX_JOBS a la vez (se expulsan primero los terminados más antiguos).
+Al apagar, los trabajos que siguen en cola se descartan llamando a su
+`on_drop` (p. ej. liberar los temporales de la subida).
+"""
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, List, Optional
+
+from fastapi import HTTPException
+
+from app.core.config import settings
+
+
+class JobStoreFull(Exception):
+    """No cabe otro trabajo sin expulsar uno que aún no ha terminado."""
+
+
+@dataclass
+class Job:
+    id: str
+    owner: str
+    status: str = "queued"  # queued | running | done | error
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Any = None
+    error: Optional[str] = None
+    error_status: Optional[int] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "error")
+
+
+class JobStore:
+    def __init__(self, max_jobs: int, ttl_seconds: int, concurrency: int):
+        self.max_jobs = max_jobs
+        self.ttl_seconds = ttl_seconds
+        self.concurrency = max(concurrency, 1)
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+
+    def _ensure_started(self) -> None:
+        if self._queue is None or all(w.done() for w in self._workers):
+            self._queue = asyncio.Queue()
+            loop = asyncio.get_running_loop()
+            self._workers = [loop.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    def _prune(self) -> None:
+        now = time.time()
+        for job_id in [j.id for j in self._jobs.values() if j.finished and now - j.finished_at > self.ttl_seconds]:
+            del self._jobs[job_id]
+        while len(self._jobs) >= self.max_jobs:
+            oldest_done = next((j.id for j in self._jobs.values() if j.finished), None)
+            if oldest_done is None:
+                raise JobStoreFull("Demasiados trabajos de OCR en curso")
+            del self._jobs[oldest_done]
+
+    def submit(
+        self,
+        owner: str,
+        run: Callable[[], Awaitable[Any]],
+        on_drop: Optional[Callable[[], None]] = None,
+    ) -> Job:
+        """`on_drop`: se llama si el trabajo se descarta sin llegar a ejecutarse."""
+        self._prune()
+        self._ensure_started()
+        job = Job(id=uuid.uuid4().hex, owner=owner)
+        self._jobs[job.id] = job
+        self._queue.put_nowait((job, run, on_drop))
+        return job
+
+    def get(self, job_id: str, owner: str) -> Optional[Job]:
+        self._prune()
+        job = self._jobs.get(job_id)
+        if job is None or job.owner != owner:
+            return None
+        return job
+
+    async def _worker(self) -> None:
+        while True:
+            job, run, _ = await self._queue.get()
+            job.status = "running"
+            job.started_at = time.time()
+            try:
+                job.result = await run()
+                job.status = "done"
+            except HTTPException as e:
+                job.status, job.error, job.error_status = "error", str(e.detail), e.status_code
+            except Exception as e:
+                job.status, job.error, job.error_status = "error", f"OCR/PDF error: {e}", 500
+            finally:
+                job.finished_at = time.time()
+                self._queue.task_done()
+
+    def stats(self) -> dict:
+        by_status: dict = {}
+        for job in self._jobs.values():
+            by_status[job.status] = by_status.get(job.status, 0) + 1
+        return {
+            "jobs": len(self._jobs),
+            "max_jobs": self.max_jobs,
+            "concurrency": self.concurrency,
+            "by_status": by_status,
+        }
+
+    def shutdown(self) -> None:
+        for w in self._workers:
+            w.cancel()
+        self._workers = []
+        # Los que no llegaron a ejecutarse no pasarán por `run`: liberar lo suyo aquí
+        while self._queue is not None and not self._queue.empty():
+            job, _, on_drop = self._queue.get_nowait()
+            job.status, job.error, job.error_status = "error", "Servicio detenido", 503
+            job.finished_at = time.time()
+            if on_drop is not None:
+                on_drop()
+
+
+ocr_jobs = JobStore(
+    max_jobs=settings.OCR_JOB_MAX_JOBS,
+    ttl_seconds=settings.OCR_JOB_TTL_SECONDS,
+    concurrency=settings.OCR_JOB_CONCURRENCY,
+)
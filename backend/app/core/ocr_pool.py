@@ -0,0 +1,342 @@
+# app/core/ocr_pool.py
+"""
+Pool de procesos para la inferencia de docTR.
+
+Cada proceso del pool construye `ocr_predictor` una sola vez (initializer) y
+recibe los trabajos como bytes o rutas a archivo (PDF o imágenes). El endpoint solo hace
+`await`, así que una subida pesada ya no congela el event loop de uvicorn.
+
+Para escalar en una máquina con varios núcleos se sube OCR_WORKERS en un solo
+proceso de uvicorn (no `uvicorn --workers N`, que carga N copias del modelo).
+Con OCR_POOL_START_METHOD="fork" y OCR_POOL_PRELOAD el modelo se carga una vez
+en el proceso padre antes de crear los workers, que lo heredan copy-on-write.
+Los hilos de torch/onnxruntime se reparten entre los workers para que no
+compitan por los mismos núcleos.
+"""
+import asyncio
+import gc
+import multiprocessing as mp
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from app.core.config import settings
+
+
+class OCRPoolBusy(Exception):
+    """La cola del pool está llena; el endpoint debe responder 503."""
+
+
+# ---------------------------
+# Lado worker
+# ---------------------------
+
+# Perfiles de arquitectura docTR (detección + reconocimiento).
+# "accurate" son los valores por defecto de `ocr_predictor`.
+OCR_PROFILES: Dict[str, Dict[str, str]] = {
+    "fast": {"det_arch": "db_mobilenet_v3_large", "reco_arch": "crnn_mobilenet_v3_small"},
+    "balanced": {"det_arch": "fast_small", "reco_arch": "crnn_mobilenet_v3_large"},
+    "accurate": {"det_arch": "fast_base", "reco_arch": "crnn_vgg16_bn"},
+}
+
+_PREDICTORS: Dict[str, Any] = {}  # perfil -> predictor, uno por proceso
+
+# Espera máxima de cada worker a que los demás terminen su warmup
+WARMUP_TIMEOUT_S = 600
+
+
+def resolve_profile(profile: Optional[str]) -> str:
+    profile = profile or settings.OCR_PROFILE
+    if profile not in OCR_PROFILES:
+        raise ValueError(f"Perfil de OCR desconocido: {profile}. Opciones: {', '.join(OCR_PROFILES)}")
+    return profile
+
+
+def get_predictor(profile: Optional[str] = None):
+    profile = resolve_profile(profile)
+    if profile not in _PREDICTORS:
+        if settings.OCR_DOCTR_BACKEND == "onnx":
+            from app.core.onnx_engine import build_onnx_predictor
+            _PREDICTORS[profile] = build_onnx_predictor(**OCR_PROFILES[profile])
+        else:
+            from doctr.models import ocr_predictor
+            _PREDICTORS[profile] = ocr_predictor(pretrained=True, **OCR_PROFILES[profile])
+    return _PREDICTORS[profile]
+
+
+def _document_file():
+    # Con ONNX no importamos doctr (arrastra torch); OnnxTR trae el mismo lector
+    if settings.OCR_DOCTR_BACKEND == "onnx":
+        from onnxtr.io import DocumentFile
+    else:
+        from doctr.io import DocumentFile
+    return DocumentFile
+
+
+def warmup_predictor(profile: Optional[str] = None) -> int:
+    """
+    Pasa una página sintética por el predictor para que la primera petición
+    real no pague la carga de pesos ni la reserva de memoria.
+    """
+    import cv2
+    import numpy as np
+
+    page = np.full((1123, 794, 3), 255, np.uint8)  # A4 a 96 dpi
+    for i, text in enumerate(["HEMOGLOBINA 14.2 12.0-16.0 g/dL", "GLUCOSA 92 70-110 mg/dL"]):
+        cv2.putText(page, text, (60, 200 + 60 * i), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 0, 0), 2)
+    get_predictor(profile)([page])
+    return os.getpid()
+
+
+def warmup_worker(barrier) -> int:
+    """
+    Calienta el predictor y espera en la barrera a que el resto de trabajos de
+    warmup esté también en marcha: así cada uno ocupa un proceso distinto y
+    ningún worker se queda frío mientras otro hace varios warmups.
+    """
+    pid = warmup_predictor()
+    barrier.wait(WARMUP_TIMEOUT_S)
+    return pid
+
+
+def available_cpus() -> int:
+    # sched_getaffinity respeta los límites de CPU del contenedor; cpu_count no
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def threads_per_worker(workers: int) -> int:
+    """Hilos intra-op por worker: los del ajuste, o los núcleos repartidos entre workers."""
+    if settings.OCR_WORKER_THREADS > 0:
+        return settings.OCR_WORKER_THREADS
+    return max(1, available_cpus() // max(workers, 1))
+
+
+def _set_threads(threads: int) -> None:
+    # onnxruntime lee el valor al crear la sesión (ver onnx_engine)
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    if settings.OCR_DOCTR_BACKEND != "onnx":
+        import torch
+        torch.set_num_threads(threads)
+
+
+def _init_worker(threads: int) -> None:
+    _set_threads(threads)
+    get_predictor()
+    print(f"[OCR pool] Worker {os.getpid()} listo (perfil {settings.OCR_PROFILE}, {threads} hilos)")
+
+
+# Una página a reconocer: ("pdf", pdf, índice) o ("image", imagen, 0), donde el
+# archivo va como `bytes` o como ruta a un temporal en disco. Es picklable y el
+# mismo objeto repetido en un lote se serializa una sola vez.
+PageSource = Tuple[str, Union[bytes, str], int]
+
+
+def _load_pages(sources: List[PageSource]) -> list:
+    """
+    Rasteriza/decodifica cada fuente a un array RGB, abriendo cada PDF una vez.
+    Si una fuente no se puede leer (p. ej. el temporal de una petición cuyo
+    cliente se desconectó), su posición queda con la excepción y el resto del
+    lote sigue adelante.
+    """
+    from app.core.pdf_pages import render_pages
+
+    DocumentFile = _document_file()
+    pages: list = [None] * len(sources)
+    by_pdf: Dict[int, List[int]] = {}
+    for pos, (kind, blob, idx) in enumerate(sources):
+        if kind == "pdf":
+            by_pdf.setdefault(id(blob), []).append(pos)
+            continue
+        try:
+            pages[pos] = DocumentFile.from_images([blob])[0]
+        except Exception as e:
+            pages[pos] = e
+
+    for positions in by_pdf.values():
+        blob = sources[positions[0]][1]
+        try:
+            rendered = render_pages(blob, [sources[p][2] for p in positions])
+        except Exception as e:
+            rendered = [e] * len(positions)
+        for pos, arr in zip(positions, rendered):
+            pages[pos] = arr
+    return pages
+
+
+def run_ocr_pages(sources: List[PageSource], profile: Optional[str] = None) -> List[Union[dict, Exception]]:
+    """
+    Ejecuta docTR sobre un lote de páginas (posiblemente de varias peticiones)
+    en UNA sola llamada al predictor del perfil indicado y devuelve el export
+    de cada página en el mismo orden. Las páginas que no se pudieron cargar
+    vuelven como la excepción correspondiente, para fallar solo su petición.
+    """
+    if not sources:
+        return []
+    loaded = _load_pages(sources)
+    ok = [pos for pos, page in enumerate(loaded) if not isinstance(page, Exception)]
+    results: List[Union[dict, Exception]] = list(loaded)
+    if ok:
+        exported = get_predictor(profile)([loaded[pos] for pos in ok]).export()["pages"]
+        for pos, page in zip(ok, exported):
+            results[pos] = page
+    return results
+
+
+# ---------------------------
+# Lado API
+# ---------------------------
+
+class OCRPool:
+    def __init__(self, workers: int, max_queue: int, start_method: str, preload: bool = False):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.start_method = start_method
+        self.preload = preload and start_method == "fork"
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+        self.ready = False
+        self.warmup_error: Optional[str] = None
+        self.warmup_attempts = 0
+
+    def _ensure_executor(self) -> Executor:
+        with self._start_lock:
+            if self._executor is None:
+                self._executor = self._create_executor()
+        return self._executor
+
+    def _create_executor(self) -> Executor:
+        if self.workers <= 0:
+            # Modo desarrollo: mismo proceso, pero fuera del event loop
+            return ThreadPoolExecutor(max_workers=1, thread_name_prefix="ocr")
+        threads = threads_per_worker(self.workers)
+        if self.preload:
+            self._preload(threads)
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=mp.get_context(self.start_method),
+            initializer=_init_worker,
+            initargs=(threads,),
+        )
+
+    def _preload(self, threads: int) -> None:
+        """
+        Construye el predictor en el padre para que los workers lo hereden al
+        hacer fork. Solo se cargan pesos, sin inferencia: un pool de OpenMP ya
+        arrancado en el padre puede colgar a los hijos tras el fork.
+        """
+        t0 = time.perf_counter()
+        _set_threads(threads)
+        get_predictor()
+        # Saca los objetos del modelo del GC: si el recolector los recorre en
+        # los hijos toca sus cabeceras y se copian las páginas compartidas
+        gc.freeze()
+        print(f"[OCR pool] Modelo precargado en el padre en {time.perf_counter() - t0:.1f}s")
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self._in_flight - max(self.workers, 1))
+
+    def _on_done(self, fut) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            if fut.cancelled() or fut.exception() is not None:
+                self._failed += 1
+            else:
+                self._completed += 1
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        with self._lock:
+            if self.queue_depth >= self.max_queue:
+                raise OCRPoolBusy("Cola de OCR llena")
+            self._in_flight += 1
+
+        try:
+            fut = self._ensure_executor().submit(fn, *args)
+        except Exception:
+            with self._lock:
+                self._in_flight -= 1
+            raise
+        fut.add_done_callback(self._on_done)
+        return await asyncio.wrap_future(fut)
+
+    async def warmup(self, retry_base_s: Optional[float] = None, retry_max_s: Optional[float] = None) -> None:
+        """
+        Calienta el pool hasta conseguirlo: un fallo (p. ej. workers que mueren
+        al cargar el modelo) se reintenta con backoff exponencial en vez de
+        dejar /ready en 503 para siempre.
+        """
+        base = settings.OCR_WARMUP_RETRY_BASE_S if retry_base_s is None else retry_base_s
+        cap = settings.OCR_WARMUP_RETRY_MAX_S if retry_max_s is None else retry_max_s
+        while not await self._warmup_once():
+            delay = min(cap, base * 2 ** (self.warmup_attempts - 1))
+            print(f"[OCR pool] Reintentando warmup en {delay:.0f}s (intento {self.warmup_attempts})")
+            # Un executor con workers caídos no se recupera solo: se crea de nuevo
+            self.shutdown()
+            await asyncio.sleep(delay)
+
+    async def _warmup_once(self) -> bool:
+        """Arranca los workers y calienta el modelo en cada uno; luego marca el pool como listo."""
+        self.warmup_attempts += 1
+        t0 = time.perf_counter()
+        workers = max(self.workers, 1)
+        manager = None
+        try:
+            # Con precarga el executor tarda lo que tarda cargar el modelo: fuera del event loop
+            await asyncio.to_thread(self._ensure_executor)
+            if self.workers <= 0:
+                pids = [await self.run(warmup_predictor)]
+            else:
+                # Barrera compartida: un trabajo de warmup por proceso (ver warmup_worker)
+                manager = mp.get_context(self.start_method).Manager()
+                barrier = manager.Barrier(workers)
+                pids = await asyncio.gather(*(self.run(warmup_worker, barrier) for _ in range(workers)))
+            if len(set(pids)) < workers:
+                raise RuntimeError(f"solo {len(set(pids))} de {workers} workers calentados")
+        except Exception as e:
+            self.warmup_error = str(e) or type(e).__name__
+            print(f"[OCR pool] Error en warmup: {self.warmup_error}")
+            return False
+        finally:
+            if manager is not None:
+                manager.shutdown()
+        self.ready = True
+        self.warmup_error = None
+        print(f"[OCR pool] Warmup listo en {time.perf_counter() - t0:.1f}s (procesos: {sorted(set(pids))})")
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "warmup_attempts": self.warmup_attempts,
+                "mode": "process" if self.workers > 0 else "thread",
+                "start_method": self.start_method if self.workers > 0 else None,
+                "preload": self.preload,
+                "workers": max(self.workers, 1),
+                "in_flight": self._in_flight,
+                "queue_depth": self.queue_depth,
+                "max_queue": self.max_queue,
+                "completed": self._completed,
+                "failed": self._failed,
+            }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+ocr_pool = OCRPool(
+    workers=settings.OCR_WORKERS,
+    max_queue=settings.OCR_MAX_QUEUE,
+    start_method=settings.OCR_POOL_START_METHOD,
+    preload=settings.OCR_POOL_PRELOAD,
+)
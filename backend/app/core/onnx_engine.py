@@ -0,0 +1,97 @@
+# app/core/onnx_engine.py
+"""
+Motor de OCR sobre ONNX Runtime (OCR_DOCTR_BACKEND="onnx").
+
+Los modelos de detección y reconocimiento de docTR se exportan a ONNX una
+sola vez y quedan en OCR_ONNX_DIR; con OCR_ONNX_INT8 se cuantizan además a
+int8 (dinámica, solo pesos). En ejecución se sirven con OnnxTR, que replica
+el pre/post-procesado de docTR sobre onnxruntime, así que `export()` tiene
+exactamente la misma forma y el resto del pipeline no cambia.
+
+Exportar necesita torch; servir no. Si los .onnx ya están en disco (por
+ejemplo generados con `python export_onnx.py` al construir la imagen) el
+proceso de la API puede correr sin torch instalado. onnxruntime y onnxtr
+son opcionales: van en requirements-onnx.txt, no en requirements.txt.
+"""
+import os
+from pathlib import Path
+from typing import Tuple
+
+from app.core.config import settings
+
+# Tamaño de entrada con el que docTR entrena cada tipo de modelo
+DET_INPUT_SHAPE = (1, 3, 1024, 1024)
+RECO_INPUT_SHAPE = (1, 3, 32, 128)
+
+
+def onnx_model_path(arch: str, int8: bool) -> Path:
+    suffix = ".int8.onnx" if int8 else ".onnx"
+    return Path(settings.OCR_ONNX_DIR) / f"{arch}{suffix}"
+
+
+def export_arch(arch: str, task: str) -> Path:
+    """Exporta un modelo preentrenado de docTR (task: "det" o "reco") a ONNX."""
+    import torch
+    from doctr.models import detection, recognition
+    from doctr.models.utils import export_model_to_onnx
+
+    path = onnx_model_path(arch, int8=False)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    module = detection if task == "det" else recognition
+    model = getattr(module, arch)(pretrained=True, exportable=True).eval()
+    if arch.startswith("fast"):
+        # FAST se entrena con ramas paralelas que ocr_predictor fusiona al cargar;
+        # sin fusionarlas el .onnx no da las mismas cajas (y es más lento)
+        from doctr.models.detection.fast import reparameterize
+        model = reparameterize(model)
+    shape = DET_INPUT_SHAPE if task == "det" else RECO_INPUT_SHAPE
+    # export_model_to_onnx añade la extensión .onnx al nombre
+    export_model_to_onnx(model, model_name=str(path.with_suffix("")), dummy_input=torch.rand(shape))
+    print(f"[OCR onnx] Exportado {arch} -> {path}")
+    return path
+
+
+def quantize_int8(src: Path) -> Path:
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    dst = src.with_suffix(".int8.onnx")
+    quantize_dynamic(str(src), str(dst), weight_type=QuantType.QUInt8)
+    print(f"[OCR onnx] Cuantizado int8 {src.name} -> {dst.name}")
+    return dst
+
+
+def ensure_model(arch: str, task: str, int8: bool) -> Path:
+    """Ruta del .onnx listo para servir; exporta/cuantiza solo si falta en disco."""
+    path = onnx_model_path(arch, int8)
+    if path.exists():
+        return path
+    fp32 = onnx_model_path(arch, int8=False)
+    if not fp32.exists():
+        fp32 = export_arch(arch, task)
+    return quantize_int8(fp32) if int8 else fp32
+
+
+def ensure_profile_models(det_arch: str, reco_arch: str, int8: bool) -> Tuple[Path, Path]:
+    return ensure_model(det_arch, "det", int8), ensure_model(reco_arch, "reco", int8)
+
+
+def build_onnx_predictor(det_arch: str, reco_arch: str):
+    """Predictor OnnxTR con los modelos exportados del perfil (misma API que docTR)."""
+    import onnxruntime as ort
+    from onnxtr.models import detection, ocr_predictor, recognition
+    from onnxtr.models.engine import EngineConfig
+
+    det_path, reco_path = ensure_profile_models(det_arch, reco_arch, settings.OCR_ONNX_INT8)
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    # Sin ajuste explícito se usa el reparto por worker del pool (OMP_NUM_THREADS)
+    threads = settings.OCR_ONNX_THREADS or int(os.environ.get("OMP_NUM_THREADS", "0"))
+    if threads:
+        options.intra_op_num_threads = threads
+    engine_cfg = EngineConfig(providers=["CPUExecutionProvider"], session_options=options)
+
+    det_model = getattr(detection, det_arch)(str(det_path), engine_cfg=engine_cfg)
+    reco_model = getattr(recognition, reco_arch)(str(reco_path), engine_cfg=engine_cfg)
+    return ocr_predictor(det_arch=det_model, reco_arch=reco_model)
@@ -0,0 +1,249 @@
+# app/core/pdf_pages.py
+"""
+Utilidades de PDF con pypdfium2: contar páginas, elegir cuáles procesar,
+leer la capa de texto embebida (PDFs digitales) y rasterizar SOLO las páginas
+que de verdad necesitan OCR (en lugar de `DocumentFile.from_pdf`, que
+rasteriza el documento completo).
+"""
+import re
+from typing import List, Optional, Union
+
+import cv2
+import numpy as np
+import pypdfium2 as pdfium
+import pypdfium2.raw as pdfium_c
+
+# Misma escala que usa docTR en `read_pdf` (≈144 dpi)
+RENDER_SCALE = 2.0
+# Escala de las miniaturas usadas solo para puntuar páginas
+THUMB_SCALE = 0.35
+# No puntuamos más allá de esta página (documentos enormes)
+SCAN_LIMIT = 50
+# Mínimo de caracteres alfanuméricos en el cuerpo para considerar usable la capa de texto
+MIN_TEXT_CHARS = 40
+# Franja superior/inferior (fracción del alto) que se trata como cabecera/pie:
+# un escaneo con el nombre del laboratorio o el nº de página digital no cuenta
+MARGIN_FRAC = 0.12
+# Una imagen que ocupa al menos esta fracción de la página es un posible
+# escaneo: necesita MIN_TEXT_CHARS de texto encima o la página va a OCR
+MIN_IMAGE_AREA_FRAC = 0.2
+# Máxima proporción de caracteres ilegibles (fuentes sin ToUnicode, etc.)
+MAX_GARBAGE_RATIO = 0.05
+
+# bytes en memoria o ruta a un archivo temporal (pdfium abre ambos)
+PdfSource = Union[bytes, str]
+
+_NUMERIC_ROW_RE = re.compile(r"\d+(?:[.,]\d+)?\s*-\s*\d+(?:[.,]\d+)?|\d+(?:[.,]\d+)?\s+\S+/\S+")
+
+
+def pdf_page_count(source: PdfSource) -> int:
+    pdf = pdfium.PdfDocument(source)
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+
+def _text_table_score(page) -> Optional[int]:
+    """Filas con pinta de resultado (rango o unidad) en la capa de texto, o None si no hay texto."""
+    textpage = page.get_textpage()
+    try:
+        text = textpage.get_text_range()
+    finally:
+        textpage.close()
+    if len(text.strip()) < 20:
+        return None
+    return sum(1 for ln in text.splitlines() if _NUMERIC_ROW_RE.search(ln))
+
+
+def _raster_table_score(page) -> int:
+    """Píxeles de líneas horizontales/verticales largas en una miniatura (reglado de tabla)."""
+    gray = page.render(scale=THUMB_SCALE, grayscale=True).to_numpy()
+    if gray.ndim == 3:
+        gray = gray[:, :, 0]
+    binary = (gray < 160).astype(np.uint8)
+    h, w = binary.shape
+    horiz = cv2.morphologyEx(binary, cv2.MORPH_OPEN, np.ones((1, max(w // 8, 1)), np.uint8))
+    vert = cv2.morphologyEx(binary, cv2.MORPH_OPEN, np.ones((max(h // 16, 1), 1), np.uint8))
+    return int(horiz.sum() + vert.sum())
+
+
+def _by_rank(scores: List[tuple]) -> List[tuple]:
+    """
+    (sin puntuación, puesto, -fracción de la mejor, índice) de cada
+    (puntuación, índice) dentro de su grupo; ordenar estas tuplas mezcla grupos.
+    """
+    ordered = sorted(scores, key=lambda t: (-t[0], t[1]))
+    top = ordered[0][0] if ordered and ordered[0][0] else 1
+    return [(score == 0, rank, -score / top, idx) for rank, (score, idx) in enumerate(ordered)]
+
+
+def select_pages(source: PdfSource, max_pages: int, strategy: str = "first") -> tuple[List[int], int]:
+    """
+    Devuelve (índices de página a procesar, total de páginas del PDF).
+
+    - "first": las primeras `max_pages` páginas.
+    - "tables": las `max_pages` páginas con más pinta de tabla de resultados,
+      en orden de documento. Si ninguna puntúa, cae a "first".
+
+    Las páginas con capa de texto (filas con pinta de resultado) y las
+    escaneadas (píxeles de reglado) se puntúan en escalas distintas, así que
+    se ordenan por separado y se mezclan por puesto: la mejor de cada grupo,
+    luego la segunda de cada grupo (primero la que más se acerca a la mejor
+    de su grupo), etc.
+    """
+    pdf = pdfium.PdfDocument(source)
+    try:
+        total = len(pdf)
+        if strategy != "tables" or total <= max_pages:
+            return list(range(min(total, max_pages))), total
+
+        text_scores, raster_scores = [], []
+        for idx in range(min(total, SCAN_LIMIT)):
+            page = pdf[idx]
+            try:
+                score = _text_table_score(page)
+                if score is None:
+                    raster_scores.append((_raster_table_score(page), idx))
+                else:
+                    text_scores.append((score, idx))
+            finally:
+                page.close()
+
+        if not any(score for score, _ in text_scores + raster_scores):
+            return list(range(max_pages)), total
+
+        best = sorted(_by_rank(text_scores) + _by_rank(raster_scores))[:max_pages]
+        return sorted(entry[-1] for entry in best), total
+    finally:
+        pdf.close()
+
+
+# ---------------------------
+# Capa de texto embebida
+# ---------------------------
+
+def _group_lines(segments: List[tuple]) -> List[List[tuple]]:
+    """
+    Agrupa segmentos (x0, y0, x1, y1, texto) en líneas por solape vertical
+    y ordena cada línea de izquierda a derecha.
+    """
+    lines: List[List[tuple]] = []
+    bounds: List[List[float]] = []  # [top, bottom] de cada línea
+    for seg in sorted(segments, key=lambda s: ((s[1] + s[3]) / 2, s[0])):
+        y_mid = (seg[1] + seg[3]) / 2
+        if bounds and bounds[-1][0] <= y_mid <= bounds[-1][1]:
+            lines[-1].append(seg)
+            bounds[-1][0] = min(bounds[-1][0], seg[1])
+            bounds[-1][1] = max(bounds[-1][1], seg[3])
+        else:
+            lines.append([seg])
+            bounds.append([seg[1], seg[3]])
+    return [sorted(line, key=lambda s: s[0]) for line in lines]
+
+
+def _alnum(segments: List[tuple]) -> int:
+    return sum(ch.isalnum() for seg in segments for ch in seg[4])
+
+
+def _large_images(page, width: float, height: float) -> List[tuple]:
+    """Cajas (x0, y0, x1, y1), con origen arriba a la izquierda, de las imágenes grandes de la página."""
+    boxes = []
+    for obj in page.get_objects(filter=[pdfium_c.FPDF_PAGEOBJ_IMAGE]):
+        left, bottom, right, top = obj.get_pos()
+        if (right - left) * (top - bottom) >= MIN_IMAGE_AREA_FRAC * width * height:
+            boxes.append((left, height - top, right, height - bottom))
+    return boxes
+
+
+def _page_text_export(page, page_idx: int) -> Optional[dict]:
+    """
+    Exporta la capa de texto de una página con la misma forma que
+    `result.export()["pages"][i]` de docTR (bloques -> líneas -> palabras con
+    geometría relativa). Devuelve None si la página no tiene texto usable:
+    poco texto en el cuerpo (fuera de cabecera/pie) o una imagen grande sin
+    texto encima, que es un escaneo con solo la cabecera digital.
+    """
+    width, height = page.get_size()
+    textpage = page.get_textpage()
+    try:
+        full = textpage.get_text_range()
+        if sum(ch.isalnum() for ch in full) < MIN_TEXT_CHARS or full.count("\ufffd") > MAX_GARBAGE_RATIO * len(full):
+            return None
+
+        segments = []
+        for i in range(textpage.count_rects()):
+            left, bottom, right, top = textpage.get_rect(i)
+            text = " ".join(textpage.get_text_bounded(left, bottom, right, top).split())
+            if text:
+                # PDF tiene el origen abajo a la izquierda; docTR arriba a la izquierda
+                segments.append((left, height - top, right, height - bottom, text))
+    finally:
+        textpage.close()
+
+    body = [s for s in segments if MARGIN_FRAC * height <= (s[1] + s[3]) / 2 <= (1 - MARGIN_FRAC) * height]
+    if _alnum(body) < MIN_TEXT_CHARS:
+        return None
+    for x0, y0, x1, y1 in _large_images(page, width, height):
+        inside = [s for s in segments if x0 <= (s[0] + s[2]) / 2 <= x1 and y0 <= (s[1] + s[3]) / 2 <= y1]
+        if _alnum(inside) < MIN_TEXT_CHARS:
+            return None
+
+    def rel(x0, y0, x1, y1):
+        return ((x0 / width, y0 / height), (x1 / width, y1 / height))
+
+    lines = []
+    for line in _group_lines(segments):
+        words = [
+            {"value": text, "confidence": 1.0, "geometry": rel(x0, y0, x1, y1)}
+            for x0, y0, x1, y1, text in line
+        ]
+        lines.append({
+            "geometry": rel(
+                min(s[0] for s in line), min(s[1] for s in line),
+                max(s[2] for s in line), max(s[3] for s in line),
+            ),
+            "words": words,
+        })
+
+    return {
+        "page_idx": page_idx,
+        "dimensions": (int(height), int(width)),
+        "source": "text_layer",
+        "blocks": [{"geometry": ((0.0, 0.0), (1.0, 1.0)), "lines": lines}],
+    }
+
+
+def extract_text_layer(source: PdfSource, page_indices: List[int]) -> List[Optional[dict]]:
+    """
+    Export tipo docTR por página a partir de la capa de texto del PDF.
+    Las páginas escaneadas (sin texto usable) quedan en None y deben ir a OCR.
+    """
+    pdf = pdfium.PdfDocument(source)
+    try:
+        exports: List[Optional[dict]] = []
+        for idx in page_indices:
+            page = pdf[idx]
+            try:
+                exports.append(_page_text_export(page, idx))
+            finally:
+                page.close()
+        return exports
+    finally:
+        pdf.close()
+
+
+def render_pages(source: PdfSource, page_indices: List[int], scale: float = RENDER_SCALE) -> List[np.ndarray]:
+    """Rasteriza únicamente `page_indices` a arrays RGB uint8 (formato que espera docTR)."""
+    pdf = pdfium.PdfDocument(source)
+    try:
+        pages = []
+        for idx in page_indices:
+            page = pdf[idx]
+            try:
+                pages.append(page.render(scale=scale, rev_byteorder=True).to_numpy())
+            finally:
+                page.close()
+        return pages
+    finally:
+        pdf.close()
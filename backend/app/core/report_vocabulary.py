@@ -0,0 +1,117 @@
+# app/core/report_vocabulary.py
+"""
+Vocabulario de los reportes de laboratorio que NO son analitos: cabeceras de
+tabla, títulos de sección, datos administrativos y de paciente, métodos.
+
+Se carga una vez desde app/data/report_vocabulary.json (más un archivo extra
+opcional, OCR_VOCABULARY_EXTRA, para tokens propios de cada laboratorio) y
+se compila en una sola regex. Una pasada sobre la línea devuelve todas las
+categorías que aparecen, así que añadir tokens no añade un `in` más por fila.
+
+Formato del archivo:
+    {"contains": {"categoria": ["TOKEN", ...]},   # el token aparece en la línea
+     "exact":    {"categoria": ["TEXTO", ...]}}   # la línea completa es el texto
+"""
+import hashlib
+import json
+import re
+from pathlib import Path
+from typing import Callable, Dict, FrozenSet, Iterable, Optional, Set
+
+from app.core.config import settings
+
+DEFAULT_VOCABULARY_FILE = Path(__file__).resolve().parent.parent / "data" / "report_vocabulary.json"
+
+
+def _norm(token: str) -> str:
+    return " ".join(token.split()).upper()
+
+
+def _trie_pattern(tokens: Iterable[str]) -> str:
+    """
+    Alternativa de regex factorizada por prefijos (un trie): el motor de `re`
+    no comparte prefijos entre alternativas, así cada posición se descarta
+    mirando un carácter en lugar de probar todos los tokens.
+    """
+    trie: dict = {}
+    for tok in tokens:
+        node = trie
+        for ch in tok:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node: dict) -> str:
+        # El "?" es codicioso: en cada posición gana el token más largo
+        alts = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        optional = "" in node
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        if optional:
+            return "(?:" + body + ")?"
+        return body
+
+    return build(trie)
+
+
+class VocabularyMatcher:
+    def __init__(self, contains: Dict[str, Iterable[str]], exact: Dict[str, Iterable[str]]):
+        token_cats: Dict[str, Set[str]] = {}
+        for cat, tokens in contains.items():
+            for tok in tokens:
+                token_cats.setdefault(_norm(tok), set()).add(cat)
+
+        # Si un token contiene a otro, encontrarlo implica también las categorías del corto
+        # (en cada posición la regex se queda con la alternativa más larga)
+        self._contains: Dict[str, FrozenSet[str]] = {
+            tok: frozenset().union(*(cats for other, cats in token_cats.items() if other in tok))
+            for tok in token_cats
+        }
+        # Lookahead: coincidencias solapadas, una por posición de inicio
+        self._regex = re.compile(f"(?=({_trie_pattern(self._contains)}))") if self._contains else None
+
+        self._exact: Dict[str, FrozenSet[str]] = {}
+        for cat, texts in exact.items():
+            for text in texts:
+                key = _norm(text)
+                self._exact[key] = self._exact.get(key, frozenset()) | {cat}
+
+    def categories(self, up: str) -> FrozenSet[str]:
+        """Todas las categorías presentes en `up` (texto ya en mayúsculas y con espacios normalizados)."""
+        found = set(self._exact.get(up, ()))
+        if self._regex is not None:
+            for m in self._regex.finditer(up):
+                found |= self._contains[m.group(1)]
+        return frozenset(found)
+
+    def predicate(self, wanted: FrozenSet[str]) -> Callable[[str], bool]:
+        """
+        Función `up -> bool` que dice si aparece alguna de las categorías
+        `wanted`, compilada una vez: una búsqueda sobre la línea y, si esas
+        categorías tienen textos exactos, una consulta a un set.
+        """
+        tokens = [tok for tok, cats in self._contains.items() if not wanted.isdisjoint(cats)]
+        exact = frozenset(text for text, cats in self._exact.items() if not wanted.isdisjoint(cats))
+        search = re.compile(_trie_pattern(tokens)).search if tokens else (lambda up: None)
+        if not exact:
+            return lambda up: search(up) is not None
+        return lambda up: up in exact or search(up) is not None
+
+
+def load_vocabulary(extra_file: Optional[str] = None) -> tuple[VocabularyMatcher, str]:
+    """Matcher compilado + huella del vocabulario (entra en la versión de la caché de OCR)."""
+    contains: Dict[str, list] = {}
+    exact: Dict[str, list] = {}
+    digest = hashlib.sha256()
+    for path in filter(None, [DEFAULT_VOCABULARY_FILE, extra_file]):
+        raw = Path(path).read_bytes()
+        digest.update(raw)
+        data = json.loads(raw.decode("utf-8"))
+        for cat, tokens in data.get("contains", {}).items():
+            contains.setdefault(cat, []).extend(tokens)
+        for cat, texts in data.get("exact", {}).items():
+            exact.setdefault(cat, []).extend(texts)
+    return VocabularyMatcher(contains, exact), digest.hexdigest()[:12]
+
+
+report_vocabulary, VOCABULARY_VERSION = load_vocabulary(settings.OCR_VOCABULARY_EXTRA)
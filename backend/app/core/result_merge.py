@@ -0,0 +1,111 @@
+# app/core/result_merge.py
+"""
+Fusión de los resultados de laboratorio que llegan de varias fuentes: el
+borrador del parser local y los trozos del paso de extracción con Gemini
+(que se solapan y pueden repetir la misma fila).
+
+Cada resultado se canoniza (analito del catálogo o clave normalizada del
+nombre, valor, unidad, línea de origen). Las copias exactas se descartan
+por hash; los registros del mismo analito con valor y unidad compatibles
+(iguales o ausentes en uno) se fusionan en uno, quedándose con el más
+completo y rellenando sus huecos con los demás. El orden es el de la
+primera aparición, así que la lista final es estable entre ejecuciones.
+"""
+import hashlib
+import json
+from typing import Dict, List, Optional
+
+from app.core.analyte_catalog import analyte_catalog, analyte_key
+
+# Campos que cuentan para decidir qué registro está más completo
+RESULT_FIELDS = (
+    "group",
+    "code",
+    "value",
+    "value_as_string",
+    "unit",
+    "ref_low",
+    "ref_high",
+    "status",
+    "flag_from_lab",
+)
+
+
+def _is_empty(v) -> bool:
+    return v is None or v == "" or v == []
+
+
+def canonical_value(result: dict):
+    """Valor comparable: número redondeado o texto en mayúsculas ("Negativo" == "NEGATIVO")."""
+    v = result.get("value")
+    if _is_empty(v):
+        v = result.get("value_as_string")
+    if _is_empty(v):
+        return None
+    try:
+        return round(float(str(v).replace(",", ".")), 6)
+    except ValueError:
+        return " ".join(str(v).split()).upper()
+
+
+def canonical_unit(unit) -> Optional[str]:
+    if _is_empty(unit):
+        return None
+    return "".join(str(unit).split()).replace("µ", "u").lower()
+
+
+def analyte_identity(name: str) -> str:
+    analyte = analyte_catalog.resolve(name)
+    return f"code:{analyte.code}" if analyte is not None else f"key:{analyte_key(name)}"
+
+
+def completeness(result: dict) -> int:
+    return sum(not _is_empty(result.get(f)) for f in RESULT_FIELDS)
+
+
+def _merge_pair(kept: dict, new: dict) -> dict:
+    # Gana el más completo (a igualdad, el que llegó primero) y hereda lo que le falte
+    base, other = (new, kept) if completeness(new) > completeness(kept) else (kept, new)
+    merged = dict(base)
+    for field, value in other.items():
+        if _is_empty(merged.get(field)) and not _is_empty(value):
+            merged[field] = value
+    return merged
+
+
+def merge_lab_results(results: List[dict]) -> List[dict]:
+    """Resultados sin duplicados, uno por analito/valor, en orden de primera aparición."""
+    merged: List[dict] = []
+    canon: List[tuple] = []               # (valor, unidad) canónicos de cada registro fusionado
+    by_analyte: Dict[str, List[int]] = {}
+    seen = set()
+
+    for result in results:
+        if not isinstance(result, dict) or _is_empty(result.get("name")):
+            continue
+        ident = analyte_identity(str(result["name"]))
+        value = canonical_value(result)
+        unit = canonical_unit(result.get("unit"))
+        line = " ".join(str(result.get("line") or "").split())
+
+        digest = hashlib.sha1(
+            json.dumps([ident, value, unit, line], ensure_ascii=False).encode("utf-8")
+        ).digest()
+        if digest in seen:
+            continue
+        seen.add(digest)
+
+        for idx in by_analyte.get(ident, ()):
+            kept_value, kept_unit = canon[idx]
+            if (value is None or kept_value is None or value == kept_value) and (
+                unit is None or kept_unit is None or unit == kept_unit
+            ):
+                merged[idx] = _merge_pair(merged[idx], result)
+                canon[idx] = (canonical_value(merged[idx]), canonical_unit(merged[idx].get("unit")))
+                break
+        else:
+            by_analyte.setdefault(ident, []).append(len(merged))
+            merged.append(dict(result))
+            canon.append((value, unit))
+
+    return merged
@@ -0,0 +1,159 @@
+# app/core/table_layout.py
+"""
+Reconstrucción de la tabla de resultados a partir de la geometría de las
+palabras (export de docTR, capa de texto del PDF o Tesseract).
+
+docTR suele devolver cada columna de la tabla como líneas separadas, y el
+parser secuencial tiene que adivinar filas juntando 3-5 líneas seguidas.
+Aquí se usan las cajas: las palabras se agrupan en filas por su altura en la
+página, cada fila se parte en celdas por los huecos horizontales y las celdas
+numéricas se agrupan en columnas por su centro. Si hay una columna de valores
+con suficientes filas, cada fila alineada con ella se emite como
+"nombre valor rango unidad", listo para `parse_row_to_item`. Las líneas que
+no caen en esas filas (resultados de texto, notas) se devuelven aparte para
+que el parser secuencial las lea como siempre.
+
+Todo el agrupamiento es vectorizado con NumPy; solo se itera por celda para
+unir textos.
+"""
+import re
+from typing import List, Optional, Set, Tuple
+
+import numpy as np
+
+# Filas: palabras cuyo centro vertical está a menos de esta fracción de la altura media de palabra
+ROW_TOL = 0.5
+# Celdas: un hueco mayor que esta fracción de la altura de palabra separa celdas
+CELL_GAP = 1.2
+# Columnas: centros de celdas numéricas a menos de esto (en alturas de palabra) caen en la misma columna
+COL_TOL = 2.5
+# Mínimo de filas alineadas en la columna de valores para considerar que hay tabla
+MIN_TABLE_ROWS = 3
+
+VALUE_RE = re.compile(r"[<>]?\s*\d+(?:\.\d+)?")
+# Valor con su marca de anormalidad en la misma celda ("18.2 H", "3.1*", "9.8 (L)")
+FLAGGED_VALUE_RE = re.compile(r"(?P<value>[<>]?\s*\d+(?:\.\d+)?)\s*(?:[HL*]|\(?[HL]\)?)")
+RANGE_RE = re.compile(r"\d+(?:\.\d+)?\s*-\s*\d+(?:\.\d+)?|(?:<=|<|>=|>)\s*\d+(?:\.\d+)?")
+FLAG_RE = re.compile(r"[HL*]|\(?[HL]\)?")
+MAX_UNIT_LEN = 12
+
+KIND_TEXT, KIND_VALUE, KIND_RANGE, KIND_FLAG = 0, 1, 2, 3
+
+# Línea del export: (índice de bloque, índice de línea dentro del bloque)
+LineId = Tuple[int, int]
+
+
+def _cell_kind(text: str) -> int:
+    if VALUE_RE.fullmatch(text) or FLAGGED_VALUE_RE.fullmatch(text):
+        return KIND_VALUE
+    if RANGE_RE.fullmatch(text):
+        return KIND_RANGE
+    if FLAG_RE.fullmatch(text):
+        return KIND_FLAG
+    return KIND_TEXT
+
+
+def _value_text(text: str) -> str:
+    """Solo el número de una celda de valor: la marca se recalcula con el rango."""
+    m = FLAGGED_VALUE_RE.fullmatch(text)
+    return m.group("value") if m else text
+
+
+def _page_words(page: dict):
+    """(textos, cajas Nx4 en píxeles, línea de cada palabra) de todas las palabras de la página."""
+    height, width = page.get("dimensions") or (0, 0)
+    texts: List[str] = []
+    boxes: List[tuple] = []
+    line_ids: List[LineId] = []
+    for b, block in enumerate(page.get("blocks", [])):
+        for li, line in enumerate(block.get("lines", [])):
+            for w in line.get("words", []):
+                value = " ".join(w["value"].split())
+                if value:
+                    (x0, y0), (x1, y1) = w["geometry"]
+                    texts.append(value)
+                    boxes.append((x0 * width, y0 * height, x1 * width, y1 * height))
+                    line_ids.append((b, li))
+    return texts, np.asarray(boxes, dtype=np.float64).reshape(-1, 4), line_ids
+
+
+def table_rows(page: dict) -> Tuple[List[str], Set[LineId]]:
+    """
+    Filas "nombre valor [rango] [unidad]" de la tabla de resultados de la
+    página y las líneas del export que cubren, o ([], vacío) si la geometría
+    no muestra una tabla (o no es fiable).
+    """
+    # OpenOCR solo devuelve texto: su geometría es sintética
+    if page.get("source") == "openocr" or not all(page.get("dimensions") or (0, 0)):
+        return [], set()
+    texts, boxes, line_ids = _page_words(page)
+    if len(texts) < MIN_TABLE_ROWS * 2:
+        return [], set()
+
+    x0, y0, x1, y1 = boxes.T
+    word_h = float(np.median(y1 - y0)) or 1.0
+
+    # 1) Filas: orden vertical, corte donde el centro salta más que ROW_TOL alturas
+    yc = (y0 + y1) / 2
+    by_y = np.argsort(yc, kind="stable")
+    row_of = np.empty(len(texts), dtype=np.int64)
+    row_of[by_y] = np.concatenate(([0], np.cumsum(np.diff(yc[by_y]) > ROW_TOL * word_h)))
+
+    # 2) Celdas: dentro de cada fila, de izquierda a derecha, corte en huecos grandes
+    order = np.lexsort((x0, row_of))
+    gaps = x0[order][1:] - x1[order][:-1]
+    new_cell = np.concatenate(([True], (np.diff(row_of[order]) != 0) | (gaps > CELL_GAP * word_h)))
+    cell_of = np.cumsum(new_cell) - 1
+    starts = np.flatnonzero(new_cell)
+    ends = np.append(starts[1:], len(order))
+
+    n_cells = len(starts)
+    cell_row = row_of[order][starts]
+    cell_x0 = np.minimum.reduceat(x0[order], starts)
+    cell_x1 = np.maximum.reduceat(x1[order], starts)
+    cell_text = [" ".join(texts[i] for i in order[s:e]) for s, e in zip(starts, ends)]
+    cell_kind = np.fromiter((_cell_kind(t) for t in cell_text), dtype=np.int8, count=n_cells)
+
+    # 3) Columna(s) de valores: centros de las celdas numéricas agrupados en 1D
+    is_value = cell_kind == KIND_VALUE
+    if is_value.sum() < MIN_TABLE_ROWS:
+        return [], set()
+    value_idx = np.flatnonzero(is_value)
+    xc = (cell_x0[value_idx] + cell_x1[value_idx]) / 2
+    by_x = np.argsort(xc, kind="stable")
+    col = np.empty(len(value_idx), dtype=np.int64)
+    col[by_x] = np.concatenate(([0], np.cumsum(np.diff(xc[by_x]) > COL_TOL * word_h)))
+    col_rows = np.array([len(np.unique(cell_row[value_idx[col == c]])) for c in range(col.max() + 1)])
+    table_cols = np.flatnonzero(col_rows >= MIN_TABLE_ROWS)
+    if not len(table_cols):
+        return [], set()
+    in_table = np.zeros(n_cells, dtype=bool)
+    in_table[value_idx[np.isin(col, table_cols)]] = True
+
+    # 4) Una fila por fila de la página con valor en la columna de valores
+    rows: List[str] = []
+    emitted: List[int] = []
+    row_bounds = np.flatnonzero(np.concatenate(([True], np.diff(cell_row) != 0, [True])))
+    for rs, re_ in zip(row_bounds[:-1], row_bounds[1:]):
+        hits = np.flatnonzero(in_table[rs:re_])
+        if not len(hits):
+            continue
+        v = rs + int(hits[0])
+        # El nombre es la primera celda de la fila (las de en medio suelen ser el método)
+        if v == rs or cell_kind[rs] != KIND_TEXT or not any(ch.isalpha() for ch in cell_text[rs]):
+            continue
+        ref: Optional[str] = None
+        unit: Optional[str] = None
+        for c in range(v + 1, re_):
+            if cell_kind[c] == KIND_RANGE and ref is None:
+                ref = cell_text[c]
+            elif cell_kind[c] == KIND_TEXT and unit is None and len(cell_text[c]) <= MAX_UNIT_LEN:
+                unit = cell_text[c]
+        rows.append(" ".join(p for p in (cell_text[rs], _value_text(cell_text[v]), ref, unit) if p))
+        emitted.append(int(cell_row[rs]))
+    if len(rows) < MIN_TABLE_ROWS:
+        return [], set()
+
+    # Líneas con alguna palabra en una fila emitida; el resto queda para el parser secuencial
+    covered = {line_ids[i] for i in np.flatnonzero(np.isin(row_of, emitted))}
+    return rows, covered
@@ -0,0 +1,192 @@
+# app/core/uploads.py
+"""
+Ingesta de archivos subidos con memoria acotada.
+
+Los `UploadFile` se leen por trozos, aplicando el límite por archivo y por
+petición MIENTRAS se leen (413 en cuanto se pasa). Lo pequeño queda en
+memoria; lo que supera OCR_SPOOL_THRESHOLD_KB se vuelca a un archivo
+temporal y al resto del pipeline (pypdfium2, docTR, Storage) se le pasa la
+ruta, no otra copia en `bytes`. El SHA-256 se calcula en la misma pasada.
+La escritura del temporal va en un hilo para no bloquear el event loop.
+
+Starlette parsea el multipart entero antes de llegar al endpoint, así que
+UploadSizeLimitMiddleware corta antes: 413 por Content-Length o, si no lo
+hay (chunked), en cuanto el cuerpo recibido pasa del límite.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from typing import List, Optional, Union
+
+from fastapi import HTTPException, UploadFile
+
+from app.core.config import settings
+
+CHUNK_SIZE = 1024 * 1024
+# Margen para los separadores y cabeceras del multipart sobre OCR_MAX_REQUEST_MB
+MULTIPART_OVERHEAD = 1024 * 1024
+
+# Lo que consumen pypdfium2, OpenCV, docTR y storage3: bytes en memoria o ruta a archivo
+FileSource = Union[bytes, str]
+
+
+class SpooledUpload:
+    def __init__(self, filename: str, source: FileSource, size: int, sha256: str):
+        self.filename = filename
+        self.source = source
+        self.size = size
+        self.sha256 = sha256
+        self._refs = 1
+        self._lock = threading.Lock()
+
+    @property
+    def on_disk(self) -> bool:
+        return isinstance(self.source, str)
+
+    def read_bytes(self) -> bytes:
+        if not self.on_disk:
+            return self.source
+        with open(self.source, "rb") as fh:
+            return fh.read()
+
+    def acquire(self) -> "SpooledUpload":
+        """Otro consumidor (p. ej. una subida diferida) necesita el archivo más tiempo."""
+        with self._lock:
+            self._refs += 1
+        return self
+
+    def release(self) -> None:
+        """Borra el temporal cuando el último consumidor termina."""
+        with self._lock:
+            self._refs -= 1
+            if self._refs > 0 or not self.on_disk:
+                return
+        try:
+            os.unlink(self.source)
+        except OSError:
+            pass
+
+
+def release_all(uploads: List[SpooledUpload]) -> None:
+    for up in uploads:
+        up.release()
+
+
+async def spool_upload_files(
+    files: List[UploadFile],
+    max_file_bytes: Optional[int] = None,
+    max_request_bytes: Optional[int] = None,
+    spool_threshold: Optional[int] = None,
+) -> List[SpooledUpload]:
+    max_file_bytes = max_file_bytes or settings.OCR_MAX_FILE_MB * 1024 * 1024
+    max_request_bytes = max_request_bytes or settings.OCR_MAX_REQUEST_MB * 1024 * 1024
+    spool_threshold = spool_threshold or settings.OCR_SPOOL_THRESHOLD_KB * 1024
+
+    uploads: List[SpooledUpload] = []
+    request_total = 0
+    try:
+        for f in files:
+            digest = hashlib.sha256()
+            size = 0
+            buffer = bytearray()
+            spool = None
+            try:
+                while True:
+                    chunk = await f.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    # Asegurarse que leemos bytes
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode("utf-8")
+                    size += len(chunk)
+                    request_total += len(chunk)
+                    if size > max_file_bytes:
+                        raise HTTPException(
+                            status_code=413,
+                            detail=f"{f.filename} supera {max_file_bytes // (1024 * 1024)}MB",
+                        )
+                    if request_total > max_request_bytes:
+                        raise HTTPException(
+                            status_code=413,
+                            detail=f"Los archivos superan {max_request_bytes // (1024 * 1024)}MB en total",
+                        )
+                    digest.update(chunk)
+
+                    if spool is None and len(buffer) + len(chunk) > spool_threshold:
+                        spool = await asyncio.to_thread(tempfile.NamedTemporaryFile, prefix="ocr_", delete=False)
+                        await asyncio.to_thread(spool.write, buffer)
+                        buffer = bytearray()
+                    if spool is not None:
+                        await asyncio.to_thread(spool.write, chunk)
+                    else:
+                        buffer.extend(chunk)
+            except BaseException:
+                if spool is not None:
+                    spool.close()
+                    os.unlink(spool.name)
+                raise
+
+            if spool is not None:
+                await asyncio.to_thread(spool.close)
+                source: FileSource = spool.name
+            else:
+                source = bytes(buffer)
+            uploads.append(SpooledUpload(f.filename, source, size, digest.hexdigest()))
+            await f.seek(0)
+    except BaseException:
+        release_all(uploads)
+        raise
+
+    return uploads
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Rechaza con 413 las subidas multipart que superan OCR_MAX_REQUEST_MB antes
+    de que Starlette las lea enteras (a memoria o a disco).
+    """
+
+    def __init__(self, app, max_body_bytes: Optional[int] = None):
+        self.app = app
+        self.max_body_bytes = max_body_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope.get("headers") or [])
+        if not headers.get(b"content-type", b"").startswith(b"multipart/form-data"):
+            return await self.app(scope, receive, send)
+
+        max_mb = settings.OCR_MAX_REQUEST_MB
+        limit = self.max_body_bytes or max_mb * 1024 * 1024 + MULTIPART_OVERHEAD
+        detail = f"Los archivos superan {max_mb}MB en total"
+        try:
+            declared = int(headers.get(b"content-length", b"-1"))
+        except ValueError:
+            declared = -1
+        if declared > limit:
+            body = json.dumps({"detail": detail}).encode()
+            await send({
+                "type": "http.response.start",
+                "status": 413,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                # FastAPI deja pasar la HTTPException del parseo del cuerpo: sale como 413
+                if received > limit:
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
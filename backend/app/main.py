@@ -1,10 +1,37 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from .core.config import settings
+from .core.ocr_pool import ocr_pool
+from .core.ocr_batcher import ocr_batcher
+from .core.ocr_jobs import ocr_jobs
+from .core.ocr_engines import close_engines
+from .core.uploads import UploadSizeLimitMiddleware
 from .routers import auth_guard, users, auth, centros_medicos, especialistas, historial, files, ocr_local as ocr, parse_llm
+from .routers import ocr as openocr
+
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # El modelo se calienta en segundo plano: /health responde ya, /ready cuando termine
+    warmup_task = None
+    if settings.OCR_WARMUP:
+        warmup_task = asyncio.create_task(ocr_pool.warmup())
+    else:
+        ocr_pool.ready = True
+    yield
+    if warmup_task is not None:
+        warmup_task.cancel()
+    ocr_jobs.shutdown()
+    ocr_batcher.shutdown()
+    ocr_pool.shutdown()
+    await close_engines()
 
-app = FastAPI(title=settings.API_NAME, version=settings.API_VERSION)
+
+app = FastAPI(title=settings.API_NAME, version=settings.API_VERSION, lifespan=lifespan)
 
 # Ajusta origins según tu frontend (si ya lo tienes)
 app.add_middleware(
@@ -14,6 +41,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# 413 antes de que Starlette lea el multipart entero
+app.add_middleware(UploadSizeLimitMiddleware)
 
 app.include_router(auth_guard.router)
 app.include_router(users.router)
@@ -23,6 +52,7 @@ app.include_router(especialistas.router)
 app.include_router(historial.router)
 app.include_router(files.router)
 app.include_router(ocr.router)
+app.include_router(openocr.router)
 app.include_router(parse_llm.router)
 
 
@@ -30,6 +60,16 @@ app.include_router(parse_llm.router)
 def health():
     return {"status": "ok"}
 
+@app.get("/ready")
+def ready():
+    """Listo para recibir tráfico solo cuando el modelo de OCR está caliente."""
+    if not ocr_pool.ready:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "warming_up", "error": ocr_pool.warmup_error, "attempts": ocr_pool.warmup_attempts},
+        )
+    return {"status": "ready"}
+
 @app.get("/")
 def root():
     return {"message": ""}
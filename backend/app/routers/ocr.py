@@ -1,13 +1,20 @@
+from contextlib import nullcontext
+
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from app.core.config import settings
 from app.core.security import get_current_user, AuthUser
-import httpx
+from app.core.ocr_engines import OCREngineError, openocr_engine
+from app.core.uploads import release_all, spool_upload_files
 
 router = APIRouter(prefix="/ocr", tags=["ocr"])
 
 
+def _check_openocr():
+    if not openocr_engine.available():
+        raise HTTPException(503, "OpenOCR no configurado (OPENOCR_URL)")
+
+
 @router.post("/from-url")
-def ocr_from_url(
+async def ocr_from_url(
     image_url: str = Form(...),
     lang: str = Form("spa+eng"),
     user: AuthUser = Depends(get_current_user),
@@ -16,6 +23,7 @@ def ocr_from_url(
     Envía un JSON a OpenOCR con img_url y devuelve el texto crudo.
     Requiere que la URL sea accesible por el servidor de OpenOCR.
     """
+    _check_openocr()
     payload = {
         "img_url": image_url,
         "engine": "tesseract",
@@ -24,9 +32,9 @@ def ocr_from_url(
     }
 
     try:
-        r = httpx.post(f"{OPENOCR_URL}/ocr", json=payload, timeout=60)
-    except httpx.RequestError as e:
-        raise HTTPException(502, f"OpenOCR no accesible: {e}")
+        r = await openocr_engine.post("/ocr", json=payload)
+    except OCREngineError as e:
+        raise HTTPException(502, str(e))
 
     if r.status_code != 200:
         raise HTTPException(r.status_code, f"OpenOCR error: {r.text}")
@@ -36,7 +44,7 @@ def ocr_from_url(
 
 
 @router.post("/from-file")
-def ocr_from_file(
+async def ocr_from_file(
     file: UploadFile = File(...),
     lang: str = Form("spa+eng"),
     user: AuthUser = Depends(get_current_user),
@@ -45,17 +53,21 @@ def ocr_from_file(
     Sube archivo a OpenOCR usando multipart hacia /ocr-file-upload
     y devuelve el texto resultante.
     """
-    files = {
-        # campo 'file' con (filename, fileobj, mimetype)
-        "file": (file.filename, file.file, file.content_type or "application/octet-stream"),
-        # campo 'config' en JSON mínimo; OpenOCR parsea este multipart
-        "config": (None, '{"engine":"tesseract","tesseract_lang":"%s"}' % lang, "application/json"),
-    }
-
+    _check_openocr()
+    # Mismos límites de tamaño y volcado a disco que /ocr-local (ver app.core.uploads)
+    uploads = await spool_upload_files([file])
+    up = uploads[0]
     try:
-        r = httpx.post(f"{OPENOCR_URL}/ocr-file-upload", files=files, timeout=None)
-    except httpx.RequestError as e:
-        raise HTTPException(502, f"OpenOCR no accesible: {e}")
+        # Si se volcó a disco, httpx envía el archivo por trozos en lugar de cargarlo entero
+        with (open(up.source, "rb") if up.on_disk else nullcontext(up.source)) as content:
+            files = openocr_engine.upload_fields(
+                up.filename, content, file.content_type or "application/octet-stream", lang
+            )
+            r = await openocr_engine.post("/ocr-file-upload", files=files)
+    except OCREngineError as e:
+        raise HTTPException(502, str(e))
+    finally:
+        release_all(uploads)
 
     if r.status_code != 200:
         raise HTTPException(r.status_code, f"OpenOCR error: {r.text}")
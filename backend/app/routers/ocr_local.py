@@ -1,24 +1,36 @@
+import asyncio
 import io
 import re
-from typing import List, Optional
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, List, Optional, Set, Tuple, Union
 import os
 import uuid
 import json
 from datetime import date
 from typing import Dict
 
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from supabase import create_client, Client
-from doctr.io import DocumentFile
-from doctr.models import ocr_predictor
-
-# Eliminamos openai e importamos google-generativeai
-import google.generativeai as genai
 
 from dotenv import load_dotenv
 from app.core.security import get_current_user, AuthUser
 from app.core.config import settings
+from app.core.ocr_pool import ocr_pool, OCRPoolBusy, resolve_profile
+from app.core.ocr_batcher import ocr_batcher
+from app.core.ocr_engines import OCREngineError, engines_stats, get_engine, resolve_engine
+from app.core.ocr_cache import ocr_cache
+from app.core.ocr_jobs import ocr_jobs, Job, JobStoreFull
+from app.core.pdf_pages import select_pages, extract_text_layer
+from app.core.report_vocabulary import VOCABULARY_VERSION, report_vocabulary
+from app.core.analyte_catalog import CATALOG_VERSION, analyte_catalog, analyte_key
+from app.core.table_layout import table_rows
+from app.core.llm_cache import llm_cache
+from app.core.llm_client import llm_client
+from app.core.image_preprocess import preprocess_images
+from app.core.uploads import FileSource, SpooledUpload, spool_upload_files, release_all
 
 load_dotenv()
 
@@ -28,21 +40,30 @@ load_dotenv()
 # Asegúrate de tener GOOGLE_API_KEY en tu archivo .env
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
-# Variable de control para saber si podemos usar la IA
-gemini_configured = False
+# Variable de control para saber si podemos usar la IA (None = aún no se intentó)
+_gemini_configured: Optional[bool] = None
 
 if not GOOGLE_API_KEY:
     # No rompemos el servidor aquí, solo avisamos en consola
     print("[Gemini] WARNING: GOOGLE_API_KEY no configurada. "
           "Los endpoints que usan la IA devolverán error 500.")
-else:
-    # Configuramos la librería globalmente
-    genai.configure(api_key=GOOGLE_API_KEY)
-    gemini_configured = True
 
 
-
-print("[OCR] Module LOADED successfully. Gemini configured:", gemini_configured)
+def configure_gemini() -> bool:
+    """
+    Configura google-generativeai la primera vez que se necesita (no al
+    importar el módulo: importar la librería ya cuesta tiempo y memoria).
+    """
+    global _gemini_configured
+    if _gemini_configured is None:
+        if not GOOGLE_API_KEY:
+            _gemini_configured = False
+        else:
+            import google.generativeai as genai
+            # Configuramos la librería globalmente
+            genai.configure(api_key=GOOGLE_API_KEY)
+            _gemini_configured = True
+    return _gemini_configured
 
 router = APIRouter(prefix="/ocr-local", tags=["OCR local"])
 
@@ -150,6 +171,13 @@ Instrucciones:
 3. NO inventes datos. Si no está en el texto, usa null.
 4. Devuelve SOLO JSON. Nada de markdown.
 5. IMPORTANTE: Si el texto contiene comillas dobles ("), ESCÁPALAS con backslash (\"). Ejemplo: "Hemoglobina \"A\"" en lugar de "Hemoglobina "A"".
+6. Si la entrada trae "rows" en lugar de "ocr_text", es una tabla compacta con una fila por renglón:
+   "H|texto" es cabecera del reporte (úsala solo para patient_profile y lab_metadata) y
+   "S|texto" es el título de la sección de las filas que siguen (úsalo como "group") y
+   "<id>|texto" es una fila candidata a resultado. En "line" copia el texto de la fila, sin el id.
+   Las filas sin números son resultados de texto (p. ej. "COLOR AMARILLO", "NITRITOS NEGATIVO"):
+   el valor va en "value_as_string". Si una fila trae solo el nombre y otra de la misma sección
+   solo el valor, júntalas en un resultado.
 """
 
 LLM_ANALYSIS_PROMPT = """
@@ -276,13 +304,36 @@ class OCRResponse(BaseModel):
     analysis_input: Optional[AnalysisInput] = None
 
 
+class OCRJobStatus(BaseModel):
+    job_id: str
+    status: str                          # "queued", "running", "done", "error"
+    created_at: float
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+    error_status: Optional[int] = None   # código HTTP que habría devuelto /pdf
+    result: Optional[OCRResponse] = None
+
 
 # ---------------------------
-# Modelo de docTR
+# Modelo de docTR (vive en los procesos de app.core.ocr_pool)
 # ---------------------------
 
-OCR_PREDICTOR = ocr_predictor(pretrained=True)
-MAX_PAGES = 5
+MAX_PAGES = settings.OCR_MAX_PAGES
+
+# Súbelo cuando cambie el parser (reglas de filas, nombres, unidades): invalida la caché de OCR
+PARSER_VERSION = "3"
+OCR_PIPELINE_VERSION = (
+    f"parser:{PARSER_VERSION}:{VOCABULARY_VERSION}:{CATALOG_VERSION}"
+    f"|pages:{MAX_PAGES}:{settings.OCR_PAGE_SELECTION}|text_layer:{settings.OCR_TEXT_LAYER}"
+    f"|layout:{settings.OCR_TABLE_LAYOUT}"
+    f"|img:{settings.OCR_IMAGE_PREPROCESS}:{settings.OCR_IMAGE_MAX_SIDE}"
+    f":{settings.OCR_IMAGE_NORMALIZE}:{settings.OCR_IMAGE_DESKEW}"
+)
+
+
+def ocr_cache_version(profile: str, engine: str) -> str:
+    """Versión de modelo + parser que forma parte de la clave de la caché de OCR."""
+    return f"{OCR_PIPELINE_VERSION}|{get_engine(engine).version(profile)}"
 
 
 # ---------------------------
@@ -290,15 +341,20 @@ MAX_PAGES = 5
 # ---------------------------
 
 def normalize_whitespace(s: str) -> str:
-    return re.sub(r"\s+", " ", s).strip()
+    # Mismo resultado que re.sub(r"\s+", " ", s).strip(), sin pasar por el motor de regex
+    return " ".join(s.split())
+
+
+def clean_line(ln: str) -> str:
+    ln = ln.replace("\u00a0", " ")
+    ln = ln.replace("µ", "u")  # homogeneizar µ -> u
+    return normalize_whitespace(ln)
 
 
 def preclean_lines(lines: List[str]) -> List[str]:
     cleaned = []
     for ln in lines:
-        ln = ln.replace("\u00a0", " ")
-        ln = ln.replace("µ", "u")  # homogeneizar µ -> u
-        ln = normalize_whitespace(ln)
+        ln = clean_line(ln)
         if not ln:
             continue
         cleaned.append(ln)
@@ -306,168 +362,148 @@ def preclean_lines(lines: List[str]) -> List[str]:
 
 
 NUM_RE = re.compile(r"[<>]?\d+(?:\.\d+)?")
+VALUE_ONLY_RE = re.compile(r"[<>]?\s*\d+(?:\.\d+)?")
+RANGE_ONLY_RE = re.compile(r"\d+(?:\.\d+)?\s*-\s*\d+(?:\.\d+)?")
+FULL_ROW_RE = re.compile(
+    r"^(.+?)\s+([<>]?\d+(?:\.\d+)?)\s+(\d+(?:\.\d+)?)\s*-\s*(\d+(?:\.\d+)?)(?:\s+\S.+)?$"
+)
+
+UNIT_TOKENS = (
+    "G/DL",
+    "MG/DL",
+    "U/L",
+    "FL",
+    "PG",
+    "%",
+    "UG/G",
+    "UG/GL",
+    "10*3/UL",
+    "10:3/UL",
+    "10-3/UL",
+    "10*6/UL",
+    "MM/1H",
+    "P/C",
+)
+
+# Métodos que a veces preceden al nombre del analito en su propia línea
+METHOD_HINTS = ("ENZIM", "COLORIM", "CITOM", "INMUNOTURB", "CLIA")
+
+UNIT_TOKENS_RE = re.compile("|".join(re.escape(u) for u in UNIT_TOKENS))
+METHOD_HINTS_RE = re.compile("|".join(METHOD_HINTS))
 
 
 def is_value_only(s: str) -> bool:
-    s = normalize_whitespace(s)
-    return re.fullmatch(r"[<>]?\s*\d+(?:\.\d+)?", s) is not None
+    return VALUE_ONLY_RE.fullmatch(normalize_whitespace(s)) is not None
 
 
 def is_range_only(s: str) -> bool:
-    s = normalize_whitespace(s)
-    return re.fullmatch(r"\d+(?:\.\d+)?\s*-\s*\d+(?:\.\d+)?", s) is not None
+    return RANGE_ONLY_RE.fullmatch(normalize_whitespace(s)) is not None
 
 
 def is_unit_like(s: str) -> bool:
-    up = s.upper().replace(" ", "")
-    candidates = [
-        "G/DL",
-        "MG/DL",
-        "U/L",
-        "FL",
-        "PG",
-        "%",
-        "UG/G",
-        "UG/GL",
-        "10*3/UL",
-        "10:3/UL",
-        "10-3/UL",
-        "10*6/UL",
-        "MM/1H",
-        "P/C",
-    ]
-    return any(c in up for c in candidates)
+    return UNIT_TOKENS_RE.search(s.upper().replace(" ", "")) is not None
 
 
 def looks_like_full_row(line: str) -> bool:
-    s = normalize_whitespace(line)
-    m = re.match(
-        r"^(.+?)\s+([<>]?\d+(?:\.\d+)?)\s+(\d+(?:\.\d+)?)\s*-\s*(\d+(?:\.\d+)?)(?:\s+\S.+)?$",
-        s,
+    return FULL_ROW_RE.match(normalize_whitespace(line)) is not None
+
+
+# ---------------------------
+# Lexer de líneas
+# ---------------------------
+# Cada línea limpia se clasifica UNA sola vez; el armado de filas y el parseo
+# trabajan sobre estos tokens en lugar de re-normalizar y volver a pasar las
+# mismas regex por la ventana de 5 líneas en cada paso.
+
+@dataclass(slots=True)
+class LineToken:
+    text: str                # línea limpia (espacios normalizados)
+    upper: str
+    kind: str                # "patient" | "full_row" | "value" | "range" | "text"
+    numbers: Tuple[str, ...]  # números tal cual aparecen (NUM_RE)
+    unit_like: bool
+    method_hint: bool
+
+
+@dataclass(slots=True)
+class CandidateRow:
+    text: str
+    upper: str
+    single_line: bool        # una sola línea ya descartada como dato de paciente
+
+
+def lex_line(text: str) -> LineToken:
+    """Clasifica una línea ya limpia (ver clean_line)."""
+    up = text.upper()
+    if _is_patient_upper(up):
+        kind = "patient"
+    elif FULL_ROW_RE.match(text):
+        kind = "full_row"
+    elif VALUE_ONLY_RE.fullmatch(text):
+        kind = "value"
+    elif RANGE_ONLY_RE.fullmatch(text):
+        kind = "range"
+    else:
+        kind = "text"
+    return LineToken(
+        text=text,
+        upper=up,
+        kind=kind,
+        numbers=tuple(NUM_RE.findall(text)),
+        unit_like=UNIT_TOKENS_RE.search(up.replace(" ", "")) is not None,
+        method_hint=METHOD_HINTS_RE.search(up) is not None,
     )
-    return m is not None
+
+
+def lex_lines(lines: List[str]) -> List[LineToken]:
+    """Limpia y clasifica las líneas crudas de OCR (descarta las vacías)."""
+    tokens = []
+    for ln in lines:
+        ln = clean_line(ln)
+        if ln:
+            tokens.append(lex_line(ln))
+    return tokens
+
+
+def split_sections(tokens: List[LineToken]) -> List[Tuple[Optional[str], List[LineToken]]]:
+    """(título, líneas) por sección; lo anterior al primer título va con título None."""
+    sections: List[Tuple[Optional[str], List[LineToken]]] = [(None, [])]
+    for tok in tokens:
+        if tok.kind == "text" and not tok.numbers and _is_section_upper(tok.upper):
+            sections.append((tok.text, []))
+        else:
+            sections[-1][1].append(tok)
+    return [sec for sec in sections if sec[1]]
 
 
 # ---------------------------
 # Nombres que NO son analitos
 # ---------------------------
 
+# Compilados una vez a partir de app/data/report_vocabulary.json
+_is_patient_upper = report_vocabulary.predicate(frozenset({"patient"}))
+_is_section_upper = report_vocabulary.predicate(frozenset({"section"}))
+_is_banned_upper = report_vocabulary.predicate(
+    frozenset({"table_header", "section", "admin", "narrative", "method"})
+)
+
+
 def is_patient_line(line: str) -> bool:
-    up = line.upper()
-    if "SR(A)" in up or "CED/PAS" in up:
-        return True
-    if "FEC NAC" in up or "EDAD" in up or "SEXO" in up:
-        return True
-    if "TEL." in up or "TEL:" in up or "TELEF" in up:
-        return True
-    if "LABORATORIO CLINICO" in up or "LABORATORIO CLÍNICO" in up:
-        return True
-    return False
+    return _is_patient_upper(line.upper())
 
 
-def is_banned_name(name: str) -> bool:
-    up = normalize_whitespace(name).upper()
-
-    # Encabezados genéricos de tabla
-    header_tokens = [
-        "DETERMINACION",
-        "DETERMINACIÓN",
-        "METODO",
-        "MÉTODO",
-        "RESULTADO",
-        "INTERVALO",
-        "UNIDADES",
-        "DE REFERENCIA",
-        "UNIDAD DE MEDIDA",
-        "TIPO MUESTRA",
-    ]
-    if any(tok in up for tok in header_tokens):
-        return True
-
-    # Títulos de secciones (no son analitos)
-    section_titles = [
-        "HEMOGRAMA",
-        "RECUENTO DIFERENCIAL",
-        "RECUENTO DIFERENCIAL:",
-        "DIGESTION MATERIAS FECALES",
-        "DIGESTIÓN MATERIAS FECALES",
-        "EXAMEN MACROSCOPICO",
-        "EXAMEN MACROSCÓPICO",
-        "EXAMEN MICROSCOPICO",
-        "EXAMEN MICROSCÓPICO",
-        "EXAMEN QUIMICO",
-        "EXAMEN QUÍMICO",
-        "INVESTIGACION PARASITOS",
-        "INVESTIGACIÓN PARÁSITOS",
-    ]
-    if up in section_titles:
-        return True
-
-    # Coincidencias parciales de secciones
-    partial_section = [
-        "EXAMEN MICROSC",
-        "EXAMEN MACROSC",
-        "DIGESTION MATERIAS",
-        "DIGESTIÓN MATERIAS",
-        "RECUENTO DIFERENCIAL",
-    ]
-    if any(tok in up for tok in partial_section):
-        return True
-
-    # Cosas de cabecera / admin
-    patient_tokens = [
-        "SR(A)",
-        "SR.",
-        "SRA.",
-        "FEC NAC",
-        "EDAD",
-        "SEXO",
-        "CED/PAS",
-        "TEL.",
-        "TEL:",
-        "TELEF",
-        "REFERENCIA LABORATORIO",
-        "INFORME DE RESULTADO",
-        "INFORME DE RESULTADO(S)",
-        "PAGINA:",
-        "PÁGINA:",
-        "RNC:",
-        "NO.",
-        "COLECCION:",
-        "COLECCIÓN:",
-        "RECEPCION:",
-        "RECEPCIÓN:",
-        "REPORTE",
-        "VALORES CRITICOS",
-        "VALORES CRÍTICOS",
-        "SERIAL: NO.R",
-        "TOMA DE MUESTRACS",
-        "HUMANO SEGUROS",
-    ]
-    if any(tok in up for tok in patient_tokens):
-        return True
-
-    # Nombres que son solo métodos
-    method_only = {
-        "ENZIMATICO",
-        "COLORIMETRICO",
-        "COLORIMÉTRICO",
-        "CALCULO",
-        "CINETICO",
-        "CINÉTICO",
-        "CITOM. DE FLUJO",
-        "INMUNOTURBID.",
-        "INMUNOTURBID",
-        "COLORIME TRICO",
-    }
-    if up in method_only:
-        return True
+def is_section_title(line: str) -> bool:
+    """Título de sección del reporte (HEMOGRAMA, EXAMEN MICROSCÓPICO...): sin números."""
+    s = normalize_whitespace(line)
+    return bool(s) and NUM_RE.search(s) is None and _is_section_upper(s.upper())
 
-    # Líneas tipo "SE OBSERVA BLASTOCYSTIS..." las descartamos por ahora
-    if "SE OBSERVA BLASTOCYSTIS" in up:
-        return True
 
-    return False
+def is_banned_name(name: str) -> bool:
+    """
+    Cabeceras de tabla, títulos de sección, datos de paciente/administrativos
+    y métodos sueltos (ver app/data/report_vocabulary.json).
+    """
+    return _is_banned_upper(normalize_whitespace(name).upper())
 
 
 # ---------------------------
@@ -498,99 +534,18 @@ def normalize_unit(unit: Optional[str]) -> Optional[str]:
 # ---------------------------
 
 def normalize_name(name_raw: str) -> str:
+    """Nombre canónico del catálogo de analitos (ver app.core.analyte_catalog) o el leído tal cual."""
     base = normalize_whitespace(name_raw)
-    up = base.upper()
-
-    mapping = {
-        "G. ROJOS": "GLOBULOS ROJOS",
-        "G ROJOS": "GLOBULOS ROJOS",
-        "G. BLANCOS": "GLOBULOS BLANCOS",
-        "G BLANCOS": "GLOBULOS BLANCOS",
-        "HEI MOGLOBINA": "HEMOGLOBINA",
-        "EOSINOF ILOS": "EOSINOFILOS",
-        "EOSINOF ILOS(#)": "EOSINOFILOS(#)",
-        "EOSINOFI ILOS(#)": "EOSINOFILOS(#)",
-        "BASOF ILOS": "BASOFILOS",
-    }
-
-    return mapping.get(up, base)
-
-# ---------------------------
-# Agrupación y códigos de pruebas
-# ---------------------------
-
-NAME_TO_GROUP: Dict[str, str] = {
-    # Hemograma
-    "HEMOGLOBINA": "Hemograma",
-    "HEMATOCRITO": "Hemograma",
-    "GLOBULOS ROJOS": "Hemograma",
-    "GLOBULOS BLANCOS": "Hemograma",
-    "PLAQUETAS": "Hemograma",
-    "VCM": "Hemograma",
-    "HCM": "Hemograma",
-    "CHCM": "Hemograma",
-    "RDW-CV": "Hemograma",
-    "NEUTROF: ILOS": "Hemograma",
-    "NEUTROF: ILOS(#)": "Hemograma",
-    "LINFOCITOS": "Hemograma",
-    "LINFOCITOS(#)": "Hemograma",
-    "MONOCITOS": "Hemograma",
-    "MONOCITOS(#)": "Hemograma",
-    "EOSINOFILOS": "Hemograma",
-    "EOSINOFILOS(#)": "Hemograma",
-    "BASOFILOS": "Hemograma",
-    "BASOFILOS(#)": "Hemograma",
-
-    # Perfil hepático
-    "AST (SGOT)": "Perfil hepático",
-    "ALT (SGPT)": "Perfil hepático",
-    "PROTEINAS TOTALES": "Perfil hepático",
-    "PROTEINAS TOTALES ": "Perfil hepático",  # por si acaso
-    "ALBUMINA": "Perfil hepático",
-    "AL BUMINA": "Perfil hepático",
-    "GLOBULINAS": "Perfil hepático",
-    "RELACION A/G": "Perfil hepático",
-
-    # Función renal
-    "CREATININA": "Función renal",
-    "BUN": "Función renal",
-    "TASA FILTRACION G.(EGFR)": "Función renal",
-
-    # Metabolismo de carbohidratos
-    "GLUCOSA": "Metabolismo de carbohidratos",
-
-    # Gastrointestinal / heces
-    "CALPROTECTINA FECAL": "Gastrointestinal",
-    "DIGESTION MATERIAS FECALES": "Gastrointestinal",
-    "DIGESTIÓN MATERIAS FECALES": "Gastrointestinal",
-}
-
-NAME_TO_CODE: Dict[str, str] = {
-    "HEMOGLOBINA": "HGB",
-    "HEMATOCRITO": "HCT",
-    "GLOBULOS ROJOS": "RBC",
-    "GLOBULOS BLANCOS": "WBC",
-    "PLAQUETAS": "PLT",
-    "VCM": "MCV",
-    "HCM": "MCH",
-    "CHCM": "MCHC",
-    "RDW-CV": "RDW",
-    "AST (SGOT)": "AST",
-    "ALT (SGPT)": "ALT",
-    "CREATININA": "CREAT",
-    "GLUCOSA": "GLU",
-    "BUN": "BUN",
-    "CALPROTECTINA FECAL": "CALPROT",
-}
+    analyte = analyte_catalog.resolve(base)
+    return analyte.name if analyte is not None else base
 
 # ---------------------------
 # Construcción de filas tipo tabla
 # ---------------------------
 def lab_item_to_lab_result(item: LabItem) -> LabResult:
-    up_name = normalize_whitespace(item.name).upper()
-
-    group = NAME_TO_GROUP.get(up_name)
-    code = NAME_TO_CODE.get(up_name)
+    analyte = analyte_catalog.resolve(item.name)
+    group = analyte.group if analyte else None
+    code = analyte.code if analyte else None
 
     ref_low = item.ref_range.min if item.ref_range else None
     ref_high = item.ref_range.max if item.ref_range else None
@@ -642,89 +597,87 @@ def build_analysis_input(
     )
 
 
-def build_candidate_rows(lines: List[str]) -> List[str]:
-    rows: List[str] = []
+def _join_row(tokens: List[LineToken]) -> CandidateRow:
+    return CandidateRow(
+        text=" ".join(t.text for t in tokens),
+        upper=" ".join(t.upper for t in tokens),
+        single_line=len(tokens) == 1,
+    )
+
+
+def is_text_result(tok: LineToken) -> bool:
+    """
+    Línea sin números que puede ser un resultado de texto ("COLOR AMARILLO",
+    "NITRITOS NEGATIVO") o su nombre: con letras, sin pinta de unidad ni de
+    método y que no es cabecera, título ni dato administrativo.
+    """
+    return (
+        tok.kind == "text"
+        and not tok.numbers
+        and not tok.unit_like
+        and not tok.method_hint
+        and sum(ch.isalpha() for ch in tok.text) >= 2
+        and not _is_banned_upper(tok.upper)
+    )
+
+
+def build_candidate_rows(tokens: List[LineToken], text_rows: bool = False) -> List[CandidateRow]:
+    """
+    Filas con pinta de resultado numérico. Con `text_rows`, las líneas sueltas
+    que pueden ser resultados de texto (ver is_text_result) también salen como
+    fila, en su posición (el parser local no las convierte en item).
+    """
+    rows: List[CandidateRow] = []
     i = 0
-    n = len(lines)
+    n = len(tokens)
 
     while i < n:
-        L0 = lines[i]
+        T0 = tokens[i]
 
-        if is_patient_line(L0):
+        if T0.kind == "patient":
             i += 1
             continue
 
         # Fila completa en una sola línea
-        if looks_like_full_row(L0):
-            rows.append(L0)
+        if T0.kind == "full_row":
+            rows.append(_join_row([T0]))
             i += 1
             continue
 
-        # name + value + range + unit (4 líneas)
-        if i + 3 < n:
-            L1 = lines[i + 1]
-            L2 = lines[i + 2]
-            L3 = lines[i + 3]
-            if is_value_only(L1) and is_range_only(L2) and is_unit_like(L3):
-                row = f"{L0} {L1} {L2} {L3}"
-                rows.append(row)
-                i += 4
-                continue
+        T1 = tokens[i + 1] if i + 1 < n else None
+        T2 = tokens[i + 2] if i + 2 < n else None
 
-        # name + value + range (3 líneas, sin unidad)
-        if i + 2 < n:
-            L1 = lines[i + 1]
-            L2 = lines[i + 2]
-            if is_value_only(L1) and is_range_only(L2):
-                row = f"{L0} {L1} {L2}"
-                rows.append(row)
-                i += 3
+        if T1 is not None and T2 is not None and T1.kind == "value" and T2.kind == "range":
+            # name + value + range + unit (4 líneas)
+            if i + 3 < n and tokens[i + 3].unit_like:
+                rows.append(_join_row(tokens[i:i + 4]))
+                i += 4
                 continue
 
-        # Método + analito + valor + rango + unidad (5 líneas)
-        # Ej: Citom. de Flujo / HEMOGLOBINA / 16.5 / 14-18 / g/dL
-        if i + 4 < n:
-            L1 = lines[i + 1]
-            L2 = lines[i + 2]
-            L3 = lines[i + 3]
-            L4 = lines[i + 4]
-            up0 = L0.upper()
-            has_digits_L1 = any(ch.isdigit() for ch in L1)
-            if (
-                any(tok in up0 for tok in ["ENZIM", "COLORIM", "CITOM", "INMUNOTURB", "CLIA"])
-                and not has_digits_L1
-                and is_value_only(L2)
-                and is_range_only(L3)
-                and is_unit_like(L4)
-            ):
-                row = f"{L1} {L2} {L3} {L4}"
-                rows.append(row)
-                i += 5
-                continue
+            # name + value + range (3 líneas, sin unidad)
+            rows.append(_join_row(tokens[i:i + 3]))
+            i += 3
+            continue
 
-        # name + método + valor + rango + unidad (5 líneas)
-        # Ej: ERITRO / FOTOMETRIA / 2 / 0-15 / mm/1H
-        if i + 4 < n:
-            L1 = lines[i + 1]
-            L2 = lines[i + 2]
-            L3 = lines[i + 3]
-            L4 = lines[i + 4]
-
-            has_digits_L1 = any(ch.isdigit() for ch in L1)
-            if (
-                not has_digits_L1
-                and is_value_only(L2)
-                and is_range_only(L3)
-                and is_unit_like(L4)
-            ):
-                row = f"{L0} {L2} {L3} {L4}"
-                rows.append(row)
+        if i + 4 < n and not T1.numbers:
+            T3, T4 = tokens[i + 3], tokens[i + 4]
+            if T2.kind == "value" and T3.kind == "range" and T4.unit_like:
+                # Método + analito + valor + rango + unidad (5 líneas)
+                # Ej: Citom. de Flujo / HEMOGLOBINA / 16.5 / 14-18 / g/dL
+                if T0.method_hint:
+                    rows.append(_join_row([T1, T2, T3, T4]))
+                # name + método + valor + rango + unidad (5 líneas)
+                # Ej: ERITRO / FOTOMETRIA / 2 / 0-15 / mm/1H
+                else:
+                    rows.append(_join_row([T0, T2, T3, T4]))
                 i += 5
                 continue
 
         # Fallback: línea que contiene número, posible fila parcial
-        if NUM_RE.search(L0):
-            rows.append(L0)
+        if T0.numbers:
+            rows.append(_join_row([T0]))
+        elif text_rows and is_text_result(T0):
+            rows.append(_join_row([T0]))
 
         i += 1
 
@@ -780,18 +733,25 @@ def classify_status(value: Optional[float], ref: Optional[RefRange]) -> Optional
     return None
 
 
-def parse_row_to_item(row: str) -> Optional[LabItem]:
-    s = normalize_whitespace(row)
+def parse_row_to_item(row: Union[str, CandidateRow]) -> Optional[LabItem]:
+    if isinstance(row, CandidateRow):
+        # Ya viene limpia del lexer; las de una sola línea ya pasaron el filtro de paciente
+        s = row.text
+        is_patient = not row.single_line and _is_patient_upper(row.upper)
+        row = row.text
+    else:
+        s = normalize_whitespace(row)
+        is_patient = is_patient_line(s)
 
     # Ignorar listas de muchas pruebas
     if "," in s:
         return None
 
     # Ignorar líneas que empiezan solo con comparadores (<= 5.00, < 0.24, etc.)
-    if s.lstrip().startswith("<") or s.lstrip().startswith(">"):
+    if s.startswith(("<", ">")):
         return None
 
-    if is_patient_line(s):
+    if is_patient:
         return None
 
     # Patrón completo: name value min-max [unit]
@@ -906,15 +866,315 @@ def parse_row_to_item(row: str) -> Optional[LabItem]:
     return None
 
 
+# ---------------------------
+# Pipeline OCR (reconocimiento + parseo)
+# ---------------------------
+
+async def resubmit_after(engine_impl, source, profile: str, delay: float) -> dict:
+    """Vuelve a mandar una página al motor tras `delay` segundos (pool lleno)."""
+    await asyncio.sleep(delay)
+    return await engine_impl.submit_each([source], profile)[0]
+
+
+async def iter_page_exports(
+    contents: List[FileSource],
+    is_pdf: bool,
+    profile: str,
+    engine: str,
+    wait_when_busy: bool = False,
+) -> AsyncIterator[tuple[int, dict]]:
+    """
+    Produce (posición, export tipo docTR) por cada página a procesar, en el
+    orden en que van terminando: primero las que salen de la capa de texto
+    del PDF y luego las que pasan por el motor de OCR (ver app.core.ocr_engines).
+    Con `wait_when_busy` (trabajos en segundo plano) una página rechazada por
+    pool lleno se reintenta en vez de fallar con 503.
+    """
+    # Elegir páginas ANTES de rasterizar: lo que pasa de MAX_PAGES nunca llega al modelo
+    if is_pdf:
+        blobs = [contents[0]]
+        page_indices, total_pages = await asyncio.to_thread(
+            select_pages, blobs[0], MAX_PAGES, settings.OCR_PAGE_SELECTION
+        )
+    else:
+        blobs = contents[:MAX_PAGES]
+        page_indices, total_pages = list(range(len(blobs))), len(contents)
+        if settings.OCR_IMAGE_PREPROCESS:
+            blobs = await asyncio.to_thread(preprocess_images, blobs)
+
+    if not page_indices:
+        raise HTTPException(status_code=400, detail="El documento no contiene páginas válidas")
+    print(f"[OCR] Pages/Images to process: {page_indices} of {total_pages}")
+
+    # PDFs digitales: la capa de texto ya trae las líneas, no hace falta OCR
+    page_exports: List[Optional[dict]] = [None] * len(page_indices)
+    if is_pdf and settings.OCR_TEXT_LAYER:
+        page_exports = await asyncio.to_thread(extract_text_layer, blobs[0], page_indices)
+
+    missing = [pos for pos, pe in enumerate(page_exports) if pe is None]
+    print(f"[OCR] Text layer pages: {len(page_indices) - len(missing)}, pages for OCR ({engine}): {len(missing)}")
+
+    for pos, pe in enumerate(page_exports):
+        if pe is not None:
+            yield pos, pe
+
+    if not missing:
+        return
+
+    if is_pdf:
+        sources = [("pdf", blobs[0], page_indices[pos]) for pos in missing]
+    else:
+        sources = [("image", blobs[page_indices[pos]], 0) for pos in missing]
+
+    # docTR corre en el pool (en lotes compartidos con otras peticiones); Tesseract/OpenOCR en paralelo
+    engine_impl = get_engine(engine)
+    futures = engine_impl.submit_each(sources, profile)
+    pending = {fut: pos for fut, pos in zip(futures, missing)}
+    source_at = dict(zip(missing, sources))
+    busy_deadline = time.monotonic() + settings.OCR_JOB_BUSY_MAX_WAIT_SECONDS
+    try:
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for fut in done:
+                pos = pending.pop(fut)
+                try:
+                    page = fut.result()
+                except OCRPoolBusy:
+                    if wait_when_busy and time.monotonic() < busy_deadline:
+                        retry = resubmit_after(engine_impl, source_at[pos], profile, settings.OCR_JOB_BUSY_RETRY_SECONDS)
+                        pending[asyncio.ensure_future(retry)] = pos
+                        continue
+                    raise HTTPException(status_code=503, detail="El servicio de OCR está ocupado. Intenta de nuevo en unos segundos.")
+                except OCREngineError as e:
+                    raise HTTPException(status_code=502, detail=f"Error del motor de OCR: {e}")
+                yield pos, page
+    finally:
+        # Si el consumidor abandona (cliente desconectado), no seguimos reconociendo
+        for fut in pending:
+            fut.cancel()
+    print("[OCR] Model inference complete")
+
+
+async def recognize_document(
+    contents: List[FileSource],
+    is_pdf: bool,
+    profile: str,
+    engine: str,
+    wait_when_busy: bool = False,
+) -> List[dict]:
+    """Exports de todas las páginas a procesar, en orden de documento."""
+    pages = iter_page_exports(contents, is_pdf, profile, engine, wait_when_busy=wait_when_busy)
+    by_pos = {pos: page async for pos, page in pages}
+    page_exports = [by_pos[pos] for pos in sorted(by_pos)]
+    if not page_exports:
+        raise HTTPException(status_code=400, detail="El documento no contiene páginas válidas")
+    return page_exports
+
+
+def page_lines(page: dict, skip: Optional[Set[Tuple[int, int]]] = None) -> List[str]:
+    """
+    Texto de cada línea de un export de página (palabras unidas por espacio).
+    `skip`: líneas (bloque, línea) que se omiten, p. ej. las ya leídas como tabla.
+    """
+    lines: List[str] = []
+    for b, block in enumerate(page.get("blocks", [])):
+        for li, line in enumerate(block.get("lines", [])):
+            if skip and (b, li) in skip:
+                continue
+            words = [w["value"] for w in line.get("words", [])]
+            if not words:
+                continue
+            lines.append(" ".join(words))
+    return lines
+
+
+def parse_candidate_rows(candidate_rows: List[CandidateRow]) -> List[LabItem]:
+    items: List[LabItem] = []
+    for row in candidate_rows:
+        item = parse_row_to_item(row)
+        if item is None:
+            continue
+        items.append(item)
+    return items
+
+
+def parse_lines(lines: List[str]) -> tuple[List[str], List[LabItem]]:
+    """Filas candidatas e items parseados a partir de líneas crudas de OCR."""
+    candidate_rows = build_candidate_rows(lex_lines(lines))
+    return [row.text for row in candidate_rows], parse_candidate_rows(candidate_rows)
+
+
+def parse_pages(page_exports: List[dict]) -> tuple[List[str], List[str], List[LabItem]]:
+    """
+    (líneas de texto, filas candidatas, items) de una secuencia de páginas.
+    Las páginas donde la geometría muestra una tabla de resultados aportan
+    sus filas reconstruidas (ver app.core.table_layout); las líneas que la
+    tabla no cubre (resultados de texto, otras secciones) y las páginas sin
+    tabla pasan por el parser secuencial, juntas para no perder filas
+    partidas entre páginas.
+    """
+    all_text_lines: List[str] = []
+    candidate_rows: List[CandidateRow] = []
+    pending: List[str] = []
+    for page in page_exports:
+        lines = page_lines(page)
+        all_text_lines.extend(lines)
+        layout_rows, covered = table_rows(page) if settings.OCR_TABLE_LAYOUT else ([], set())
+        if not layout_rows:
+            pending.extend(lines)
+            continue
+        pending.extend(page_lines(page, skip=covered))
+        candidate_rows.extend(build_candidate_rows(lex_lines(pending)))
+        pending = []
+        for row in layout_rows:
+            row = clean_line(row)
+            candidate_rows.append(CandidateRow(text=row, upper=row.upper(), single_line=False))
+    candidate_rows.extend(build_candidate_rows(lex_lines(pending)))
+
+    return all_text_lines, [row.text for row in candidate_rows], parse_candidate_rows(candidate_rows)
+
+
+def parse_page_exports(page_exports: List[dict]) -> dict:
+    """
+    Texto, filas candidatas e items a partir de los exports por página.
+    Devuelve un dict JSON-serializable (es lo que se guarda en la caché de OCR).
+    """
+    all_text_lines, candidate_rows, items = parse_pages(page_exports)
+
+    return {
+        "text": "\n".join(all_text_lines),
+        "table_text": "\n".join(candidate_rows),
+        "items": [it.model_dump() for it in items],
+        "pages_processed": len(page_exports),
+    }
+
+
+# ---------------------------
+# Cobertura del parser local (decide cuánto texto necesita el LLM)
+# ---------------------------
+
+# Líneas del principio del documento que van como contexto (nombre del laboratorio, fecha)
+HEADER_TOP_LINES = 3
+HEADER_MAX_LINES = 10
+# Líneas con fecha (toma de muestra, emisión): dan lab_metadata.collection_date
+HEADER_DATE_RE = re.compile(r"\b\d{1,2}[/-]\d{1,2}[/-]\d{2,4}\b|\b\d{4}-\d{2}-\d{2}\b")
+
+
+@dataclass(slots=True)
+class ParseCoverage:
+    score: float               # 0-1: qué parte de las filas con pinta de resultado quedó bien parseada
+    results: int               # resultados del borrador
+    residual_lines: List[str]  # filas (con números o resultados de texto) que el borrador no cubre
+    residual_ids: List[int]    # posición de cada una entre las filas candidatas del documento
+    residual_sections: List[Optional[str]]  # título de la sección en la que aparece cada una
+    header_lines: List[str]    # contexto mínimo: inicio del documento, datos de paciente y fechas
+
+
+def result_confidence(result: LabResult) -> float:
+    """Confianza de un resultado del parser: con valor, rango de referencia y analito conocido."""
+    if result.value is None and not result.value_as_string:
+        return 0.0
+    conf = 0.5
+    if result.ref_low is not None or result.ref_high is not None:
+        conf += 0.25
+    if result.code or analyte_catalog.resolve(result.name) is not None:
+        conf += 0.25
+    return conf
+
+
+def parse_coverage(ocr_text: str, lab_results: List[LabResult]) -> ParseCoverage:
+    """
+    Compara las filas candidatas del texto con los resultados del borrador
+    (`draft_analysis_input` o el parser local). Una fila está cubierta si su
+    texto es la `line` de algún resultado o si se parsea a un analito que ya
+    está en el borrador (las filas de app.core.table_layout no coinciden
+    línea a línea con el texto plano). Las filas no cubiertas con letras y
+    números y que no son cabeceras son las residuales, igual que las líneas
+    de texto dentro de una sección (resultados como "COLOR AMARILLO", que el
+    parser local no lee): también cuentan en el denominador de la cobertura.
+    """
+    covered_lines = {normalize_whitespace(r.line) for r in lab_results}
+    covered_keys = {analyte_key(r.name) for r in lab_results}
+    covered_values = {analyte_key(r.value_as_string) for r in lab_results if r.value_as_string}
+
+    def text_row_covered(text: str) -> bool:
+        # "COLOR AMARILLO" está cubierta si el borrador tiene COLOR (o el valor suelto AMARILLO)
+        words = text.split()
+        return analyte_key(text) in covered_values or any(
+            analyte_key(" ".join(words[:n])) in covered_keys for n in range(1, len(words) + 1)
+        )
+
+    tokens = lex_lines(ocr_text.splitlines())
+    header: List[str] = []
+    for i, tok in enumerate(tokens):
+        is_context = i < HEADER_TOP_LINES or tok.kind == "patient" or HEADER_DATE_RE.search(tok.text)
+        if is_context and tok.text not in header:
+            header.append(tok.text)
+            if len(header) == HEADER_MAX_LINES:
+                break
+
+    residual: List[str] = []
+    residual_ids: List[int] = []
+    residual_sections: List[Optional[str]] = []
+    row_id = -1
+    for section, section_tokens in split_sections(tokens):
+        # Lo anterior al primer título (laboratorio, dirección, paciente) no tiene resultados de texto
+        for row in build_candidate_rows(section_tokens, text_rows=section is not None):
+            row_id += 1
+            if row.text in covered_lines:
+                continue
+            item = parse_row_to_item(row)
+            if item is not None and analyte_key(item.name) in covered_keys:
+                continue
+            if item is None and NUM_RE.search(row.text) is None:
+                # Resultado de texto (ya filtrado por is_text_result)
+                if text_row_covered(row.text):
+                    continue
+            elif item is None:
+                name_part = NUM_RE.split(row.text, maxsplit=1)[0]
+                if not any(ch.isalpha() for ch in row.text) or is_banned_name(name_part or row.text):
+                    continue
+            residual.append(row.text)
+            residual_ids.append(row_id)
+            residual_sections.append(section)
+
+    total = len(lab_results) + len(residual)
+    score = sum(result_confidence(r) for r in lab_results) / total if total else 0.0
+    return ParseCoverage(
+        score=round(score, 3),
+        results=len(lab_results),
+        residual_lines=residual,
+        residual_ids=residual_ids,
+        residual_sections=residual_sections,
+        header_lines=header,
+    )
+
+
 # ---------------------------
 # Endpoint principal
 # ---------------------------
 
-@router.post("/pdf", response_model=OCRResponse)
-async def ocr_pdf(
-    files: List[UploadFile] = File(...),
-    user: AuthUser = Depends(get_current_user)
-):
+@router.get("/stats")
+def ocr_stats():
+    """
+    Estado del pool de OCR (workers, trabajos en curso y profundidad de cola)
+    del batcher (histogramas de tamaño de lote y espera), de los motores
+    (latencia media por página), de la caché de resultados y de las llamadas
+    a Gemini (en curso, en cola, reintentos) y su caché.
+    """
+    return {
+        "pool": ocr_pool.stats(),
+        "batcher": ocr_batcher.stats(),
+        "engines": engines_stats(),
+        "cache": ocr_cache.stats(),
+        "jobs": ocr_jobs.stats(),
+        "llm": llm_client.stats(),
+        "llm_cache": llm_cache.stats(),
+    }
+
+
+def validate_upload_files(files: List[UploadFile]) -> bool:
+    """Valida tipos de archivo. Devuelve True si es un PDF, False si son imágenes."""
     if not files:
         raise HTTPException(status_code=400, detail="No se enviaron archivos")
 
@@ -934,142 +1194,365 @@ async def ocr_pdf(
             ext = f.filename.split(".")[-1].lower()
             if ext not in valid_img_exts:
                 raise HTTPException(status_code=400, detail=f"Tipo de archivo no soportado: {f.filename}. Use PDF, JPG o PNG.")
+    return is_pdf
 
+
+def validate_ocr_profile(profile: Optional[str]) -> str:
+    """Perfil de OCR pedido por el cliente (o el de la instancia, OCR_PROFILE)."""
     try:
-        # Leer contenido de los archivos
-        files_content = []
-        for f in files:
-            content = await f.read()
-            # Asegurarse que leemos bytes
-            if isinstance(content, str):
-                content = content.encode("utf-8")
-            files_content.append((f.filename, content))
-            await f.seek(0)
-
-        # Subir a Supabase
-        base_upload_id = str(uuid.uuid4())
-        public_urls = []
-        storage_paths = []
-
-        print(f"[OCR] Starting upload for {len(files)} files. Group ID: {base_upload_id}")
-        
-        for fname, content in files_content:
-            unique_name = f"{base_upload_id}/{fname}"
-            if supabase_client:
-                s_path = f"labs/{unique_name}"
-                try:
-                    supabase_client.storage.from_(SUPABASE_BUCKET).upload(
-                        path=s_path,
-                        file=content,
-                    )
-                    url = supabase_client.storage.from_(SUPABASE_BUCKET).get_public_url(s_path)
-                    storage_paths.append(s_path)
-                    public_urls.append(url)
-                except Exception as e:
-                    print(f"[Supabase] Error subiendo {fname}: {e}")
-
-        # Preparar docTR
-        if is_pdf:
-            doc = DocumentFile.from_pdf(io.BytesIO(files_content[0][1]))
-        else:
-            bytes_list = [c for _, c in files_content]
-            doc = DocumentFile.from_images(bytes_list)
+        return resolve_profile(profile)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        if len(doc) == 0:
-            raise HTTPException(status_code=400, detail="El documento no contiene páginas válidas")
 
-        pages_to_process = min(len(doc), MAX_PAGES)
-        print(f"[OCR] Model ready. Pages/Images to process: {pages_to_process}")
+def validate_ocr_engine(engine: Optional[str]) -> str:
+    """Motor de OCR pedido por el cliente (o el de la instancia, OCR_DEFAULT_ENGINE)."""
+    try:
+        return resolve_engine(engine)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        result = OCR_PREDICTOR(doc)
-        print("[OCR] Model inference complete")
-        export = result.export()
 
-        all_text_lines: List[str] = []
-        logical_lines: List[str] = []
+def _upload_one(storage_path: str, content: FileSource) -> str:
+    supabase_client.storage.from_(SUPABASE_BUCKET).upload(
+        path=storage_path,
+        file=content,
+    )
+    return supabase_client.storage.from_(SUPABASE_BUCKET).get_public_url(storage_path)
 
-        for page_idx, page in enumerate(export["pages"][:pages_to_process]):
-            for block in page.get("blocks", []):
-                for line in block.get("lines", []):
-                    words = [w["value"] for w in line.get("words", [])]
-                    if not words:
-                        continue
-                    line_text = " ".join(words)
-                    all_text_lines.append(line_text)
-                    logical_lines.append(line_text)
 
-        full_text = "\n".join(all_text_lines)
+async def _upload_planned(planned: List[tuple[str, str, FileSource]]) -> tuple[List[str], List[str]]:
+    """Sube todos los archivos a la vez (el cliente de storage es síncrono: un hilo por archivo)."""
+    results = await asyncio.gather(
+        *(asyncio.to_thread(_upload_one, s_path, content) for _, s_path, content in planned),
+        return_exceptions=True,
+    )
 
-        cleaned_lines = preclean_lines(logical_lines)
-        candidate_rows = build_candidate_rows(cleaned_lines)
-        table_text = "\n".join(candidate_rows)
+    public_urls = []
+    storage_paths = []
+    for (fname, s_path, _), res in zip(planned, results):
+        if isinstance(res, Exception):
+            print(f"[Supabase] Error subiendo {fname}: {res}")
+            continue
+        storage_paths.append(s_path)
+        public_urls.append(res)
+    return storage_paths, public_urls
 
-        items: List[LabItem] = []
-        for row in candidate_rows:
-            item = parse_row_to_item(row)
-            if item is None:
-                continue
-            items.append(item)
 
-        # User Profile Fetching
-        user_profile_data = None
+# Subidas diferidas que siguen corriendo después de responder (referencia fuerte)
+_background_uploads: set = set()
+
+
+async def upload_files_to_storage(uploads: List[SpooledUpload]) -> tuple[List[str], List[str]]:
+    """
+    Sube los archivos a Supabase Storage. Devuelve (storage_paths, public_urls).
+
+    Con OCR_DEFER_STORAGE_UPLOAD la subida sigue en segundo plano y se
+    devuelven ya las rutas previstas (si la subida falla solo queda en el log).
+    """
+    if supabase_client is None:
+        print("[Supabase] Cliente no inicializado, no se subirán los archivos")
+        return [], []
+
+    base_upload_id = str(uuid.uuid4())
+    planned = [(up.filename, f"labs/{base_upload_id}/{up.filename}", up.source) for up in uploads]
+    print(f"[OCR] Starting upload for {len(uploads)} files. Group ID: {base_upload_id}")
+
+    if not settings.OCR_DEFER_STORAGE_UPLOAD:
+        return await _upload_planned(planned)
+
+    # Los temporales en disco deben sobrevivir a la petición hasta que acabe la subida
+    for up in uploads:
+        up.acquire()
+    task = asyncio.create_task(_upload_planned(planned))
+    _background_uploads.add(task)
+    task.add_done_callback(_background_uploads.discard)
+    task.add_done_callback(lambda _: release_all(uploads))
+    storage_paths = [s_path for _, s_path, _ in planned]
+    public_urls = [supabase_client.storage.from_(SUPABASE_BUCKET).get_public_url(p) for p in storage_paths]
+    return storage_paths, public_urls
+
+
+def fetch_patient_profile(user: AuthUser) -> Optional[PatientProfile]:
+    """Perfil del paciente a partir de la tabla `usuarios` (None si no existe o falla)."""
+    user_profile_data = None
+    try:
+        client = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
+        client.postgrest.auth(user.token)
+        resp = client.table("usuarios").select("*").eq("user_auth_id", user.sub).single().execute()
+        if resp.data:
+            user_profile_data = resp.data
+    except Exception as e:
+        print(f"[OCR] Error fetching profile: {e}")
+
+    if not user_profile_data:
+        return None
+
+    age = None
+    if user_profile_data.get("fecha_nacimiento"):
         try:
-            client = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
-            client.postgrest.auth(user.token)
-            resp = client.table("usuarios").select("*").eq("user_auth_id", user.sub).single().execute()
-            if resp.data:
-                user_profile_data = resp.data
-        except Exception as e:
-            print(f"[OCR] Error fetching profile: {e}")
-
-        patient_profile = None
-        if user_profile_data:
-            age = None
-            if user_profile_data.get("fecha_nacimiento"):
-                try:
-                    dob = date.fromisoformat(user_profile_data["fecha_nacimiento"])
-                    today = date.today()
-                    age = today.year - dob.year - ((today.month, today.day) < (dob.month, dob.day))
-                except Exception:
-                    pass
-            sex_map = {"Masculino": "M", "Femenino": "F", "M": "M", "F": "F"}
-            raw_sex = user_profile_data.get("sexo")
-            sex = sex_map.get(raw_sex, raw_sex)
-
-            patient_profile = PatientProfile(
-                age=age,
-                sex=sex,
-                weight_kg=user_profile_data.get("peso_kg"),
-                height_cm=user_profile_data.get("altura_cm"),
-                conditions=user_profile_data.get("condiciones_medicas") or [],
-                medications=[],
-                allergies=user_profile_data.get("alergias") or []
-            )
-
-        main_path = storage_paths[0] if storage_paths else None
-        main_url = public_urls[0] if public_urls else None
-
-        analysis_input = build_analysis_input(
-            items=items,
-            full_text=full_text,
-            storage_path=main_path,
-            public_url=main_url,
-            patient_profile=patient_profile
-        )
+            dob = date.fromisoformat(user_profile_data["fecha_nacimiento"])
+            today = date.today()
+            age = today.year - dob.year - ((today.month, today.day) < (dob.month, dob.day))
+        except Exception:
+            pass
+    sex_map = {"Masculino": "M", "Femenino": "F", "M": "M", "F": "F"}
+    raw_sex = user_profile_data.get("sexo")
+    sex = sex_map.get(raw_sex, raw_sex)
+
+    return PatientProfile(
+        age=age,
+        sex=sex,
+        weight_kg=user_profile_data.get("peso_kg"),
+        height_cm=user_profile_data.get("altura_cm"),
+        conditions=user_profile_data.get("condiciones_medicas") or [],
+        medications=[],
+        allergies=user_profile_data.get("alergias") or []
+    )
+
+
+async def ocr_and_parse(
+    uploads: List[SpooledUpload],
+    is_pdf: bool,
+    profile: str,
+    engine: str,
+    wait_when_busy: bool = False,
+) -> dict:
+    """OCR + parseo, o directamente desde caché si este archivo ya se procesó."""
+    cache_key = ocr_cache.make_key([up.sha256 for up in uploads], ocr_cache_version(profile, engine))
+    parsed = await asyncio.to_thread(ocr_cache.get, cache_key)
+    if parsed is not None:
+        print(f"[OCR] Cache HIT {cache_key[:12]}")
+        return parsed
+
+    page_exports = await recognize_document(
+        [up.source for up in uploads], is_pdf, profile, engine, wait_when_busy=wait_when_busy
+    )
+    parsed = parse_page_exports(page_exports)
+    await asyncio.to_thread(ocr_cache.put, cache_key, parsed)
+    return parsed
+
+
+def build_ocr_response(
+    parsed: dict,
+    storage_paths: List[str],
+    public_urls: List[str],
+    patient_profile: Optional[PatientProfile],
+) -> OCRResponse:
+    full_text = parsed["text"]
+    items = [LabItem(**it) for it in parsed["items"]]
+
+    main_path = storage_paths[0] if storage_paths else None
+    main_url = public_urls[0] if public_urls else None
+
+    analysis_input = build_analysis_input(
+        items=items,
+        full_text=full_text,
+        storage_path=main_path,
+        public_url=main_url,
+        patient_profile=patient_profile
+    )
+
+    return OCRResponse(
+        text=full_text,
+        table_text=parsed["table_text"],
+        items=items,
+        pages_processed=parsed["pages_processed"],
+        storage_path=main_path,
+        public_url=main_url,
+        analysis_input=analysis_input,
+    )
+
 
-        return OCRResponse(
-            text=full_text,
-            table_text=table_text,
-            items=items,
-            pages_processed=pages_to_process,
-            storage_path=main_path,
-            public_url=main_url,
-            analysis_input=analysis_input,
+async def process_ocr_upload(
+    uploads: List[SpooledUpload],
+    is_pdf: bool,
+    user: AuthUser,
+    profile: str,
+    engine: str,
+    wait_when_busy: bool = False,
+) -> OCRResponse:
+    """
+    Sube los archivos, hace OCR + parseo y arma el OCRResponse. Libera los
+    temporales al terminar. Lo usan tanto el endpoint síncrono como los
+    trabajos en segundo plano (`wait_when_busy`: ya respondieron 202, así que
+    esperan hueco en el pool en vez de fallar con 503).
+    """
+    try:
+        # Subidas, perfil y OCR son independientes: corren a la vez. Esperamos
+        # a las tres aunque una falle: los hilos de subida aún leen los temporales.
+        results = await asyncio.gather(
+            upload_files_to_storage(uploads),
+            ocr_and_parse(uploads, is_pdf, profile, engine, wait_when_busy=wait_when_busy),
+            asyncio.to_thread(fetch_patient_profile, user),
+            return_exceptions=True,
         )
+    finally:
+        release_all(uploads)
+
+    for res in results:
+        if isinstance(res, BaseException):
+            raise res
+    (storage_paths, public_urls), parsed, patient_profile = results
+    return build_ocr_response(parsed, storage_paths, public_urls, patient_profile)
+
+
+@router.post("/pdf", response_model=OCRResponse)
+async def ocr_pdf(
+    files: List[UploadFile] = File(...),
+    profile: Optional[str] = Form(None),
+    engine: Optional[str] = Form(None),
+    user: AuthUser = Depends(get_current_user)
+):
+    is_pdf = validate_upload_files(files)
+    profile = validate_ocr_profile(profile)
+    engine = validate_ocr_engine(engine)
+
+    try:
+        uploads = await spool_upload_files(files)
+        return await process_ocr_upload(uploads, is_pdf, user, profile, engine)
 
     except HTTPException:
         raise
     except Exception as e:
         import traceback
         traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"OCR/PDF error: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"OCR/PDF error: {str(e)}")
+
+
+# ---------------------------
+# Streaming por página (NDJSON)
+# ---------------------------
+
+def ndjson(message: dict) -> bytes:
+    return (json.dumps(message, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+
+
+async def stream_ocr_upload(
+    uploads: List[SpooledUpload],
+    is_pdf: bool,
+    user: AuthUser,
+    profile: str,
+    engine: str,
+) -> AsyncIterator[bytes]:
+    """
+    Emite un mensaje `page` por página en cuanto termina (líneas + items de esa
+    página) y al final un mensaje `final` con el mismo OCRResponse que /pdf.
+    Los errores se emiten como mensaje `error` (los headers ya se enviaron).
+    """
+    # Subidas y perfil corren en paralelo mientras se emiten las páginas
+    storage = asyncio.ensure_future(upload_files_to_storage(uploads))
+    patient_profile = asyncio.ensure_future(asyncio.to_thread(fetch_patient_profile, user))
+    try:
+        contents = [up.source for up in uploads]
+
+        cache_key = ocr_cache.make_key([up.sha256 for up in uploads], ocr_cache_version(profile, engine))
+        parsed = await asyncio.to_thread(ocr_cache.get, cache_key)
+        if parsed is None:
+            by_pos = {}
+            async for pos, page in iter_page_exports(contents, is_pdf, profile, engine):
+                by_pos[pos] = page
+                lines, _, items = parse_pages([page])
+                yield ndjson({
+                    "type": "page",
+                    "page": pos,
+                    "lines": lines,
+                    "items": [it.model_dump() for it in items],
+                })
+
+            if not by_pos:
+                raise HTTPException(status_code=400, detail="El documento no contiene páginas válidas")
+            # El resultado final se parsea sobre el documento completo (filas que cruzan páginas)
+            parsed = parse_page_exports([by_pos[pos] for pos in sorted(by_pos)])
+            await asyncio.to_thread(ocr_cache.put, cache_key, parsed)
+
+        storage_paths, public_urls = await storage
+        response = build_ocr_response(parsed, storage_paths, public_urls, await patient_profile)
+        yield ndjson({"type": "final", "result": response.model_dump(mode="json")})
+
+    except HTTPException as e:
+        yield ndjson({"type": "error", "status": e.status_code, "detail": e.detail})
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        yield ndjson({"type": "error", "status": 500, "detail": f"OCR/PDF error: {str(e)}"})
+    finally:
+        # La subida ya tiene su propia referencia si es diferida
+        await asyncio.gather(storage, return_exceptions=True)
+        release_all(uploads)
+
+
+@router.post("/pdf/stream")
+async def ocr_pdf_stream(
+    files: List[UploadFile] = File(...),
+    profile: Optional[str] = Form(None),
+    engine: Optional[str] = Form(None),
+    user: AuthUser = Depends(get_current_user)
+):
+    """
+    Variante de /pdf que devuelve NDJSON: un mensaje por página reconocida y
+    un mensaje final con `analysis_input`, para que la app pinte resultados
+    progresivamente.
+    """
+    is_pdf = validate_upload_files(files)
+    profile = validate_ocr_profile(profile)
+    engine = validate_ocr_engine(engine)
+    uploads = await spool_upload_files(files)
+    return StreamingResponse(
+        stream_ocr_upload(uploads, is_pdf, user, profile, engine),
+        media_type="application/x-ndjson",
+    )
+
+
+# ---------------------------
+# Trabajos asíncronos (submit / poll)
+# ---------------------------
+
+def job_to_status(job: Job) -> OCRJobStatus:
+    return OCRJobStatus(
+        job_id=job.id,
+        status=job.status,
+        created_at=job.created_at,
+        finished_at=job.finished_at,
+        error=job.error,
+        error_status=job.error_status,
+        result=job.result,
+    )
+
+
+@router.post("/jobs", response_model=OCRJobStatus, status_code=202)
+async def submit_ocr_job(
+    files: List[UploadFile] = File(...),
+    profile: Optional[str] = Form(None),
+    engine: Optional[str] = Form(None),
+    user: AuthUser = Depends(get_current_user)
+):
+    """
+    Igual que /pdf pero sin mantener la conexión abierta: responde 202 con un
+    job_id y el OCR corre en segundo plano. Consultar con GET /jobs/{job_id}.
+    """
+    is_pdf = validate_upload_files(files)
+    profile = validate_ocr_profile(profile)
+    engine = validate_ocr_engine(engine)
+    uploads = await spool_upload_files(files)
+
+    try:
+        job = ocr_jobs.submit(
+            user.sub,
+            lambda: process_ocr_upload(uploads, is_pdf, user, profile, engine, wait_when_busy=True),
+            on_drop=lambda: release_all(uploads),
+        )
+    except JobStoreFull:
+        release_all(uploads)
+        raise HTTPException(status_code=503, detail="Hay demasiados análisis en curso. Intenta de nuevo en unos minutos.")
+
+    print(f"[OCR] Job {job.id} encolado ({len(uploads)} archivos, {sum(up.size for up in uploads) // 1024} KB)")
+    return job_to_status(job)
+
+
+@router.get("/jobs/{job_id}", response_model=OCRJobStatus)
+async def get_ocr_job(job_id: str, user: AuthUser = Depends(get_current_user)):
+    job = ocr_jobs.get(job_id, owner=user.sub)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado o expirado")
+    return job_to_status(job)
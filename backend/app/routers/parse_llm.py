@@ -1,18 +1,26 @@
 # backend/app/routers/parse_llm.py
 
 from fastapi import APIRouter, Body, HTTPException
+import asyncio
 import json
 import re
-import google.generativeai as genai
 from datetime import date
 
 from .ocr_local import (
     LLMParseRequest,
     LLMInterpretation,
-    gemini_configured,
+    build_analysis_input,
+    configure_gemini,
+    is_section_title,
+    parse_coverage,
+    parse_lines,
 )
 from app.core.security import get_current_user, AuthUser
 from app.core.config import settings
+from app.core.llm_chunks import chunk_lines, estimate_tokens
+from app.core.llm_cache import canonical_json, llm_cache
+from app.core.llm_client import LLMError, llm_client
+from app.core.result_merge import merge_lab_results
 from supabase import create_client
 from fastapi import Depends
 
@@ -54,18 +62,76 @@ def extract_json_from_text(text: str) -> str:
         return text
 
 
-def split_text_into_chunks(text: str, max_lines=60, overlap=5) -> list[str]:
-    lines = text.split('\n')
-    chunks = []
-    start = 0
-    while start < len(lines):
-        end = start + max_lines
-        chunk_lines = lines[start:end]
-        chunks.append('\n'.join(chunk_lines))
-        start += (max_lines - overlap)
-        if start >= len(lines):
-            break
-    return chunks
+def split_into_chunks(text: str, is_boundary, overlap: int, header: list[str] = ()) -> list[str]:
+    """
+    Trozos para el paso 1 según los presupuestos de tokens (ver app.core.llm_chunks);
+    `header` va delante en cada trozo.
+    """
+    return chunk_lines(
+        text.split("\n"),
+        is_boundary,
+        max_input_tokens=settings.LLM_CHUNK_MAX_INPUT_TOKENS,
+        max_output_tokens=settings.LLM_MAX_OUTPUT_TOKENS,
+        result_tokens=settings.LLM_RESULT_OUTPUT_TOKENS,
+        overlap=overlap,
+        header=header,
+    )
+
+
+def is_rows_boundary(line: str) -> bool:
+    return line.startswith("S|")
+
+
+def header_rows(coverage) -> list[str]:
+    """Cabecera en formato compacto ("H|..."): paciente y metadatos del laboratorio."""
+    return [f"H|{h}" for h in coverage.header_lines]
+
+
+def residual_text(coverage) -> str:
+    """Modo "text" con borrador: líneas residuales bajo el título de su sección (la cabecera va aparte)."""
+    lines = []
+    section = None
+    for text, row_section in zip(coverage.residual_lines, coverage.residual_sections):
+        if row_section is not None and row_section != section:
+            lines.append(row_section)
+        section = row_section
+        lines.append(text)
+    return "\n".join(lines)
+
+
+def missing_header_data(draft, payload) -> bool:
+    """El borrador no trae metadatos del laboratorio o datos del paciente (edad/sexo)."""
+    meta = draft.lab_metadata
+    profile = payload.patient_profile or draft.patient_profile
+    return (meta.collection_date is None and meta.lab_name is None) or (profile.age is None and profile.sex is None)
+
+
+def compact_rows_text(coverage) -> str:
+    """
+    Tabla compacta para el LLM: "S|sección" y "<id>|fila" (ver LLM_EXTRACTION_PROMPT);
+    la cabecera ("H|...", header_rows) se antepone a cada trozo.
+    """
+    lines = []
+    section = None
+    for row_id, text, row_section in zip(coverage.residual_ids, coverage.residual_lines, coverage.residual_sections):
+        if row_section is not None and row_section != section:
+            lines.append(f"S|{row_section}")
+        section = row_section
+        lines.append(f"{row_id}|{text}")
+    return "\n".join(lines)
+
+
+def chunk_payload(key: str, chunk_text: str, input_profile) -> str:
+    return json.dumps({key: chunk_text, "input_profile": input_profile}, ensure_ascii=False, separators=(",", ":"))
+
+
+def add_usage(usage: dict, response) -> None:
+    """Suma los tokens reales que reporta Gemini (usage_metadata) al acumulado de la petición."""
+    meta = getattr(response, "usage_metadata", None)
+    usage["calls"] += 1
+    usage["prompt_tokens"] += getattr(meta, "prompt_token_count", 0) or 0
+    usage["output_tokens"] += getattr(meta, "candidates_token_count", 0) or 0
+
 
 @router.post("/parse-llm", response_model=LLMInterpretation)
 async def parse_with_llm(
@@ -74,10 +140,13 @@ async def parse_with_llm(
 ):
     """
     Usa Google Gemini en DOS PASOS (con Chunking) para interpretar los resultados médicos evitando truncamiento.
-    Paso 1: Extracción por trozos (Chunking) y fusión.
+    Paso 1: Extracción por trozos (Chunking) y fusión. Se omite si el parser
+            local ya cubre el documento (si al borrador le faltan paciente o
+            metadatos, solo va la cabecera); si no, van la cabecera y las
+            líneas residuales.
     Paso 2: Análisis médico sobre datos fusionados.
     """
-    if not gemini_configured:
+    if not configure_gemini():
         raise HTTPException(
             status_code=500,
             detail="La IA no está configurada en el servidor (falta GOOGLE_API_KEY en .env)",
@@ -88,58 +157,114 @@ async def parse_with_llm(
     # ---------------------------------------------------------
     from .ocr_local import LLM_EXTRACTION_PROMPT, LLM_ANALYSIS_PROMPT
 
-    # Usamos gemini-2.5-flash (segun usuario)
-    model_extraction = genai.GenerativeModel(
-        model_name="gemini-2.5-flash", 
-        system_instruction=LLM_EXTRACTION_PROMPT,
+    # Borrador del parser local: el que manda el cliente o uno nuevo a partir del texto
+    draft = payload.draft_analysis_input
+    if draft is None:
+        _, items = parse_lines(payload.ocr_text.split("\n"))
+        draft = build_analysis_input(items, payload.ocr_text, patient_profile=payload.patient_profile)
+    coverage = parse_coverage(payload.ocr_text, draft.lab_results)
+
+    skip_extraction = coverage.results > 0 and (
+        not coverage.residual_lines
+        or (
+            coverage.score >= settings.LLM_SKIP_EXTRACTION_MIN_COVERAGE
+            and coverage.results >= settings.LLM_SKIP_EXTRACTION_MIN_RESULTS
+        )
     )
-    
-    # DIVIDIR TEXTO EN CHUNKS (Estabilidad: 60 líneas)
-    ocr_chunks = split_text_into_chunks(payload.ocr_text, max_lines=60, overlap=5)
-    print(f"[Gemini] Paso 1: Iniciando extracción PARALELA por Chunks. Total chunks: {len(ocr_chunks)}")
+    print(
+        f"[Gemini] Cobertura del parser local: {coverage.score:.2f} "
+        f"({coverage.results} resultados, {len(coverage.residual_lines)} líneas residuales)"
+    )
+
+    input_profile = payload.patient_profile.dict() if payload.patient_profile else None
+    usage = {"calls": 0, "prompt_tokens": 0, "output_tokens": 0}
+
+    # DIVIDIR EN CHUNKS por presupuesto de tokens y secciones - solo lo que el parser no entendió
+    if skip_extraction and coverage.header_lines and missing_header_data(draft, payload):
+        # Los resultados salen del borrador; una llamada pequeña solo con la cabecera
+        # recupera paciente, laboratorio y fecha, que el parser local no extrae
+        input_key = "rows"
+        ocr_chunks = ["\n".join(header_rows(coverage))]
+        print("[Gemini] Paso 1 omitido: se usa el borrador del parser local (solo cabecera al LLM)")
+    elif skip_extraction:
+        ocr_chunks = []
+        print("[Gemini] Paso 1 omitido: se usa el borrador del parser local")
+    elif settings.LLM_INPUT_MODE == "rows" and coverage.residual_lines:
+        # Filas candidatas con id + cabecera mínima, en lugar del texto OCR con direcciones y pies legales
+        input_key = "rows"
+        # Cada fila es autocontenida: sin solapamiento
+        ocr_chunks = split_into_chunks(
+            compact_rows_text(coverage), is_rows_boundary, overlap=0, header=header_rows(coverage)
+        )
+    else:
+        # Sin borrador no hay nada en qué confiar: va el texto completo
+        input_key = "ocr_text"
+        if coverage.results:
+            llm_text, header = residual_text(coverage), coverage.header_lines
+        else:
+            llm_text, header = payload.ocr_text, []
+        ocr_chunks = split_into_chunks(
+            llm_text, is_section_title, overlap=settings.LLM_CHUNK_OVERLAP_LINES, header=header
+        )
+
+    if ocr_chunks:
+        # Referencia: el texto OCR completo; tokens de entrada = prompt de sistema + trozos
+        system_tokens = estimate_tokens(LLM_EXTRACTION_PROMPT)
+        raw_chunks = split_into_chunks(payload.ocr_text, is_section_title, overlap=settings.LLM_CHUNK_OVERLAP_LINES)
+        tokens_before = sum(system_tokens + estimate_tokens(chunk_payload("ocr_text", c, input_profile)) for c in raw_chunks)
+        tokens_now = sum(system_tokens + estimate_tokens(chunk_payload(input_key, c, input_profile)) for c in ocr_chunks)
+        print(
+            f"[Gemini] Entrada paso 1 (modo {settings.LLM_INPUT_MODE}): texto completo ~{tokens_before} tokens "
+            f"en {len(raw_chunks)} llamadas -> ~{tokens_now} tokens en {len(ocr_chunks)} llamadas"
+        )
+        print(f"[Gemini] Paso 1: Iniciando extracción PARALELA por Chunks. Total chunks: {len(ocr_chunks)}")
 
     # Función auxiliar para procesar un chunk individualmente
     async def process_chunk(index: int, chunk_text: str):
         print(f"[Gemini] Lanzando Chunk {index+1}...")
-        chunk_content = {
-            "ocr_text": chunk_text,
-            "input_profile": payload.patient_profile.dict() if payload.patient_profile else None
-        }
         
-        # Retry loop por chunk (Temp 0.1 -> 0.4 -> 0.9)
-        # 0.9 es la "bala de plata" para romper bucles de error sintáctico
+        # Retry loop por chunk ante JSON inválido (Temp 0.1 -> 0.4 -> 0.9)
+        # 0.9 es la "bala de plata" para romper bucles de error sintáctico.
+        # Cuota/timeouts los reintenta llm_client con backoff, a la misma temperatura.
+        contents = chunk_payload(input_key, chunk_text, input_profile)
+        cache_key = llm_cache.make_key("extract", settings.LLM_MODEL, LLM_EXTRACTION_PROMPT, contents)
+        cached = await llm_cache.get(cache_key)
+        if cached is not None:
+            print(f"[Gemini] Chunk {index+1} desde caché")
+            return cached
+
         chunk_temperatures = [0.1, 0.4, 0.9]
         for attempt, temp in enumerate(chunk_temperatures):
             try:
-                # generate_content es sincrono, pero lo envolvemos en to_thread si bloquea, 
-                # o confiamos en que fastAPI maneje threads. 
-                # Nota: Google GenAI 'generate_content_async' es lo ideal si existe,
-                # pero si no, usamos generate_content en un threadpool para no bloquear el loop.
-                response_ext = await  genai.GenerativeModel("gemini-2.5-flash", system_instruction=LLM_EXTRACTION_PROMPT).generate_content_async(
-                    json.dumps(chunk_content, ensure_ascii=False),
-                    generation_config=genai.GenerationConfig(
-                        response_mime_type="application/json",
-                        temperature=temp,
-                        max_output_tokens=8192,
-                    )
+                response_ext = await llm_client.generate(
+                    LLM_EXTRACTION_PROMPT,
+                    contents,
+                    temperature=temp,
+                    max_output_tokens=settings.LLM_MAX_OUTPUT_TOKENS,
                 )
+                add_usage(usage, response_ext)
                 
                 json_ext = extract_json_from_text(response_ext.text)
                 data = json.loads(json_ext)
                 print(f"[Gemini] Chunk {index+1} FINALIZADO (Intento {attempt+1})")
+                await llm_cache.put(cache_key, data)
                 return data
+            except LLMError as e:
+                print(f"[Gemini] Error Chunk {index+1}: {e}")
+                break
             except Exception as e:
                 print(f"[Gemini] Error Chunk {index+1} Intento {attempt+1}: {e}")
         
         print(f"[Gemini] Advertencia: Chunk {index+1} FALLÓ tras reintentos.")
         return None
 
-    # Ejecutar todos los chunks en paralelo
-    import asyncio
+    # Ejecutar todos los chunks en paralelo (llm_client limita cuántos van a la vez)
     tasks = [process_chunk(i, chunk) for i, chunk in enumerate(ocr_chunks)]
     chunk_results = await asyncio.gather(*tasks)
 
-    accumulated_results = []
+    # El borrador ya viene validado; el LLM solo aporta lo residual
+    draft_dump = draft.model_dump(mode="json")
+    accumulated_results = list(draft_dump["lab_results"])
     final_patient_profile = None
     final_lab_metadata = None
 
@@ -159,18 +284,24 @@ async def parse_with_llm(
             if not final_lab_metadata and inp.get("lab_metadata"):
                 final_lab_metadata = inp["lab_metadata"]
 
-    print(f"[Gemini] Paso 1 Completado. Total resultados extraídos: {len(accumulated_results)}")
+    # Borrador + trozos solapados: un registro por analito (el prompt del paso 2 y el historial se achican)
+    extracted_count = len(accumulated_results)
+    accumulated_results = merge_lab_results(accumulated_results)
+    print(
+        f"[Gemini] Paso 1 Completado. Total resultados extraídos: {extracted_count} "
+        f"({len(accumulated_results)} tras fusionar duplicados)"
+    )
 
     if not accumulated_results and not final_patient_profile:
          raise HTTPException(status_code=500, detail="La IA no pudo extraer datos de ninguna sección del documento.")
 
     # Construir objeto unificado
     if not final_patient_profile:
-        final_patient_profile = payload.patient_profile.dict() if payload.patient_profile else {}
+        final_patient_profile = payload.patient_profile.dict() if payload.patient_profile else draft_dump["patient_profile"]
 
     analysis_input_obj = {
         "patient_profile": final_patient_profile,
-        "lab_metadata": final_lab_metadata or {},
+        "lab_metadata": final_lab_metadata or draft_dump["lab_metadata"],
         "lab_results": accumulated_results
     }
 
@@ -179,29 +310,32 @@ async def parse_with_llm(
     # PASO 2: ANÁLISIS MÉDICO (Structured Data -> Insights)
     # ---------------------------------------------------------
     print("[Gemini] Inicio Paso 2: Análisis médico...")
-    
-    model_analysis = genai.GenerativeModel(
-        model_name="gemini-2.5-flash", 
-        system_instruction=LLM_ANALYSIS_PROMPT,
-    )
 
     analysis_payload = {
         "lab_results_structured": analysis_input_obj
     }
 
     final_analysis = None
+    # Mismos datos estructurados (en cualquier orden de claves) -> mismo análisis
+    analysis_cache_key = llm_cache.make_key(
+        "analysis", settings.LLM_MODEL, LLM_ANALYSIS_PROMPT, canonical_json(analysis_input_obj)
+    )
     try:
-        response_ana = model_analysis.generate_content(
-            json.dumps(analysis_payload, ensure_ascii=False),
-            generation_config=genai.GenerationConfig(
-                response_mime_type="application/json",
+        final_analysis = await llm_cache.get(analysis_cache_key)
+        if final_analysis is not None:
+            print("[Gemini] Paso 2 desde caché.")
+        else:
+            response_ana = await llm_client.generate(
+                LLM_ANALYSIS_PROMPT,
+                json.dumps(analysis_payload, ensure_ascii=False),
                 temperature=0.2, # Un poco de creatividad para explicaciones
-                max_output_tokens=8192,
+                max_output_tokens=settings.LLM_MAX_OUTPUT_TOKENS,
             )
-        )
-        json_ana = extract_json_from_text(response_ana.text)
-        final_analysis = json.loads(json_ana)
-        print("[Gemini] Paso 2 Completado. Análisis generado.")
+            add_usage(usage, response_ana)
+            json_ana = extract_json_from_text(response_ana.text)
+            final_analysis = json.loads(json_ana)
+            await llm_cache.put(analysis_cache_key, final_analysis)
+            print("[Gemini] Paso 2 Completado. Análisis generado.")
 
     except Exception as e:
         print(f"[Gemini] Error en Paso 2 (Análisis): {e}")
@@ -214,6 +348,11 @@ async def parse_with_llm(
             "disclaimer": "Error parcial en IA."
         }
 
+    print(
+        f"[Gemini] Tokens de la petición: {usage['prompt_tokens']} de entrada, "
+        f"{usage['output_tokens']} de salida en {usage['calls']} llamadas"
+    )
+
     # ---------------------------------------------------------
     # MERGE Y RETORNO
     # ---------------------------------------------------------
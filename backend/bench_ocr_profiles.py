@@ -0,0 +1,118 @@
+# backend/bench_ocr_profiles.py
+"""
+Benchmark de los perfiles de OCR (fast / balanced / accurate) sobre un corpus
+de reportes de laboratorio: páginas/s, RSS pico y recall de analitos parseados.
+
+Uso:
+    python bench_ocr_profiles.py ruta/al/corpus [--profiles fast,balanced,accurate]
+
+El corpus es una carpeta con PDFs e imágenes. Si contiene `expected.json`
+({"reporte.pdf": ["HEMOGLOBINA", "GLUCOSA", ...]}) se calcula el recall de
+analitos que el parser encuentra con cada perfil.
+
+Cada perfil corre en su propio proceso para que el RSS pico sea comparable.
+Siempre se usa docTR (sin la capa de texto del PDF), que es lo que se mide.
+"""
+import argparse
+import json
+import multiprocessing as mp
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+PDF_EXTS = {".pdf"}
+IMG_EXTS = {".jpg", ".jpeg", ".png"}
+
+
+def _normalize(name: str) -> str:
+    return " ".join(name.split()).upper()
+
+
+def _load_pages(path: Path, max_pages: int) -> list:
+    from doctr.io import DocumentFile
+    from app.core.pdf_pages import pdf_page_count, render_pages
+
+    if path.suffix.lower() in PDF_EXTS:
+        n = min(pdf_page_count(str(path)), max_pages)
+        return render_pages(str(path), list(range(n)))
+    return DocumentFile.from_images([str(path)])
+
+
+def bench_profile(profile: str, paths: list) -> dict:
+    from app.core.ocr_pool import get_predictor
+    from app.routers.ocr_local import MAX_PAGES, parse_page_exports
+
+    t0 = time.perf_counter()
+    predictor = get_predictor(profile)
+    load_s = time.perf_counter() - t0
+
+    docs = [(p, _load_pages(p, MAX_PAGES)) for p in paths]
+    # Calentamiento: la primera llamada reserva memoria y compila kernels
+    predictor(docs[0][1][:1])
+
+    pages = 0
+    infer_s = 0.0
+    found = {}
+    for path, arrays in docs:
+        t = time.perf_counter()
+        export = predictor(arrays).export()
+        infer_s += time.perf_counter() - t
+        pages += len(arrays)
+        parsed = parse_page_exports(export["pages"])
+        found[path.name] = sorted({_normalize(it["name"]) for it in parsed["items"]})
+
+    return {
+        "profile": profile,
+        "load_s": load_s,
+        "pages": pages,
+        "infer_s": infer_s,
+        # ru_maxrss está en KB en Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "found": found,
+    }
+
+
+def recall(found: dict, expected: dict) -> float | None:
+    total = hits = 0
+    for fname, names in expected.items():
+        got = set(found.get(fname, []))
+        for name in names:
+            total += 1
+            hits += _normalize(name) in got
+    return hits / total if total else None
+
+
+def main():
+    from app.core.ocr_pool import OCR_PROFILES
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", type=Path)
+    parser.add_argument("--profiles", default=",".join(OCR_PROFILES))
+    args = parser.parse_args()
+
+    paths = sorted(p for p in args.corpus.iterdir() if p.suffix.lower() in PDF_EXTS | IMG_EXTS)
+    if not paths:
+        raise SystemExit(f"No hay PDFs ni imágenes en {args.corpus}")
+    expected_file = args.corpus / "expected.json"
+    expected = json.loads(expected_file.read_text(encoding="utf-8")) if expected_file.exists() else {}
+
+    results = []
+    for profile in args.profiles.split(","):
+        print(f"[bench] Perfil {profile} sobre {len(paths)} archivos...")
+        with ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context("spawn")) as ex:
+            results.append(ex.submit(bench_profile, profile, paths).result())
+
+    print()
+    print(f"{'perfil':<10} {'carga s':>8} {'páginas':>8} {'pág/s':>8} {'RSS MB':>8} {'recall':>8}")
+    for r in results:
+        rec = recall(r["found"], expected)
+        print(
+            f"{r['profile']:<10} {r['load_s']:>8.1f} {r['pages']:>8} "
+            f"{r['pages'] / r['infer_s']:>8.2f} {r['peak_rss_mb']:>8.0f} "
+            f"{(f'{rec:.1%}' if rec is not None else '-'):>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
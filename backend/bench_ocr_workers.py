@@ -0,0 +1,127 @@
+# backend/bench_ocr_workers.py
+"""
+Benchmark del pool de OCR: throughput y memoria según el número de workers y
+cómo se crean (spawn: cada worker carga su copia del modelo; fork+preload: el
+padre carga el modelo una vez y los workers lo comparten copy-on-write).
+
+Uso:
+    python bench_ocr_workers.py ruta/al/corpus [--workers 1,2,4] [--modes spawn,fork] [--rounds 3]
+
+Para cada combinación se arranca un OCRPool nuevo, se calienta, y se envían
+todas las páginas del corpus `--rounds` veces con la concurrencia del pool.
+La memoria se mide como PSS (las páginas compartidas cuentan repartidas entre
+los procesos que las comparten), que es lo que de verdad cuesta cada modo.
+Equivale a comparar `uvicorn --workers N` (N copias) con OCR_WORKERS=N.
+"""
+import argparse
+import asyncio
+import os
+import time
+from pathlib import Path
+
+PDF_EXTS = {".pdf"}
+IMG_EXTS = {".jpg", ".jpeg", ".png"}
+
+
+def _pss_mb(pid: int) -> float:
+    # smaps_rollup existe desde Linux 4.14
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as fh:
+            for line in fh:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def _page_sources(paths: list, max_pages: int) -> list:
+    from app.core.pdf_pages import pdf_page_count
+
+    sources = []
+    for path in paths:
+        if path.suffix.lower() in PDF_EXTS:
+            n = min(pdf_page_count(str(path)), max_pages)
+            sources += [("pdf", str(path), i) for i in range(n)]
+        else:
+            sources.append(("image", str(path), 0))
+    return sources
+
+
+async def bench(workers: int, mode: str, sources: list, rounds: int) -> dict:
+    from app.core.ocr_pool import OCRPool, run_ocr_pages, threads_per_worker
+
+    pool = OCRPool(workers=workers, max_queue=len(sources) * rounds, start_method=mode, preload=mode == "fork")
+    try:
+        t0 = time.perf_counter()
+        await pool.warmup()
+        if not pool.ready:
+            raise SystemExit(f"Warmup falló: {pool.warmup_error}")
+        startup_s = time.perf_counter() - t0
+
+        jobs = [src for _ in range(rounds) for src in sources]
+        t0 = time.perf_counter()
+        await asyncio.gather(*(pool.run(run_ocr_pages, [src]) for src in jobs))
+        elapsed = time.perf_counter() - t0
+
+        children = [p.pid for p in pool._executor._processes.values()]
+        pss = _pss_mb(os.getpid()) + sum(_pss_mb(pid) for pid in children)
+    finally:
+        pool.shutdown()
+
+    return {
+        "workers": workers,
+        "mode": mode,
+        "threads": threads_per_worker(workers),
+        "startup_s": startup_s,
+        "pages_per_s": len(jobs) / elapsed,
+        "pss_mb": pss,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", type=Path)
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--modes", default="spawn,fork")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    from app.routers.ocr_local import MAX_PAGES
+
+    paths = sorted(p for p in args.corpus.iterdir() if p.suffix.lower() in PDF_EXTS | IMG_EXTS)
+    if not paths:
+        raise SystemExit(f"No hay PDFs ni imágenes en {args.corpus}")
+    sources = _page_sources(paths, MAX_PAGES)
+
+    results = []
+    for mode in args.modes.split(","):
+        for workers in (int(w) for w in args.workers.split(",")):
+            print(f"[bench] {mode} x{workers} sobre {len(sources)} páginas...")
+            # Cada configuración en un proceso limpio: gc.freeze y el modelo
+            # precargado del padre no deben arrastrarse a la siguiente
+            results.append(_run_isolated(workers, mode, sources, args.rounds))
+
+    print()
+    print(f"{'modo':<6} {'workers':>7} {'hilos':>6} {'arranque s':>10} {'pág/s':>8} {'PSS MB':>8}")
+    for r in results:
+        print(
+            f"{r['mode']:<6} {r['workers']:>7} {r['threads']:>6} {r['startup_s']:>10.1f} "
+            f"{r['pages_per_s']:>8.2f} {r['pss_mb']:>8.0f}"
+        )
+
+
+def _bench_sync(workers: int, mode: str, sources: list, rounds: int) -> dict:
+    return asyncio.run(bench(workers, mode, sources, rounds))
+
+
+def _run_isolated(workers: int, mode: str, sources: list, rounds: int) -> dict:
+    import multiprocessing as mp
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context("spawn")) as ex:
+        return ex.submit(_bench_sync, workers, mode, sources, rounds).result()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# backend/bench_parser.py
+"""
+Benchmark del parser de reportes (líneas de OCR -> filas candidatas -> items),
+sin OCR: mide líneas/s de `parse_lines` sobre texto ya reconocido.
+
+Uso:
+    python bench_parser.py [ruta/al/corpus] [--repeat 20] [--synthetic 20000]
+
+El corpus es una carpeta con archivos .txt (una línea de OCR por renglón,
+p. ej. el campo `text` de /ocr-local/pdf). Sin corpus se genera un reporte
+sintético de `--synthetic` líneas mezclando filas en una línea, filas partidas
+en 3-5 líneas, cabeceras de paciente y texto suelto.
+"""
+import argparse
+import random
+import time
+from pathlib import Path
+
+SYNTHETIC_BLOCKS = [
+    ["GLUCOSA 92 70-110 mg/dL"],
+    ["VCM 88.0 80 - 100 fL"],
+    ["ALT (SGPT) 40 <= 41 U/L"],
+    ["HEMOGLOBINA", "16.5", "14-18", "g/dL"],
+    ["CREATININA", "0.9", "0.6-1.2"],
+    ["Citom. de Flujo", "PLAQUETAS", "250", "150-450", "10*3/UL"],
+    ["ERITRO", "FOTOMETRIA", "2", "0-15", "mm/1H"],
+    ["SR(A) PACIENTE DE PRUEBA", "EDAD: 34 AÑOS SEXO: F", "TEL. 809-555-0000"],
+    ["DETERMINACION", "RESULTADO", "UNIDADES", "INTERVALO DE REFERENCIA"],
+    ["HEMOGRAMA", "RECUENTO DIFERENCIAL:"],
+    ["Los valores de referencia dependen de la edad y el sexo del paciente."],
+]
+
+
+def synthetic_lines(n: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    lines: list = []
+    while len(lines) < n:
+        lines.extend(rng.choice(SYNTHETIC_BLOCKS))
+    return lines[:n]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", type=Path, nargs="?")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--synthetic", type=int, default=20000)
+    args = parser.parse_args()
+
+    from app.routers.ocr_local import parse_lines
+
+    if args.corpus:
+        docs = [p.read_text(encoding="utf-8").splitlines() for p in sorted(args.corpus.glob("*.txt"))]
+        if not docs:
+            raise SystemExit(f"No hay .txt en {args.corpus}")
+    else:
+        docs = [synthetic_lines(args.synthetic)]
+
+    total_lines = sum(len(d) for d in docs)
+    for d in docs:  # calentamiento (compilación de regex, cachés)
+        parse_lines(d)
+
+    rows = items = 0
+    t0 = time.perf_counter()
+    for _ in range(args.repeat):
+        for d in docs:
+            r, it = parse_lines(d)
+            rows += len(r)
+            items += len(it)
+    elapsed = time.perf_counter() - t0
+
+    print(f"documentos: {len(docs)}  líneas: {total_lines}  repeticiones: {args.repeat}")
+    print(f"filas candidatas: {rows // args.repeat}  items: {items // args.repeat}")
+    print(f"{total_lines * args.repeat / elapsed:,.0f} líneas/s  ({elapsed * 1000 / args.repeat:.1f} ms por pasada)")
+
+
+if __name__ == "__main__":
+    main()
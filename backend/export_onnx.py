@@ -0,0 +1,21 @@
+# backend/export_onnx.py
+"""
+Exporta a ONNX los modelos de docTR de los perfiles de OCR (y su versión
+int8 si OCR_ONNX_INT8=true) en OCR_ONNX_DIR, para servirlos con
+OCR_DOCTR_BACKEND=onnx sin necesitar torch en el proceso de la API.
+
+Uso:
+    python export_onnx.py [fast balanced accurate]
+"""
+import sys
+
+from app.core.config import settings
+from app.core.ocr_pool import OCR_PROFILES
+from app.core.onnx_engine import ensure_profile_models
+
+if __name__ == "__main__":
+    profiles = sys.argv[1:] or list(OCR_PROFILES)
+    for name in profiles:
+        archs = OCR_PROFILES[name]
+        det_path, reco_path = ensure_profile_models(archs["det_arch"], archs["reco_arch"], settings.OCR_ONNX_INT8)
+        print(f"{name}: {det_path} | {reco_path}")
@@ -0,0 +1,10 @@
+# tests/conftest.py
+import os
+import sys
+from pathlib import Path
+
+# `app.core.config` exige las credenciales de Supabase al importarse
+os.environ.setdefault("SUPABASE_URL", "http://localhost")
+os.environ.setdefault("SUPABASE_KEY", "test")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
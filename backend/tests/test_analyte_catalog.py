@@ -0,0 +1,44 @@
+# tests/test_analyte_catalog.py
+"""Resolución de nombres contra el catálogo de analitos (app.core.analyte_catalog)."""
+import pytest
+
+from app.core.analyte_catalog import analyte_catalog
+
+
+@pytest.mark.parametrize(
+    "name, code",
+    [
+        ("HEMOGLOBINA A1C", "HBA1C"),
+        ("HBA1C", "HBA1C"),
+        ("HEMOGLOBINA GLICOSILADA", "HBA1C"),
+        ("COLESTEROL NO HDL", "NOHDL"),
+        ("PROTEINAS TOTALES", "TP"),
+    ],
+)
+def test_qualified_names_resolve_to_their_own_analyte(name, code):
+    assert analyte_catalog.resolve(name).code == code
+
+
+@pytest.mark.parametrize(
+    "name",
+    [
+        "HEMOGLOBINA A1 C X",  # palabras de más frente a HEMOGLOBINA
+        "COLESTEROL NO HOL",   # no es HDL
+        "PROTEINAS",           # total o en orina: ambiguo
+    ],
+)
+def test_fuzzy_match_rejects_extra_or_missing_words(name):
+    assert analyte_catalog.resolve(name) is None
+
+
+@pytest.mark.parametrize(
+    "name, code",
+    [
+        ("HEMOGLOBIMA", "HGB"),
+        ("GLOBULOS BLANCO", "WBC"),
+        ("EOSINOF ILOS", "EOS"),
+        ("TRIGLICERIDO", "TG"),
+    ],
+)
+def test_fuzzy_match_still_fixes_ocr_typos(name, code):
+    assert analyte_catalog.resolve(name).code == code
@@ -0,0 +1,23 @@
+"""Enderezado de fotos (app.core.image_preprocess)."""
+import cv2
+import numpy as np
+import pytest
+
+from app.core.image_preprocess import _deskew
+
+
+def text_rows(gray: np.ndarray) -> int:
+    """Filas con tinta: mínimo cuando las líneas de texto están horizontales."""
+    return int((gray < 128).any(axis=1).sum())
+
+
+@pytest.mark.parametrize("skew", [5.0, -5.0])
+def test_deskew_corrects_both_directions(skew):
+    page = np.full((400, 600), 255, np.uint8)
+    for y in range(80, 330, 40):
+        cv2.rectangle(page, (60, y), (540, y + 12), 0, -1)
+    matrix = cv2.getRotationMatrix2D((300, 200), skew, 1.0)
+    skewed = cv2.warpAffine(page, matrix, (600, 400), borderValue=255)
+
+    assert text_rows(skewed) > 2 * text_rows(page)
+    assert text_rows(_deskew(skewed)) <= text_rows(page) + 4
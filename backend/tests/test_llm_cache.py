@@ -0,0 +1,37 @@
+"""Caché de respuestas de Gemini (app.core.llm_cache)."""
+import asyncio
+
+from app.core import llm_cache as llm_cache_module
+from app.core.llm_cache import LLMCache
+from app.core.ocr_cache import OCRCache
+
+
+def make_cache(tmp_path, ttl_s=60.0):
+    store = OCRCache(str(tmp_path), max_entries=10, max_bytes=1 << 20)
+    return LLMCache(store, memory_entries=4, ttl_s=ttl_s)
+
+
+def test_hit_from_memory_then_from_disk(tmp_path):
+    cache = make_cache(tmp_path)
+    asyncio.run(cache.put("k", {"lab_results": [1]}))
+
+    assert asyncio.run(cache.get("k")) == {"lab_results": [1]}
+    assert cache.memory_hits == 1
+
+    fresh = make_cache(tmp_path)
+    assert asyncio.run(fresh.get("k")) == {"lab_results": [1]}
+    assert fresh.disk_hits == 1
+
+
+def test_expired_entry_is_a_miss_and_is_deleted(tmp_path, monkeypatch):
+    cache = make_cache(tmp_path, ttl_s=60.0)
+    asyncio.run(cache.put("k", {"v": 1}))
+    assert list(tmp_path.glob("*.json"))
+
+    now = llm_cache_module.time.time()
+    monkeypatch.setattr(llm_cache_module.time, "time", lambda: now + 61)
+
+    assert asyncio.run(cache.get("k")) is None
+    assert cache.misses == 1
+    assert "k" not in cache._memory
+    assert list(tmp_path.glob("*.json")) == []
@@ -0,0 +1,58 @@
+"""Troceado de la entrada del LLM (app.core.llm_chunks)."""
+from app.core.llm_chunks import chunk_lines, split_sections
+
+
+def is_title(line: str) -> bool:
+    return line.startswith("#")
+
+
+def chunk(lines, max_input_tokens=1000, max_output_tokens=100_000, **kw):
+    return [
+        c.split("\n")
+        for c in chunk_lines(lines, is_title, max_input_tokens, max_output_tokens, result_tokens=10, **kw)
+    ]
+
+
+def test_split_sections_on_titles_only():
+    lines = ["cab", "#A", "a1", "", "#B", "b1"]
+
+    assert split_sections(lines, is_title) == [["cab"], ["#A", "a1"], ["#B", "b1"]]
+
+
+def test_sections_packed_whole_until_budget():
+    lines = ["#A", "a1 1", "a2 2", "#B", "b1 1", "b2 2"]
+
+    assert chunk(lines) == [lines]
+    # Cada sección cuesta 6 tokens de entrada: no caben dos en 10
+    assert chunk(lines, max_input_tokens=10) == [lines[:3], lines[3:]]
+
+
+def test_oversized_section_split_by_lines_with_title_and_overlap():
+    section = ["#HEMATOLOGIA"] + [f"fila {i} valor {i}" for i in range(6)]
+    chunks = chunk(section, max_input_tokens=20, overlap=1)
+
+    assert len(chunks) > 1
+    for prev, nxt in zip(chunks, chunks[1:]):
+        assert nxt[0] == "#HEMATOLOGIA"
+        assert nxt[1] == prev[-1]
+    rows = [ln for c in chunks for ln in c if not is_title(ln)]
+    assert list(dict.fromkeys(rows)) == section[1:]
+
+
+def test_output_budget_splits_numeric_lines():
+    lines = ["#A"] + [f"x {i}" for i in range(10)]
+    # Salida útil: 0.75 * 400 - 250 = 50 tokens -> 4 líneas con números (10 + 3 cada una)
+    chunks = chunk(lines, max_output_tokens=400)
+
+    assert len(chunks) == 3
+    assert all(len([ln for ln in c if not is_title(ln)]) <= 4 for c in chunks)
+
+
+def test_header_repeated_in_every_chunk():
+    header = ["LABORATORIO X", "PACIENTE: ANA"]
+    lines = ["#A", "a1 1", "a2 2", "#B", "b1 1", "b2 2"]
+    chunks = chunk(lines, max_input_tokens=20, header=header)
+
+    assert len(chunks) == 2
+    assert all(c[:2] == header for c in chunks)
+    assert [c[2] for c in chunks] == ["#A", "#B"]
@@ -0,0 +1,69 @@
+"""Reintentos del cliente de Gemini (app.core.llm_client)."""
+import asyncio
+
+import pytest
+from google.api_core import exceptions as gexc
+
+from app.core.llm_client import LLMClient, LLMError, _is_transient
+
+
+@pytest.mark.parametrize(
+    "exc, transient",
+    [
+        (gexc.TooManyRequests("cuota"), True),
+        (gexc.ResourceExhausted("cuota"), True),
+        (gexc.ServiceUnavailable("caído"), True),
+        (asyncio.TimeoutError(), True),
+        (gexc.BadRequest("prompt inválido"), False),
+        (ValueError("otro"), False),
+    ],
+)
+def test_is_transient(exc, transient):
+    assert _is_transient(exc) is transient
+
+
+class FlakyModel:
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    async def generate_content_async(self, contents, generation_config=None):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+def run_generate(model, max_retries=3):
+    client = LLMClient(max_concurrency=2, timeout_s=5, max_retries=max_retries, backoff_base_s=0, backoff_max_s=0)
+    client._models[("gemini-test", "sys")] = model
+
+    async def call():
+        return await client.generate("sys", "texto", temperature=0, max_output_tokens=10, model_name="gemini-test")
+
+    return client, asyncio.run(call())
+
+
+def test_retries_429_and_503_then_succeeds():
+    model = FlakyModel([gexc.TooManyRequests("cuota"), gexc.ServiceUnavailable("caído")])
+    client, response = run_generate(model)
+
+    assert response == "ok"
+    assert model.calls == 3
+    assert client.retries == 2
+
+
+def test_400_is_not_retried():
+    model = FlakyModel([gexc.BadRequest("prompt inválido")])
+
+    with pytest.raises(gexc.BadRequest):
+        run_generate(model)
+    assert model.calls == 1
+
+
+def test_gives_up_after_max_retries():
+    model = FlakyModel([gexc.ServiceUnavailable("caído")] * 5)
+
+    with pytest.raises(LLMError):
+        run_generate(model, max_retries=2)
+    assert model.calls == 3
@@ -0,0 +1,42 @@
+"""Batching de páginas entre peticiones (app.core.ocr_batcher)."""
+import asyncio
+
+from app.core.ocr_batcher import OCRBatcher
+
+
+class RecordingPool:
+    def __init__(self):
+        self.batches = []
+
+    async def run(self, fn, sources, profile):
+        self.batches.append(list(sources))
+        return [{"source": src} for src in sources]
+
+
+def test_cancelled_pages_are_not_sent_to_the_pool():
+    async def scenario():
+        pool = RecordingPool()
+        batcher = OCRBatcher(pool, max_batch=8, max_wait_ms=20)
+        kept, dropped = batcher.submit_each(["a", "b"], "fast")
+        dropped.cancel()
+        page = await kept
+        batcher.shutdown()
+        return pool.batches, page
+
+    batches, page = asyncio.run(scenario())
+
+    assert batches == [["a"]]
+    assert page == {"source": "a"}
+
+
+def test_only_cancelled_pages_skip_the_pool():
+    async def scenario():
+        pool = RecordingPool()
+        batcher = OCRBatcher(pool, max_batch=8, max_wait_ms=0)
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        fut.cancel()
+        await batcher._dispatch([("a", fut, loop.time(), None)], "fast")
+        return pool.batches
+
+    assert asyncio.run(scenario()) == []
@@ -0,0 +1,48 @@
+"""Caché en disco de resultados de OCR (app.core.ocr_cache)."""
+import json
+
+from app.core.ocr_cache import OCRCache
+
+
+def entry_bytes(payload: dict) -> int:
+    return len(json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = OCRCache(str(tmp_path), max_entries=2, max_bytes=1 << 20)
+    cache.put("a", {"v": 1})
+    cache.put("b", {"v": 2})
+    assert cache.get("a") == {"v": 1}  # "a" pasa a ser la más reciente
+
+    cache.put("c", {"v": 3})
+
+    assert cache.get("b") is None
+    assert cache.get("a") == {"v": 1}
+    assert cache.get("c") == {"v": 3}
+    assert sorted(p.stem for p in tmp_path.glob("*.json")) == ["a", "c"]
+
+
+def test_size_cap_evicts_until_it_fits(tmp_path):
+    payload = {"text": "x" * 100}
+    size = entry_bytes(payload)
+    cache = OCRCache(str(tmp_path), max_entries=100, max_bytes=2 * size)
+    for key in ("a", "b", "c"):
+        cache.put(key, payload)
+
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["bytes"] == 2 * size
+    assert cache.get("a") is None
+
+
+def test_entry_larger_than_cap_is_not_stored(tmp_path):
+    cache = OCRCache(str(tmp_path), max_entries=10, max_bytes=50)
+    cache.put("big", {"text": "x" * 100})
+
+    assert cache.get("big") is None
+    assert list(tmp_path.glob("*.json")) == []
+
+
+def test_index_is_rebuilt_from_disk(tmp_path):
+    OCRCache(str(tmp_path), max_entries=10, max_bytes=1 << 20).put("a", {"v": 1})
+
+    assert OCRCache(str(tmp_path), max_entries=10, max_bytes=1 << 20).get("a") == {"v": 1}
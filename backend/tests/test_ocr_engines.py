@@ -0,0 +1,39 @@
+# tests/test_ocr_engines.py
+"""Enrutado del motor "auto" (app.core.ocr_engines)."""
+import pytest
+
+from app.core.ocr_engines import AutoEngine, OCREngine
+
+
+class FakeEngine(OCREngine):
+    def __init__(self, name: str, latency_ms: float):
+        super().__init__()
+        self.name = name
+        self.latency_ms = latency_ms
+
+    async def recognize(self, source, profile):
+        return {"blocks": []}
+
+
+def test_engine_without_recognize_cannot_be_built():
+    class Incomplete(OCREngine):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_auto_keeps_sampling_slower_cheap_engine():
+    auto = AutoEngine(FakeEngine("cheap", 900.0), FakeEngine("strong", 300.0), min_confidence=0.6, explore_every=5)
+    photo = ("image", b"jpeg", 0)
+
+    picks = [auto._prefer_cheap(photo) for _ in range(20)]
+
+    assert picks.count(True) == 4
+    assert auto.routed["explored"] == 4
+
+
+def test_auto_sends_pdf_pages_to_strong_engine():
+    auto = AutoEngine(FakeEngine("cheap", 100.0), FakeEngine("strong", 300.0), min_confidence=0.6, explore_every=1)
+
+    assert auto._prefer_cheap(("pdf", b"%PDF", 0)) is False
@@ -0,0 +1,67 @@
+"""Trabajos de OCR en segundo plano (app.core.ocr_jobs)."""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.core.config import settings
+from app.core.ocr_jobs import JobStore
+from app.core.ocr_pool import OCRPoolBusy
+from app.routers import ocr_local
+
+
+def test_shutdown_drops_queued_jobs():
+    async def scenario():
+        store = JobStore(max_jobs=10, ttl_seconds=60, concurrency=1)
+        gate = asyncio.Event()
+        dropped = []
+
+        running = store.submit("u", gate.wait, on_drop=lambda: dropped.append("running"))
+        queued = store.submit("u", gate.wait, on_drop=lambda: dropped.append("queued"))
+        await asyncio.sleep(0)
+        store.shutdown()
+        return running, queued, dropped
+
+    running, queued, dropped = asyncio.run(scenario())
+
+    assert dropped == ["queued"]
+    assert running.status == "running"
+    assert (queued.status, queued.error_status) == ("error", 503)
+
+
+class BusyOnceEngine:
+    """Rechaza el primer envío como si el pool estuviera lleno."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def submit_each(self, sources, profile):
+        futures = []
+        for _ in sources:
+            self.calls += 1
+            fut = asyncio.get_running_loop().create_future()
+            if self.calls == 1:
+                fut.set_exception(OCRPoolBusy("Cola de OCR llena"))
+            else:
+                fut.set_result({"blocks": []})
+            futures.append(fut)
+        return futures
+
+
+def test_background_job_waits_when_pool_is_busy(monkeypatch):
+    engine = BusyOnceEngine()
+    monkeypatch.setattr(ocr_local, "get_engine", lambda name: engine)
+    monkeypatch.setattr(settings, "OCR_IMAGE_PREPROCESS", False)
+    monkeypatch.setattr(settings, "OCR_JOB_BUSY_RETRY_SECONDS", 0)
+
+    async def collect(wait_when_busy):
+        pages = ocr_local.iter_page_exports([b"foto"], False, "fast", "doctr", wait_when_busy=wait_when_busy)
+        return [page async for page in pages]
+
+    assert asyncio.run(collect(True)) == [(0, {"blocks": []})]
+    assert engine.calls == 2
+
+    engine.calls = 0
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(collect(False))
+    assert exc.value.status_code == 503
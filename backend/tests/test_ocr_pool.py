@@ -0,0 +1,23 @@
+"""Warmup del pool de OCR (app.core.ocr_pool)."""
+import asyncio
+
+from app.core.ocr_pool import OCRPool
+
+
+def test_warmup_retries_until_ready(monkeypatch):
+    pool = OCRPool(workers=0, max_queue=4, start_method="spawn")
+    outcomes = [RuntimeError("modelo no disponible"), 1234]
+
+    async def fake_run(fn, *args):
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(pool, "run", fake_run)
+    monkeypatch.setattr(pool, "_create_executor", lambda: None)
+    asyncio.run(pool.warmup(retry_base_s=0, retry_max_s=0))
+
+    assert pool.ready
+    assert pool.warmup_attempts == 2
+    assert pool.warmup_error is None
@@ -0,0 +1,54 @@
+# tests/test_parse_coverage.py
+"""Cobertura del parser local (decide si /parse-llm llama al LLM y con qué filas)."""
+from app.core.config import settings
+from app.routers.ocr_local import LabResult, build_analysis_input, parse_coverage, parse_lines
+
+URINALYSIS_REPORT = """LABORATORIO CLINICO SAN JUAN
+PACIENTE: MARIA PEREZ
+EDAD: 45 AÑOS
+QUIMICA SANGUINEA
+GLUCOSA 92 70 - 110 mg/dL
+CREATININA 0.9 0.6 - 1.2 mg/dL
+UROANALISIS
+COLOR AMARILLO
+PH 6.0 5.0 - 8.0
+NITRITOS NEGATIVO
+PROTEINAS TRAZAS
+BACTERIAS ESCASAS
+DENSIDAD 1.020 1.005 - 1.030"""
+
+TEXT_RESULTS = ["COLOR AMARILLO", "NITRITOS NEGATIVO", "PROTEINAS TRAZAS", "BACTERIAS ESCASAS"]
+
+
+def local_draft(text: str):
+    _, items = parse_lines(text.split("\n"))
+    return build_analysis_input(items, text).lab_results
+
+
+def test_text_results_are_residual():
+    lab_results = local_draft(URINALYSIS_REPORT)
+    coverage = parse_coverage(URINALYSIS_REPORT, lab_results)
+
+    assert coverage.results == 4
+    assert coverage.residual_lines == TEXT_RESULTS
+    assert set(coverage.residual_sections) == {"UROANALISIS"}
+    # Cuentan en el denominador: el paso de extracción no se omite
+    assert coverage.score < settings.LLM_SKIP_EXTRACTION_MIN_COVERAGE
+
+
+def test_text_results_in_draft_are_covered():
+    lab_results = local_draft(URINALYSIS_REPORT) + [
+        LabResult(name="COLOR", value_as_string="AMARILLO", line="COLOR AMARILLO"),
+        LabResult(name="NITRITOS", value_as_string="NEGATIVO", line="NITRITOS: NEGATIVO"),
+        LabResult(name="PROTEINAS", value_as_string="TRAZAS", line="PROTEINAS TRAZAS"),
+        LabResult(name="BACTERIAS", value_as_string="ESCASAS", line="BACTERIAS ESCASAS"),
+    ]
+    coverage = parse_coverage(URINALYSIS_REPORT, lab_results)
+
+    assert coverage.residual_lines == []
+
+
+def test_lines_before_first_section_are_not_text_results():
+    coverage = parse_coverage(URINALYSIS_REPORT, local_draft(URINALYSIS_REPORT))
+
+    assert "LABORATORIO CLINICO SAN JUAN" not in coverage.residual_lines
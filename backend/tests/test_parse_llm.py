@@ -0,0 +1,71 @@
+# tests/test_parse_llm.py
+"""Entrada del paso de extracción de /parse-llm ("rows", "text" y solo cabecera)."""
+import pytest
+
+pytest.importorskip("google.generativeai")
+
+from app.routers.ocr_local import (  # noqa: E402
+    LLMParseRequest,
+    PatientProfile,
+    build_analysis_input,
+    parse_coverage,
+    parse_lines,
+)
+from app.routers.parse_llm import (  # noqa: E402
+    compact_rows_text,
+    header_rows,
+    missing_header_data,
+    residual_text,
+    split_into_chunks,
+)
+
+from tests.test_parse_coverage import TEXT_RESULTS, URINALYSIS_REPORT  # noqa: E402
+
+
+def test_rows_input_includes_text_results():
+    _, items = parse_lines(URINALYSIS_REPORT.split("\n"))
+    coverage = parse_coverage(URINALYSIS_REPORT, build_analysis_input(items, URINALYSIS_REPORT).lab_results)
+    rows = compact_rows_text(coverage).split("\n")
+
+    assert "S|UROANALISIS" in rows
+    body = [r.split("|", 1)[1] for r in rows if r[0].isdigit()]
+    assert body == TEXT_RESULTS
+
+
+def test_text_input_keeps_header_and_section_titles():
+    from app.routers.ocr_local import is_section_title
+
+    _, items = parse_lines(URINALYSIS_REPORT.split("\n"))
+    coverage = parse_coverage(URINALYSIS_REPORT, build_analysis_input(items, URINALYSIS_REPORT).lab_results)
+    chunks = split_into_chunks(residual_text(coverage), is_section_title, overlap=0, header=coverage.header_lines)
+    lines = chunks[0].split("\n")
+
+    assert len(chunks) == 1
+    assert lines[0] == "LABORATORIO CLINICO SAN JUAN"
+    assert "PACIENTE: MARIA PEREZ" in lines
+    assert lines[lines.index("UROANALISIS") + 1:] == TEXT_RESULTS
+
+
+def test_rows_header_goes_in_every_chunk(monkeypatch):
+    from app.core.config import settings
+
+    _, items = parse_lines(URINALYSIS_REPORT.split("\n"))
+    coverage = parse_coverage(URINALYSIS_REPORT, build_analysis_input(items, URINALYSIS_REPORT).lab_results)
+    header = header_rows(coverage)
+    monkeypatch.setattr(settings, "LLM_CHUNK_MAX_INPUT_TOKENS", 40)
+    chunks = split_into_chunks(compact_rows_text(coverage), lambda ln: ln.startswith("S|"), overlap=0, header=header)
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        lines = chunk.split("\n")
+        assert lines[:len(header)] == header
+        assert lines[len(header)] == "S|UROANALISIS"
+
+
+def test_skipped_extraction_still_needs_header_when_draft_has_no_metadata():
+    draft = build_analysis_input([], URINALYSIS_REPORT)
+    assert missing_header_data(draft, LLMParseRequest(ocr_text=URINALYSIS_REPORT))
+
+    draft.lab_metadata.lab_name = "LABORATORIO CLINICO SAN JUAN"
+    payload = LLMParseRequest(ocr_text=URINALYSIS_REPORT, patient_profile=PatientProfile(age=45, sex="F"))
+    assert not missing_header_data(draft, payload)
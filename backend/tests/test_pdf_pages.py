@@ -0,0 +1,34 @@
+# tests/test_pdf_pages.py
+"""Selección de páginas en modo "tables" (app.core.pdf_pages.select_pages)."""
+import pytest
+
+pdfium = pytest.importorskip("pypdfium2")
+pytest.importorskip("cv2")
+
+from app.core import pdf_pages  # noqa: E402
+
+
+def blank_pdf(tmp_path, n_pages: int) -> str:
+    # El ancho codifica el índice: los puntuadores falsos saben qué página ven
+    pdf = pdfium.PdfDocument.new()
+    for idx in range(n_pages):
+        pdf.new_page(100 + idx, 800)
+    path = str(tmp_path / "doc.pdf")
+    pdf.save(path)
+    pdf.close()
+    return path
+
+
+def test_tables_mode_ranks_text_and_scanned_pages_separately(tmp_path, monkeypatch):
+    # 0: portada escaneada con marco, 1-3: resultados digitales, 4: tabla escaneada
+    text = {1: 12, 2: 9, 3: 0}
+    raster = {0: 4000, 4: 9000}
+    index = lambda page: int(page.get_size()[0]) - 100  # noqa: E731
+    monkeypatch.setattr(pdf_pages, "_text_table_score", lambda page: text.get(index(page)))
+    monkeypatch.setattr(pdf_pages, "_raster_table_score", lambda page: raster[index(page)])
+
+    pages, total = pdf_pages.select_pages(blank_pdf(tmp_path, 5), max_pages=3, strategy="tables")
+
+    assert total == 5
+    # Mejor de cada grupo y luego la segunda digital; la portada queda fuera
+    assert pages == [1, 2, 4]
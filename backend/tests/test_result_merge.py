@@ -0,0 +1,34 @@
+"""Fusión de resultados entre borrador y trozos del LLM (app.core.result_merge)."""
+from app.core.result_merge import merge_lab_results
+
+
+def test_same_analyte_different_value_stays_separate():
+    results = [
+        {"name": "Glucosa", "value": 95, "unit": "mg/dL", "line": "GLUCOSA 95 mg/dL"},
+        {"name": "GLUCOSA", "value": 110, "unit": "mg/dL", "line": "GLUCOSA 110 mg/dL"},
+    ]
+
+    assert [r["value"] for r in merge_lab_results(results)] == [95, 110]
+
+
+def test_same_analyte_different_unit_stays_separate():
+    results = [
+        {"name": "Neutrófilos", "value": 60, "unit": "%"},
+        {"name": "Neutrófilos", "value": 60, "unit": "x10^3/uL"},
+    ]
+
+    assert len(merge_lab_results(results)) == 2
+
+
+def test_compatible_records_merge_into_most_complete():
+    results = [
+        {"name": "Glucosa", "value": "95", "unit": None, "line": "GLUCOSA 95"},
+        {"name": "GLUCOSA", "value": 95.0, "unit": "mg/dL", "ref_low": 70, "ref_high": 100},
+        {"name": "Glucosa", "value": "95", "unit": None, "line": "GLUCOSA 95"},
+    ]
+    merged = merge_lab_results(results)
+
+    assert len(merged) == 1
+    assert merged[0]["unit"] == "mg/dL"
+    assert (merged[0]["ref_low"], merged[0]["ref_high"]) == (70, 100)
+    assert merged[0]["line"] == "GLUCOSA 95"
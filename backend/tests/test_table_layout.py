@@ -0,0 +1,75 @@
+# tests/test_table_layout.py
+"""
+Reconstrucción de tablas (app.core.table_layout) y su uso en `parse_pages`.
+
+Fixtures:
+- doctr_*.json: `Document.export()` de docTR con la disposición típica de
+  un escaneo (cada columna de la tabla en su propio bloque, la marca "H"
+  como palabra aparte junto al valor).
+- text_layer_*.json: export de la capa de texto de un PDF digital
+  (`pdf_pages._page_text_export`), con "18.2 H" en una sola palabra.
+Ambos traen una tabla de hemograma, una línea de química fuera de la tabla
+y una sección de uroanálisis con resultados de texto.
+"""
+import json
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from app.core import table_layout  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.routers import ocr_local  # noqa: E402
+
+FIXTURES = Path(__file__).parent / "fixtures"
+PAGES = ["doctr_hemograma_urianalisis.json", "text_layer_hemograma_urianalisis.json"]
+
+
+def load_page(name: str) -> dict:
+    return json.loads((FIXTURES / name).read_text(encoding="utf-8"))
+
+
+@pytest.fixture
+def table_layout_on(monkeypatch):
+    monkeypatch.setattr(settings, "OCR_TABLE_LAYOUT", True)
+
+
+@pytest.mark.parametrize("text", ["18.2 H", "3.1 L", "3.1*", "9.8 (L)", "< 0.5"])
+def test_flagged_values_are_value_cells(text):
+    assert table_layout._cell_kind(text) == table_layout.KIND_VALUE
+
+
+@pytest.mark.parametrize("name", PAGES)
+def test_table_rows_keep_flagged_rows(name):
+    rows, covered = table_layout.table_rows(load_page(name))
+
+    assert len(rows) == 4
+    assert rows[0] == "HEMOGLOBINA 18.2 13.5 - 17.5 g/dL"
+    assert covered
+
+
+@pytest.mark.parametrize("name", PAGES)
+def test_parse_pages_with_layout_keeps_abnormal_results(name, table_layout_on):
+    _, _, items = ocr_local.parse_pages([load_page(name)])
+    by_name = {it.name_raw: it for it in items}
+
+    hb = by_name["HEMOGLOBINA"]
+    assert hb.value == 18.2
+    assert hb.flag == "H"
+    assert {"HEMATOCRITO", "LEUCOCITOS", "PLAQUETAS"} <= set(by_name)
+
+
+def test_parse_pages_with_layout_reads_lines_outside_table(table_layout_on):
+    page = load_page("doctr_hemograma_urianalisis.json")
+    lines, row_texts, items = ocr_local.parse_pages([page])
+
+    # La línea de química no está en la tabla: pasa por el parser secuencial
+    assert "GLUCOSA 92 70 - 110 mg/dL" in row_texts
+    assert any(it.name_raw == "GLUCOSA" and it.value == 92 for it in items)
+    # El texto completo no pierde nada (el LLM sigue viendo los resultados de texto)
+    assert "COLOR" in lines and "AMARILLO" in lines
+
+
+def test_table_layout_is_off_by_default():
+    assert type(settings).model_fields["OCR_TABLE_LAYOUT"].default is False
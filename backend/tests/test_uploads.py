@@ -0,0 +1,56 @@
+"""Límite de tamaño de las subidas (app.core.uploads)."""
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+from app.core.uploads import UploadSizeLimitMiddleware, spool_upload_files
+
+app = FastAPI()
+app.add_middleware(UploadSizeLimitMiddleware, max_body_bytes=2000)
+reached = []
+
+
+@app.post("/upload")
+async def upload(file: UploadFile = File(...)):
+    reached.append(file.filename)
+    uploads = await spool_upload_files([file], spool_threshold=100)
+    return {"size": uploads[0].size, "on_disk": uploads[0].on_disk}
+
+
+client = TestClient(app)
+BOUNDARY = "limite"
+
+
+def multipart(payload: bytes) -> bytes:
+    return (
+        f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"a.pdf\"\r\n\r\n".encode()
+        + payload
+        + f"\r\n--{BOUNDARY}--\r\n".encode()
+    )
+
+
+def test_small_upload_is_spooled():
+    resp = client.post("/upload", files={"file": ("a.pdf", b"x" * 500)})
+
+    assert resp.status_code == 200
+    assert resp.json() == {"size": 500, "on_disk": True}
+
+
+def test_rejected_by_content_length_before_parsing():
+    reached.clear()
+    resp = client.post("/upload", files={"file": ("a.pdf", b"x" * 5000)})
+
+    assert resp.status_code == 413
+    assert reached == []
+
+
+def test_rejected_while_streaming_without_content_length():
+    reached.clear()
+    body = multipart(b"x" * 5000)
+    resp = client.post(
+        "/upload",
+        content=(body[i:i + 500] for i in range(0, len(body), 500)),
+        headers={"content-type": f"multipart/form-data; boundary={BOUNDARY}"},
+    )
+
+    assert resp.status_code == 413
+    assert reached == []